@@ -1,22 +1,25 @@
 # routes/admin.py (Complete version with wallet confirmation)
 
 from flask import Blueprint, render_template, request, jsonify, session
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 from werkzeug.security import check_password_hash
 from datetime import datetime
 from app.utils.decorators import admin_required
+from app.utils.analytics_store import analytics_store
+from app.utils.cache import admin_cache, invalidate_admin_stats, ADMIN_DASHBOARD
+from app.utils import wallet_ledger, wifi_entitlement
+import base64
+import json
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Shared Supabase client (one connection pool per process)
+supabase = get_supabase()
 
 # ===========================================
 # ADMIN LOGIN & SESSION
@@ -100,64 +103,70 @@ def admin_dashboard_page():
     return render_template('admin/admin_dashboard.html')
 
 
+def load_dashboard_data():
+    """Build the admin dashboard payload (cached by admin_dashboard_api)"""
+    # Revenue comes from the running counters (O(1), reconciled periodically)
+    counters = analytics_store.snapshot()
+
+    # Only the rows the dashboard lists: all groups, pending payments
+    groups_result = supabase.table('group').select('*').execute()
+    payments_result = supabase.table('payment')\
+        .select('id, member_name, amount, group_name, mpesa_code, created_at')\
+        .or_('verified.is.null,verified.eq.false')\
+        .or_('rejected.is.null,rejected.eq.false')\
+        .execute()
+
+    groups = groups_result.data or []
+    pending_payments = payments_result.data or []
+
+    # Format groups with member details
+    formatted_groups = []
+    for group in groups:
+        members = group.get('members', [])
+        member_count = len(members)
+        
+        formatted_group = {
+            'id': group.get('id'),
+            'name': group.get('name'),
+            'group_code': group.get('group_code'),
+            'status': group.get('status', 'pending'),
+            'member_count': member_count,
+            'target_amount': group.get('target_amount', 0),
+            'current_balance': group.get('current_balance', 0),
+            'members': members,
+            'created_at': group.get('created_at')
+        }
+        formatted_groups.append(formatted_group)
+
+    # Format payments with details
+    formatted_payments = []
+    for payment in pending_payments:
+        formatted_payment = {
+            'id': payment.get('id'),
+            'member_name': payment.get('member_name', 'Unknown'),
+            'amount': payment.get('amount', 0),
+            'group_name': payment.get('group_name', 'Unknown'),
+            'mpesa_code': payment.get('mpesa_code', 'N/A'),
+            'created_at': payment.get('created_at')
+        }
+        formatted_payments.append(formatted_payment)
+
+    return {
+        "total_groups": len(groups),
+        "pending_payments": len(pending_payments),
+        "total_revenue": counters['total_revenue'],
+        "groups": formatted_groups,
+        "payments": formatted_payments
+    }
+
+
 @admin_bp.route('/api/dashboard', methods=['GET'])
 @admin_required
 def admin_dashboard_api():
     """Fetch summary data for admin dashboard"""
     try:
-        # Fetch all data
-        groups_result = supabase.table('group').select('*').execute()
-        users_result = supabase.table('user').select('*').execute()
-        payments_result = supabase.table('payment').select('*').execute()
-
-        groups = groups_result.data or []
-        users = users_result.data or []
-        payments = payments_result.data or []
-
-        # Calculate statistics
-        pending_payments = [p for p in payments if not p.get('verified') and not p.get('rejected')]
-        verified_payments = [p for p in payments if p.get('verified')]
-        total_revenue = sum(float(p.get('amount', 0)) for p in verified_payments)
-
-        # Format groups with member details
-        formatted_groups = []
-        for group in groups:
-            members = group.get('members', [])
-            member_count = len(members)
-            
-            formatted_group = {
-                'id': group.get('id'),
-                'name': group.get('name'),
-                'group_code': group.get('group_code'),
-                'status': group.get('status', 'pending'),
-                'member_count': member_count,
-                'target_amount': group.get('target_amount', 0),
-                'current_balance': group.get('current_balance', 0),
-                'members': members,
-                'created_at': group.get('created_at')
-            }
-            formatted_groups.append(formatted_group)
-
-        # Format payments with details
-        formatted_payments = []
-        for payment in pending_payments:
-            formatted_payment = {
-                'id': payment.get('id'),
-                'member_name': payment.get('member_name', 'Unknown'),
-                'amount': payment.get('amount', 0),
-                'group_name': payment.get('group_name', 'Unknown'),
-                'mpesa_code': payment.get('mpesa_code', 'N/A'),
-                'created_at': payment.get('created_at')
-            }
-            formatted_payments.append(formatted_payment)
-
-        return jsonify({
-            "total_groups": len(groups),
-            "pending_payments": len(pending_payments),
-            "total_revenue": total_revenue,
-            "groups": formatted_groups,
-            "payments": formatted_payments
-        }), 200
+        # Cached for ADMIN_CACHE_TTL; stale data is served while it refreshes
+        return jsonify(admin_cache.get_or_load(ADMIN_DASHBOARD, load_dashboard_data)), 200
 
     except Exception as e:
         print(f"❌ Dashboard load error: {e}")
@@ -195,20 +204,15 @@ def confirm_wallet_payment():
             return jsonify({"message": "User ID required"}), 400
         
         # Get user
-        user_result = supabase.table('user').select('*').eq('id', user_id).execute()
+        user_result = supabase.table('user').select('username').eq('id', user_id).execute()
         if not user_result.data:
             return jsonify({"message": "User not found"}), 404
         
         user = user_result.data[0]
         
-        # Update wallet balance (assuming 100 KSH payment)
-        current_balance = float(user.get('wallet_balance', 0))
-        new_balance = current_balance + 100.0
-        
-        supabase.table('user').update({
-            'wallet_balance': new_balance,
-            'wallet_status': 'paid'
-        }).eq('id', user_id).execute()
+        # Credit wallet atomically (assuming 100 KSH payment)
+        new_balance = wallet_ledger.credit(user_id, 100.0, 'manual_topup', wallet_status='paid')['balance']
+        invalidate_admin_stats()
         
         return jsonify({"message": f"✅ Payment confirmed for {user['username']}. Balance: {new_balance} KSH"}), 200
         
@@ -232,6 +236,8 @@ def reject_wallet_payment():
         supabase.table('user').update({
             'wallet_status': 'rejected'
         }).eq('id', user_id).execute()
+        wallet_ledger.forget(user_id)
+        invalidate_admin_stats()
         
         return jsonify({"message": "❌ Payment rejected"}), 200
         
@@ -266,8 +272,13 @@ def expire_groups():
                     supabase.table('group').update({
                         'status': 'expired'
                     }).eq('id', group['id']).execute()
+                    wifi_entitlement.revoke_group(group['id'])
                     expired_count += 1
         
+        analytics_store.record_group_status_change('active', 'expired', expired_count)
+        if expired_count:
+            invalidate_admin_stats()
+        
         return jsonify({
             "message": f"Expired {expired_count} group(s)",
             "expired_count": expired_count
@@ -300,6 +311,7 @@ def verify_payment():
             return jsonify({"message": "Payment not found"}), 404
 
         payment = payment_result.data[0]
+        was_pending = not payment.get('verified') and not payment.get('rejected')
 
         if approve:
             # Approve payment
@@ -308,15 +320,16 @@ def verify_payment():
                 'rejected': False
             }).eq('id', payment_id).execute()
 
-            # Update wallet balance
+            # Update wallet balance (once per payment, even if approved twice)
             if payment.get('user_id') and payment.get('amount'):
-                user_result = supabase.table('user').select('wallet_balance').eq('id', payment['user_id']).execute()
-                if user_result.data:
-                    current_balance = float(user_result.data[0].get('wallet_balance', 0))
-                    new_balance = current_balance + float(payment['amount'])
-                    supabase.table('user').update({
-                        'wallet_balance': new_balance
-                    }).eq('id', payment['user_id']).execute()
+                try:
+                    wallet_ledger.credit(payment['user_id'], payment['amount'], 'group_payment', reference=payment_id)
+                except LookupError:
+                    pass
+
+            if not payment.get('verified'):
+                analytics_store.record_payment_verified(payment.get('amount'), payment.get('created_at'), was_pending)
+            invalidate_admin_stats()
 
             return jsonify({"message": "✅ Payment approved and wallet updated"}), 200
         else:
@@ -325,6 +338,8 @@ def verify_payment():
                 'verified': False,
                 'rejected': True
             }).eq('id', payment_id).execute()
+            analytics_store.record_payment_rejected(was_pending)
+            invalidate_admin_stats()
             return jsonify({"message": "❌ Payment rejected"}), 200
 
     except Exception as e:
@@ -332,17 +347,172 @@ def verify_payment():
         return jsonify({"message": f"Failed: {str(e)}"}), 500
 
 
+# ===========================================
+# ANALYTICS REPORTS
+# ===========================================
+
+@admin_bp.route('/api/reports/<report>', methods=['GET'])
+@admin_required
+def analytics_report(report):
+    """Ad-hoc revenue / cohort / churn reports from the NumPy analytics engine"""
+    from app.utils.analytics_engine import get_engine, engine_status, PERIODS
+
+    period = request.args.get('period', 'day' if report in ('revenue', 'topups', 'groups') else 'month')
+    if period not in PERIODS:
+        return jsonify({"message": f"period must be one of {', '.join(PERIODS)}"}), 400
+
+    since = request.args.get('since')
+    try:
+        engine = get_engine(refresh=request.args.get('refresh') == '1')
+
+        if report == 'revenue':
+            data = engine.revenue(period, since)
+        elif report == 'topups':
+            data = engine.wallet_topups(period, since)
+        elif report == 'groups':
+            data = engine.group_formation(period)
+        elif report == 'cohorts':
+            data = engine.cohort_retention(period, int(request.args.get('periods', 12)))
+        elif report == 'churn':
+            data = engine.churn(period)
+        else:
+            return jsonify({"message": "Unknown report"}), 404
+
+        return jsonify({"report": report, "period": period, "data": data, **engine_status()}), 200
+
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Analytics report error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # ===========================================
 # USER MANAGEMENT
 # ===========================================
 
+# Page size for /api/users; the next page is requested with ?cursor=<next_cursor>
+ADMIN_USERS_PAGE_SIZE = 50
+ADMIN_USERS_MAX_PAGE_SIZE = 200
+# Columns the admin UI renders (never the password hash)
+ADMIN_USER_COLUMNS = 'id, username, role, wallet_status, wallet_balance, member_id, created_at'
+ADMIN_USER_SORTS = ('created_at', 'id')
+
+
+def encode_user_cursor(row, sort):
+    """Opaque keyset cursor pointing just past a row"""
+    key = [row['created_at'], row['id']] if sort == 'created_at' else [row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_user_cursor(cursor, sort):
+    """
+    Inverse of encode_user_cursor, validated so it is safe to put in a filter
+
+    Returns:
+        list: [created_at ISO string, id] or [id]
+
+    Raises:
+        ValueError: Malformed cursor (not base64/JSON, wrong shape, bad timestamp or id)
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != (2 if sort == 'created_at' else 1):
+        raise ValueError("Invalid cursor")
+
+    last_id = key[-1]
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    if sort != 'created_at':
+        return [last_id]
+
+    try:
+        # Re-serialised, so only a canonical timestamp ever reaches the or_() filter
+        created_at = datetime.fromisoformat(key[0]).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return [created_at, last_id]
+
+
 @admin_bp.route('/api/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    """Get all users"""
+    """
+    List users, keyset-paginated and filtered in the database
+
+    Query params:
+        limit: page size (default 50, max 200)
+        sort: 'created_at' (newest first, default) or 'id' (ascending)
+        cursor: next_cursor from the previous page
+        role, wallet_status: exact-match filters
+        has_member: 'true' / 'false' - user is (not) in a group
+        q: username prefix
+        count: 'exact', 'planned' or 'estimated' to include a total (off by default)
+    """
+    args = request.args
+    sort = args.get('sort', 'created_at')
+    if sort not in ADMIN_USER_SORTS:
+        return jsonify({"message": f"sort must be one of {', '.join(ADMIN_USER_SORTS)}"}), 400
+
+    count = args.get('count') or None
+    if count not in (None, 'exact', 'planned', 'estimated'):
+        return jsonify({"message": "count must be exact, planned or estimated"}), 400
+
+    try:
+        limit = int(args.get('limit', ADMIN_USERS_PAGE_SIZE))
+    except (ValueError, TypeError):
+        return jsonify({"message": "Invalid limit"}), 400
+    limit = max(1, min(limit, ADMIN_USERS_MAX_PAGE_SIZE))
+
     try:
-        result = supabase.table('user').select('*').execute()
-        return jsonify({"users": result.data or []}), 200
+        cursor = decode_user_cursor(args['cursor'], sort) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        query = supabase.table('user').select(ADMIN_USER_COLUMNS, count=count)
+
+        if args.get('role'):
+            query = query.eq('role', args['role'])
+        if args.get('wallet_status'):
+            query = query.eq('wallet_status', args['wallet_status'])
+        if args.get('has_member') == 'true':
+            query = query.not_.is_('member_id', 'null')
+        elif args.get('has_member') == 'false':
+            query = query.is_('member_id', 'null')
+
+        prefix = re.sub(r'[^a-z0-9_]', '', args.get('q', '').lower())
+        if prefix:
+            # Usernames are stored lowercase; escape '_' so it is not a LIKE wildcard
+            query = query.like('username', prefix.replace('_', '\\_') + '*')
+
+        # Keyset: continue strictly after the cursor row, no OFFSET scans
+        if sort == 'created_at':
+            if cursor:
+                created_at, last_id = cursor
+                query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})')
+            query = query.order('created_at', desc=True).order('id', desc=True)
+        else:
+            if cursor:
+                query = query.gt('id', int(cursor[0]))
+            query = query.order('id')
+
+        # One extra row tells us whether another page exists
+        result = query.limit(limit + 1).execute()
+        users = result.data or []
+        has_more = len(users) > limit
+        users = users[:limit]
+
+        response = {
+            "users": users,
+            "next_cursor": encode_user_cursor(users[-1], sort) if has_more else None
+        }
+        if count:
+            response["total"] = result.count
+
+        return jsonify(response), 200
     except Exception as e:
         print(f"❌ Get users error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -376,7 +546,10 @@ def promote_user():
 def delete_user(user_id):
     """Delete user"""
     try:
-        supabase.table('user').delete().eq('id', user_id).execute()
+        result = supabase.table('user').delete().eq('id', user_id).execute()
+        analytics_store.record_user_deleted(len(result.data or []))
+        wallet_ledger.forget(user_id)
+        wifi_entitlement.revoke_user(user_id)
         return jsonify({"message": "✅ User deleted successfully"}), 200
     except Exception as e:
         print(f"❌ Delete user error: {e}")
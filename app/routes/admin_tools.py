@@ -1,8 +1,12 @@
 # routes/admin_tools.py - MIGRATED TO SUPABASE
 
 from flask import Blueprint, render_template, jsonify, request, session
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 from app.utils.decorators import admin_required
+from app.utils.analytics_store import analytics_store
+from app.utils.query_metrics import get_stats, reset_stats, N_PLUS_ONE_THRESHOLD
+from app.utils.cache import admin_cache, SYSTEM_STATS, LIST_TABLES
+from app.utils.table_stats import table_stats, count_many
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 import random
@@ -13,10 +17,7 @@ load_dotenv()
 
 admin_tools_bp = Blueprint('admin_tools', __name__, url_prefix='/admin/tools')
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 # ============================================
 # RENDER PAGES
@@ -69,35 +70,26 @@ def test_connection():
         }), 500
 
 
+def load_table_info(exact=False):
+    """Row counts per table (cached by list_tables)"""
+    stats = table_stats(exact=exact)
+    
+    return {
+        "status": "success",
+        "table_count": len(stats['tables']),
+        "tables": stats['tables'],
+        "total_ms": stats['total_ms']
+    }
+
+
 @admin_tools_bp.route('/api/list-tables')
 @admin_required
 def list_tables():
-    """List all tables with row counts"""
+    """List all tables with row counts (?exact=true forces count(*) everywhere)"""
     try:
-        tables = ['user', 'group', 'member', 'payment', 'wifi_credential']
-        table_info = []
-        
-        for table in tables:
-            try:
-                result = supabase.table(table).select('*', count='exact').execute()
-                row_count = result.count if hasattr(result, 'count') else len(result.data)
-                
-                table_info.append({
-                    "name": table,
-                    "rows": row_count
-                })
-            except Exception as e:
-                table_info.append({
-                    "name": table,
-                    "rows": "Error",
-                    "error": str(e)
-                })
-        
-        return jsonify({
-            "status": "success",
-            "table_count": len(tables),
-            "tables": table_info
-        })
+        if request.args.get('exact', '').lower() == 'true':
+            return jsonify(load_table_info(exact=True))
+        return jsonify(admin_cache.get_or_load(LIST_TABLES, load_table_info))
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -126,6 +118,7 @@ def create_test_user():
         
         if result.data:
             user = result.data[0]
+            analytics_store.record_signup()
             return jsonify({
                 "status": "success",
                 "user": {
@@ -145,46 +138,59 @@ def create_test_user():
         }), 500
 
 
+def load_system_stats():
+    """Build the system statistics payload (cached by system_stats)"""
+    # Count-only requests, run concurrently; no rows are transferred
+    counts = count_many({
+        "users": 'user',
+        "groups": 'group',
+        "members": 'member',
+        "payments": 'payment',
+        "pending_payments": ('payment', lambda q: q.or_('verified.is.null,verified.eq.false')),
+        "verified_payments": ('payment', lambda q: q.eq('verified', True)),
+        "active_groups": ('group', lambda q: q.eq('status', 'active')),
+        "pending_groups": ('group', lambda q: q.eq('status', 'pending')),
+        "expired_groups": ('group', lambda q: q.eq('status', 'expired'))
+    })
+    rows = {key: result['rows'] for key, result in counts.items()}
+    
+    # Verified revenue comes from the running counters; pending needs one narrow column
+    pending_amounts = supabase.table('payment')\
+        .select('amount')\
+        .or_('verified.is.null,verified.eq.false')\
+        .execute()
+    
+    stats = {
+        "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "database": {
+            "users": rows['users'],
+            "groups": rows['groups'],
+            "members": rows['members'],
+            "payments": rows['payments'],
+            "pending_payments": rows['pending_payments'],
+            "verified_payments": rows['verified_payments']
+        },
+        "groups": {
+            "active": rows['active_groups'],
+            "pending": rows['pending_groups'],
+            "expired": rows['expired_groups']
+        },
+        "revenue": {
+            "total": analytics_store.snapshot()['total_revenue'],
+            "pending": sum(float(p.get('amount') or 0) for p in pending_amounts.data)
+        },
+        "query_latency_ms": {key: result['latency_ms'] for key, result in counts.items()}
+    }
+    
+    return stats
+
+
 @admin_tools_bp.route('/api/system-stats')
 @admin_required
 def system_stats():
     """Get comprehensive system statistics"""
     try:
-        # Get counts from Supabase
-        users = supabase.table('user').select('*', count='exact').execute()
-        groups = supabase.table('group').select('*', count='exact').execute()
-        members = supabase.table('member').select('*', count='exact').execute()
-        payments = supabase.table('payment').select('*').execute()
-        
-        pending_payments = [p for p in payments.data if not p.get('verified')]
-        verified_payments = [p for p in payments.data if p.get('verified')]
-        
-        active_groups = [g for g in groups.data if g.get('status') == 'active']
-        pending_groups = [g for g in groups.data if g.get('status') == 'pending']
-        expired_groups = [g for g in groups.data if g.get('status') == 'expired']
-        
-        stats = {
-            "timestamp": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-            "database": {
-                "users": len(users.data),
-                "groups": len(groups.data),
-                "members": len(members.data),
-                "payments": len(payments.data),
-                "pending_payments": len(pending_payments),
-                "verified_payments": len(verified_payments)
-            },
-            "groups": {
-                "active": len(active_groups),
-                "pending": len(pending_groups),
-                "expired": len(expired_groups)
-            },
-            "revenue": {
-                "total": sum(float(p.get('amount', 0)) for p in verified_payments),
-                "pending": sum(float(p.get('amount', 0)) for p in pending_payments)
-            }
-        }
-        
-        return jsonify(stats)
+        return jsonify(admin_cache.get_or_load(SYSTEM_STATS, load_system_stats))
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -234,6 +240,23 @@ def recent_activity():
         }), 500
 
 
+@admin_tools_bp.route('/api/query-stats', methods=['GET', 'DELETE'])
+@admin_required
+def query_stats():
+    """Supabase round-trips per endpoint / Socket.IO event (DELETE resets)"""
+    if request.method == 'DELETE':
+        reset_stats()
+        return jsonify({"status": "success", "message": "Query stats reset"})
+
+    endpoints = get_stats()
+    return jsonify({
+        "status": "success",
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "endpoint_count": len(endpoints),
+        "endpoints": endpoints
+    })
+
+
 @admin_tools_bp.route('/api/execute-sql', methods=['POST'])
 @admin_required
 def execute_sql():
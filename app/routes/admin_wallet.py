@@ -1,16 +1,17 @@
 # routes/admin_wallet.py
 from flask import Blueprint, render_template, jsonify, request, session
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
+from app.utils.cache import invalidate_admin_stats
+from app.utils.decorators import admin_required
+from app.utils import wallet_ledger, payment_review, statement_reconciler
 from datetime import datetime
+import csv
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 admin_wallet_bp = Blueprint('admin_wallet_bp', __name__)
 
@@ -169,35 +170,27 @@ def confirm_payment():
         if mpesa_code != transaction.get('mpesa_receipt_number', '').upper().strip():
             return jsonify({"message": f"M-Pesa code doesn't match. Expected: {transaction.get('mpesa_receipt_number', 'N/A')}"}), 400
         
-        # Get current wallet balance
-        user_result = supabase.table('user').select('wallet_balance').eq('id', user_id).single().execute()
+        # Status and credit in one database call, keyed on the receipt so an
+        # M-Pesa code already credited (by callback or another admin) is never paid twice
+        outcome = payment_review.confirm_one(
+            transaction['id'], user_id, verified_amount, mpesa_code,
+            f"Approved by admin. {admin_notes}".strip()
+        )
         
-        if not user_result.data:
+        if outcome['status'] == payment_review.USER_NOT_FOUND:
             return jsonify({"message": "User not found"}), 404
-        
-        current_balance = float(user_result.data.get('wallet_balance', 0))
-        new_balance = current_balance + float(verified_amount)
-        
-        # Update wallet balance
-        supabase.table('user').update({
-            'wallet_balance': new_balance,
-            'wallet_status': 'approved'
-        }).eq('id', user_id).execute()
-        
-        # Update transaction status
-        supabase.table('transactions').update({
-            'status': 'success',
-            'amount': float(verified_amount),
-            'mpesa_receipt_number': mpesa_code,
-            'result_desc': f"Approved by admin. {admin_notes}".strip(),
-            'updated_at': datetime.now().isoformat()
-        }).eq('id', transaction['id']).execute()
+        if outcome['status'] == payment_review.DUPLICATE:
+            return jsonify({"message": f"M-Pesa code {mpesa_code} was already credited"}), 409
+        if outcome['status'] == payment_review.NOT_PENDING:
+            return jsonify({"message": "Transaction is no longer pending"}), 409
+        if outcome['status'] != payment_review.CONFIRMED:
+            return jsonify({"message": outcome.get('message') or "Failed to confirm payment"}), 500
         
         print(f"✅ Payment approved: User {user_id}, Amount {verified_amount}, Code {mpesa_code}")
         
         return jsonify({
-            "message": "Payment confirmed successfully",
-            "new_balance": new_balance
+            "message": outcome.get('message') or "Payment confirmed successfully",
+            "new_balance": float(outcome['balance'])
         }), 200
         
     except Exception as e:
@@ -249,6 +242,8 @@ def reject_payment():
         supabase.table('user').update({
             'wallet_status': 'rejected'
         }).eq('id', user_id).execute()
+        wallet_ledger.forget(user_id)
+        invalidate_admin_stats()
         
         print(f"❌ Payment rejected: User {user_id}, Reason: {reason}")
         
@@ -261,6 +256,74 @@ def reject_payment():
         return jsonify({"message": str(e)}), 500
 
 
+# ==================== BULK APPROVE / REJECT ====================
+
+@admin_wallet_bp.route("/admin/dashboard/bulk-review", methods=["POST"])
+@admin_required
+def bulk_review():
+    """Approve or reject many payments at once; returns one result per item"""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    items = data.get('items')
+
+    if action not in ('confirm', 'reject'):
+        return jsonify({"message": "action must be 'confirm' or 'reject'"}), 400
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "items required"}), 400
+
+    if len(items) > payment_review.MAX_ITEMS:
+        return jsonify({"message": f"At most {payment_review.MAX_ITEMS} items per request"}), 400
+
+    try:
+        if action == 'confirm':
+            results = payment_review.confirm_payments(items)
+        else:
+            results = payment_review.reject_payments(items, data.get('reason'))
+
+        succeeded = sum(1 for r in results if r['ok'])
+        return jsonify({
+            "message": f"{succeeded} of {len(results)} payments {'confirmed' if action == 'confirm' else 'rejected'}",
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Bulk review error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": str(e)}), 500
+
+
+# ==================== STATEMENT RECONCILIATION ====================
+
+@admin_wallet_bp.route("/admin/dashboard/reconcile-statement", methods=["POST"])
+@admin_required
+def reconcile_statement():
+    """Match an uploaded M-Pesa statement CSV against pending payments (apply=true approves the matches)"""
+    upload = request.files.get('statement')
+    if not upload:
+        return jsonify({"message": "Upload the statement CSV as 'statement'"}), 400
+
+    apply = request.form.get('apply', request.args.get('apply', '')).lower() in ('1', 'true', 'yes', 'on')
+
+    try:
+        # Approving: a row without a phone to compare goes to review, not to the wallet
+        report = statement_reconciler.reconcile_statement(upload.stream, require_phone=apply)
+    except (ValueError, csv.Error) as e:
+        return jsonify({"message": f"Could not read statement: {e}"}), 400
+    except Exception as e:
+        print(f"❌ Statement reconcile error: {e}")
+        return jsonify({"message": str(e)}), 500
+
+    if apply:
+        report['results'] = payment_review.confirm_payments(report['matched']) if report['matched'] else []
+
+    print(f"📄 Statement reconciled: {report['summary']}")
+    return jsonify(report), 200
+
+
 # ==================== DEBUG ENDPOINT ====================
 
 @admin_wallet_bp.route("/admin/dashboard/debug-transactions")
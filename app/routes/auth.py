@@ -3,20 +3,18 @@
 from flask import Blueprint, render_template, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.utils.helpers import sanitize_input
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 import os
 from dotenv import load_dotenv
 import re
 from app.utils.decorators import location_required
+from app.utils.analytics_store import analytics_store
 
 
 load_dotenv()
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Shared Supabase client (one connection pool per process)
+supabase = get_supabase()
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -68,6 +66,7 @@ def signup():
         }).execute()
         
         new_user = result.data[0]
+        analytics_store.record_signup()
         session['user_id'] = new_user['id']
         session.permanent = True
         
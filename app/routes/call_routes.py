@@ -1,17 +1,19 @@
 # routes/call_routes.py
 
 from flask import Blueprint, render_template, request, jsonify, session
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+from app.utils.query_metrics import track_queries
+from app.utils.stk_jobs import user_room
+from flask_socketio import join_room
+import base64
+import json
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 
 load_dotenv()
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 call_bp = Blueprint('call', __name__)
 
@@ -152,86 +154,90 @@ def save_contact():
 
 
 
-#reverting to prevoous get contacts function. Intended change looks for different table. 7/11/2025
+# get_user_contacts RPC (sql/001_get_user_contacts.sql) returns contacts joined with
+# usernames in one round-trip. Projects without the function fall back to two
+# queries: contacts, then one IN lookup for every username. 17/10/2026
+
+# Flipped off the first time the RPC is missing so we don't retry it per request
+_contacts_rpc_available = True
 
-@call_bp.route('/api/contacts', methods=['GET'])
-def get_contacts():
-    """Get user's saved contacts"""
-    user_id = session.get('user_id')
-    if not user_id:
-        return jsonify({"error": "Not logged in"}), 401
-    
-    try:
-        # Get contacts with user info
-        contacts = supabase.table('contacts')\
-            .select('id, contact_user_id, custom_name, saved_at')\
-            .eq('user_id', user_id)\
-            .order('saved_at', desc=True)\
-            .execute()
-        
-        # Enrich with user details and online status
-        enriched_contacts = []
-        for contact in contacts.data:
-            user_info = supabase.table('user')\
-                .select('username')\
-                .eq('id', contact['contact_user_id'])\
-                .execute()
-            
-            if user_info.data:
-                enriched_contacts.append({
-                    'id': contact['id'],
-                    'user_id': contact['contact_user_id'],
-                    'username': user_info.data[0]['username'],
-                    'custom_name': contact['custom_name'],
-                    'online': contact['contact_user_id'] in active_users
-                })
-        
-        return jsonify({
-            "success": True,
-            "contacts": enriched_contacts
-        }), 200
-        
-    except Exception as e:
-        print(f"❌ Get contacts error: {e}")
-        return jsonify({"error": str(e)}), 500
 
+def load_user_contacts(user_id):
+    """
+    Load a user's contacts with usernames, newest saved first
 
+    Args:
+        user_id (int): Owner of the contact list
 
+    Returns:
+        list: Rows with id, contact_user_id, custom_name, saved_at, username
+    """
+    global _contacts_rpc_available
 
+    if _contacts_rpc_available:
+        try:
+            result = supabase.rpc('get_user_contacts', {'p_user_id': user_id}).execute()
+            return result.data or []
+        except Exception as e:
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ get_user_contacts RPC not installed - using batched lookup")
+            _contacts_rpc_available = False
+
+    contacts = supabase.table('contacts')\
+        .select('id, contact_user_id, custom_name, saved_at')\
+        .eq('user_id', user_id)\
+        .order('saved_at', desc=True)\
+        .execute()
+
+    rows = contacts.data or []
+    usernames = fetch_usernames(row['contact_user_id'] for row in rows)
+
+    # Same as the RPC's inner join: contacts whose user is gone are dropped
+    return [
+        {**row, 'username': usernames[row['contact_user_id']]}
+        for row in rows
+        if row['contact_user_id'] in usernames
+    ]
+
+
+def fetch_usernames(user_ids):
+    """
+    Resolve many user ids to usernames with a single IN query
+
+    Returns:
+        dict: {user_id: username} for the ids that exist
+    """
+    user_ids = list({uid for uid in user_ids if uid is not None})
+    if not user_ids:
+        return {}
+
+    result = supabase.table('user')\
+        .select('id, username')\
+        .in_('id', user_ids)\
+        .execute()
+
+    return {u['id']: u['username'] for u in (result.data or [])}
 
 
-#Caching contacts to user. Prior code was laggy and contacts didn't appear unless you hardly refresh page. 6/11/2025
-''''
 @call_bp.route('/api/contacts', methods=['GET'])
 def get_contacts():
-    """Get user's saved contacts - OPTIMIZED"""
+    """Get user's saved contacts"""
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "Not logged in"}), 401
     
-    import time
-    start = time.time()
-    
     try:
-        # Use optimized SQL function (1 query instead of N+1)
-        result = supabase.rpc('get_user_contacts', {'p_user_id': user_id}).execute()
+        contacts = load_user_contacts(user_id)
         
-        query_time = (time.time() - start) * 1000
-        print(f"⏱️ DB query time: {query_time:.2f}ms")
-        
-        # Enrich with online status (from memory, super fast)
-        enriched_contacts = []
-        for contact in result.data:
-            enriched_contacts.append({
-                'id': contact['id'],
-                'user_id': contact['contact_user_id'],
-                'username': contact['username'],
-                'custom_name': contact['custom_name'],
-                'online': contact['contact_user_id'] in active_users
-            })
-        
-        total_time = (time.time() - start) * 1000
-        print(f"⏱️ Total time: {total_time:.2f}ms for {len(enriched_contacts)} contacts")
+        # Online status comes from memory, no query needed
+        enriched_contacts = [{
+            'id': contact['id'],
+            'user_id': contact['contact_user_id'],
+            'username': contact['username'],
+            'custom_name': contact['custom_name'],
+            'online': contact['contact_user_id'] in active_users
+        } for contact in contacts]
         
         return jsonify({
             "success": True,
@@ -240,10 +246,7 @@ def get_contacts():
         
     except Exception as e:
         print(f"❌ Get contacts error: {e}")
-        import traceback
-        traceback.print_exc()
         return jsonify({"error": str(e)}), 500
-'''
 
 
 
@@ -326,76 +329,108 @@ def delete_contact(contact_id):
 
 
 
+# Page size for /api/call-history; the UI asks for more with ?before=<next_before>
+CALL_HISTORY_PAGE_SIZE = 5
+CALL_HISTORY_MAX_PAGE_SIZE = 50
+
+
+def encode_call_cursor(call):
+    """Opaque keyset cursor pointing just past a call (started_at, id)"""
+    return base64.urlsafe_b64encode(json.dumps([call['started_at'], call['id']]).encode()).decode()
+
+
+def decode_call_cursor(cursor):
+    """
+    Inverse of encode_call_cursor, validated so it is safe to put in a filter
+
+    Returns:
+        tuple: (started_at ISO string, id)
+
+    Raises:
+        ValueError: Malformed cursor (not base64/JSON, wrong shape, bad timestamp or id)
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError("Invalid cursor")
+
+    started_at, last_id = key
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    try:
+        # Re-serialised, so only a canonical timestamp ever reaches the or_() filter
+        started_at = datetime.fromisoformat(started_at).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return started_at, last_id
+
+
 @call_bp.route('/api/call-history', methods=['GET'])
 def get_call_history():
-    """Get recent call history (last 5)"""
+    """Get recent call history (newest first, keyset-paginated)"""
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "Not logged in"}), 401
     
     try:
-        # Get calls where user was caller
-        caller_calls = supabase.table('call_history')\
-            .select('*')\
-            .eq('caller_id', user_id)\
-            .order('started_at', desc=True)\
-            .execute()
-        
-        # Get calls where user was callee
-        callee_calls = supabase.table('call_history')\
-            .select('*')\
-            .eq('callee_id', user_id)\
-            .order('started_at', desc=True)\
-            .execute()
-        
-        # Combine all calls
-        all_calls = (caller_calls.data or []) + (callee_calls.data or [])
-        
-        # Sort by started_at (newest first)
-        all_calls.sort(key=lambda x: x['started_at'], reverse=True)
-        
-        # Take only last 5
-        recent_calls = all_calls[:5]
-        
-        print(f"📋 Found {len(all_calls)} total calls for user {user_id}")
-        print(f"📋 Returning {len(recent_calls)} recent calls")
+        limit = int(request.args.get('limit', CALL_HISTORY_PAGE_SIZE))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid limit"}), 400
+    limit = max(1, min(limit, CALL_HISTORY_MAX_PAGE_SIZE))
+    
+    try:
+        before = decode_call_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # Calls where user was caller OR callee, newest first, bounded in the database
+        query = supabase.table('call_history')\
+            .select('id, caller_id, callee_id, call_status, call_duration, started_at')\
+            .or_(f'caller_id.eq.{user_id},callee_id.eq.{user_id}')
+        
+        # Keyset on (started_at, id): calls sharing a timestamp are neither skipped nor repeated
+        if before:
+            started_at, last_id = before
+            query = query.or_(f'started_at.lt."{started_at}",and(started_at.eq."{started_at}",id.lt.{last_id})')
+        
+        # One extra row tells us whether older calls exist
+        calls = query.order('started_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+        recent_calls = calls.data or []
+        has_more = len(recent_calls) > limit
+        recent_calls = recent_calls[:limit]
+        
+        # Resolve the other party's username for every call in one query
+        other_ids = [
+            call['callee_id'] if call['caller_id'] == user_id else call['caller_id']
+            for call in recent_calls
+        ]
+        try:
+            usernames = fetch_usernames(other_ids)
+        except Exception as e:
+            print(f"⚠️ Error fetching usernames for call history: {e}")
+            usernames = {}
         
-        # Enrich with usernames
         enriched_calls = []
-        for call in recent_calls:
-            # Determine the other user in the call
-            if call['caller_id'] == user_id:
-                other_user_id = call['callee_id']
-                direction = 'outgoing'
-            else:
-                other_user_id = call['caller_id']
-                direction = 'incoming'
-            
-            # Get other user's username
-            try:
-                user_info = supabase.table('user')\
-                    .select('username')\
-                    .eq('id', other_user_id)\
-                    .execute()
-                
-                other_username = user_info.data[0]['username'] if user_info.data else 'Unknown'
-            except Exception as e:
-                print(f"⚠️ Error fetching username for user {other_user_id}: {e}")
-                other_username = 'Unknown'
-            
+        for call, other_user_id in zip(recent_calls, other_ids):
             enriched_calls.append({
                 'id': call['id'],
                 'other_user_id': other_user_id,
-                'other_username': other_username,
-                'direction': direction,
+                'other_username': usernames.get(other_user_id, 'Unknown'),
+                'direction': 'outgoing' if call['caller_id'] == user_id else 'incoming',
                 'status': call['call_status'],
-                'duration': call.get('call_duration', 0),
+                'duration': call.get('call_duration') or 0,
                 'started_at': call['started_at']
             })
         
+        next_before = encode_call_cursor(recent_calls[-1]) if has_more else None
+        
         return jsonify({
             "success": True,
-            "calls": enriched_calls
+            "calls": enriched_calls,
+            "next_before": next_before
         }), 200
         
     except Exception as e:
@@ -487,6 +522,8 @@ def register_socketio_events(socketio):
         user_id = session.get('user_id')
         if user_id:
             active_users[user_id] = request.sid
+            # Every tab of this user gets payment_status events
+            join_room(user_room(user_id))
             print(f"✅ User {user_id} connected with socket {request.sid}")
             print(f"📋 Active users: {list(active_users.keys())}")
         else:
@@ -501,6 +538,7 @@ def register_socketio_events(socketio):
             print(f"📋 Active users: {list(active_users.keys())}")
     
     @socketio.on('call_user')
+    @track_queries('call_user')
     def handle_call_user(data):
         """Initiate call to another user"""
         caller_id = session.get('user_id')
@@ -578,6 +616,7 @@ def register_socketio_events(socketio):
             socketio.emit('call_failed', {'reason': 'User is offline'}, room=request.sid)
     
     @socketio.on('answer_call')
+    @track_queries('answer_call')
     def handle_answer_call(data):
         """Callee answers the call"""
         callee_id = session.get('user_id')
@@ -639,6 +678,7 @@ def register_socketio_events(socketio):
             }, room=recipient_socket)
     
     @socketio.on('hang_up')
+    @track_queries('hang_up')
     def handle_hang_up(data):
         """End the call"""
         user_id = session.get('user_id')
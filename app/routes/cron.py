@@ -1,8 +1,12 @@
 # Create: routes/cron.py
 from flask import Blueprint
-from supabase import create_client
+import time
 from datetime import datetime
-import os
+from app.utils.supabase_gateway import get_supabase
+from app.utils.analytics_store import analytics_store
+from app.utils.cache import invalidate_admin_stats
+from app.utils import mpesa_callbacks, stk_reconciler
+from app.utils.decorators import cron_required
 
 cron_bp = Blueprint('cron', __name__)
 
@@ -10,7 +14,7 @@ cron_bp = Blueprint('cron', __name__)
 def expire_groups():
     """Mark expired groups as expired"""
     try:
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+        supabase = get_supabase()
         
         now = datetime.utcnow().isoformat()
         
@@ -22,8 +26,46 @@ def expire_groups():
             supabase.table('group').update({'status': 'expired'}).eq('id', group['id']).execute()
             expired_count += 1
         
+        analytics_store.record_group_status_change('active', 'expired', expired_count)
+        if expired_count:
+            invalidate_admin_stats()
         print(f"✅ Expired {expired_count} groups")
         return {"success": True, "expired": expired_count}
     except Exception as e:
         print(f"Error expiring groups: {e}")
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+
+@cron_bp.route('/cron/reconcile-analytics', methods=['POST'])
+@cron_required
+def reconcile_analytics():
+    """Recount analytics counters from Supabase to correct drift"""
+    started = time.perf_counter()
+    if not analytics_store.reconcile():
+        return {"success": False, "error": "Reconcile failed or already running"}
+    return {"success": True, "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+@cron_bp.route('/cron/mpesa-callbacks', methods=['POST'])
+@cron_required
+def sweep_mpesa_callbacks():
+    """Re-queue stored M-Pesa callbacks that were never applied (restart / failure)"""
+    try:
+        requeued = mpesa_callbacks.sweep()
+        return {"success": True, "requeued": requeued, "queued": mpesa_callbacks.pending_count()}
+    except Exception as e:
+        print(f"Error sweeping M-Pesa callbacks: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@cron_bp.route('/cron/reconcile-stk', methods=['POST'])
+@cron_required
+def reconcile_stk():
+    """Query Daraja for STK pushes still pending after their callback should have arrived"""
+    try:
+        counts = stk_reconciler.reconcile()
+        if counts is None:
+            return {"success": False, "error": "Reconcile already running"}
+        return {"success": True, **counts}
+    except Exception as e:
+        print(f"Error reconciling STK pushes: {e}")
+        return {"success": False, "error": str(e)}
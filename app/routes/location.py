@@ -1,16 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, session
 from functools import wraps
 from datetime import datetime
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 import os
 
 location_bp = Blueprint('location', __name__)
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Shared Supabase client (one connection pool per process)
+supabase = get_supabase()
 
 
 ''''
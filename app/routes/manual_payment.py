@@ -1,6 +1,8 @@
 # routes/manual_payment.py
 from flask import Blueprint, request, jsonify, session
-from supabase import create_client
+from postgrest.exceptions import APIError
+from app.utils.supabase_gateway import get_supabase
+from app.utils.receipt_index import receipt_index
 from datetime import datetime
 import os
 from dotenv import load_dotenv
@@ -9,10 +11,7 @@ load_dotenv()
 
 manual_payment_bp = Blueprint('manual_payment_bp', __name__, url_prefix='/api/manual-payment')
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 
 @manual_payment_bp.route('/submit', methods=['POST'])
@@ -38,27 +37,40 @@ def submit_manual_payment():
     if len(mpesa_code) < 8:
         return jsonify({"message": "Invalid M-Pesa code format"}), 400
     
+    duplicate = jsonify({"message": "This M-Pesa code has already been submitted"}), 400
+    
+    # Known codes are refused from memory; claiming first means two
+    # concurrent submissions of the same code can't both get through
+    if not receipt_index.claim(mpesa_code):
+        return duplicate
+    
     try:
-        # Check for duplicate M-Pesa code
-        existing = supabase.table('transactions').select('id').eq('mpesa_receipt_number', mpesa_code).execute()
-        
-        if existing.data:
-            return jsonify({"message": "This M-Pesa code has already been submitted"}), 400
+        if not receipt_index.is_loaded():
+            # Index still loading: check Supabase like before
+            existing = supabase.table('transactions').select('id').eq('mpesa_receipt_number', mpesa_code).limit(1).execute()
+            if existing.data:
+                return duplicate  # Claim kept: the code is in the table, so the index should hold it
         
-        # Save transaction as pending
-        supabase.table('transactions').insert({
-            'user_id': user_id,
-            'default_mpesa_phone': phone,
-            'amount': float(amount),
-            'status': 'pending',
-            'mpesa_receipt_number': mpesa_code,
-            'created_at': datetime.now().isoformat()
-        }).execute()
+        # Save transaction as pending (unique index rejects a code another process just inserted)
+        try:
+            supabase.table('transactions').insert({
+                'user_id': user_id,
+                'default_mpesa_phone': phone,
+                'amount': float(amount),
+                'status': 'pending',
+                'mpesa_receipt_number': mpesa_code,
+                'created_at': datetime.now().isoformat()
+            }).execute()
+        except APIError as e:
+            if e.code == '23505':
+                return duplicate  # Same here: another process stored it first
+            raise
         
         print(f"✓ Manual payment submitted: User {user_id}, Amount {amount}, Code {mpesa_code}")
         
         return jsonify({"message": "Payment submitted successfully"}), 200
         
     except Exception as e:
+        receipt_index.release(mpesa_code)
         print(f"Manual payment error: {e}")
         return jsonify({"message": "Failed to submit payment. Please try again."}), 500
\ No newline at end of file
@@ -3,14 +3,11 @@ from datetime import datetime
 import json
 from pywebpush import webpush, WebPushException
 import os
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 
 notifications_bp = Blueprint('notifications', __name__)
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 VAPID_PUBLIC_KEY = os.getenv('VAPID_PUBLIC_KEY')
 VAPID_PRIVATE_KEY = os.getenv('VAPID_PRIVATE_KEY')
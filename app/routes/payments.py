@@ -1,8 +1,11 @@
 # routes/payments.py - MIGRATED TO SUPABASE
 
 from flask import Blueprint, render_template, request, jsonify, session
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 from app.utils.decorators import login_required
+from app.utils.analytics_store import analytics_store
+from app.utils.cache import invalidate_admin_stats
+from app.utils import group_payments
 import os
 from dotenv import load_dotenv
 
@@ -10,10 +13,7 @@ load_dotenv()
 
 payments_bp = Blueprint('payments', __name__)
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+supabase = get_supabase()
 
 @payments_bp.route('/add-payment')
 @login_required
@@ -36,27 +36,6 @@ def api_add_payment():
         if not user_id:
             return jsonify({"success": False, "message": "Not logged in"}), 401
         
-        # Get user from Supabase
-        user_result = supabase.table('user').select('*').eq('id', user_id).execute()
-        if not user_result.data:
-            return jsonify({"success": False, "message": "User not found"}), 404
-        
-        user = user_result.data[0]
-        
-        if not user.get('member_id'):
-            return jsonify({"success": False, "message": "You're not in a group"}), 400
-        
-        # Get member from Supabase
-        member_result = supabase.table('member').select('*, group(*)').eq('id', user['member_id']).execute()
-        if not member_result.data:
-            return jsonify({"success": False, "message": "Member not found"}), 404
-        
-        member = member_result.data[0]
-        group = member.get('group')
-        
-        if not group:
-            return jsonify({"success": False, "message": "Group not found"}), 404
-        
         # Validate amount
         try:
             amount = float(data.get('amount', 0))
@@ -69,27 +48,24 @@ def api_add_payment():
         if amount > 500:
             return jsonify({"success": False, "message": "Maximum payment is 500 KSH"}), 400
         
-        # Create payment in Supabase
-        payment_data = {
-            'member_id': member['id'],
-            'group_id': group['id'],
-            'amount': amount,
-            'mpesa_code': data.get('mpesa_code', '').strip() or None,
-            'verified': False,
-            'member_name': member['name'],
-            'group_name': group['name']
-        }
-        
-        result = supabase.table('payment').insert(payment_data).execute()
+        # Member/group lookup + insert in one database call
+        try:
+            submitted = group_payments.submit_payment(user_id, amount, data.get('mpesa_code'))
+        except LookupError as e:
+            return jsonify({"success": False, "message": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
         
-        if result.data:
-            return jsonify({
-                "success": True,
-                "message": f"Payment of {amount} KSH submitted! Waiting for admin verification.",
-                "payment_id": result.data[0]['id']
-            }), 200
-        else:
-            return jsonify({"success": False, "message": "Failed to create payment"}), 500
+        analytics_store.record_payment_submitted()
+        invalidate_admin_stats()
+        return jsonify({
+            "success": True,
+            "message": f"Payment of {amount} KSH submitted! Waiting for admin verification.",
+            "payment_id": submitted['payment']['id'],
+            "payment": submitted['payment'],
+            "group": submitted['group'],
+            "progress": submitted['progress']
+        }), 200
             
     except Exception as e:
         print(f"Payment error: {e}")
@@ -1,6 +1,8 @@
 # routes/wallet.py
 from flask import Blueprint, jsonify, session
-from supabase import create_client, Client
+from app.utils.supabase_gateway import get_supabase
+from app.utils import wallet_ledger
+from app.utils.daraja import daraja
 import os
 from dotenv import load_dotenv
 import requests
@@ -10,11 +12,8 @@ from requests.auth import HTTPBasicAuth
 
 load_dotenv()
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Shared Supabase client (one connection pool per process)
+supabase = get_supabase()
 
 
 wallet_bp = Blueprint('wallet_bp', __name__)
@@ -26,24 +25,9 @@ wallet_bp = Blueprint('wallet_bp', __name__)
 
 
 def get_daraja_access_token():
-    """Fetch Daraja access token from Safaricom API"""
-    consumer_key = os.getenv("MPESA_CONSUMER_KEY")
-    consumer_secret = os.getenv("MPESA_CONSUMER_SECRET")
-    daraja_env = os.getenv("DARAJA_ENV", "sandbox")
-
-    if not consumer_key or not consumer_secret:
-        raise Exception("Missing Daraja API credentials in .env")
-
-    if daraja_env == "sandbox":
-        url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    else:
-        url = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-
+    """Daraja access token (cached by the shared Daraja client)"""
     try:
-        response = requests.get(url, auth=HTTPBasicAuth(consumer_key, consumer_secret))
-        response.raise_for_status()
-        access_token = response.json().get("access_token")
-        return access_token
+        return daraja.get_token()
     except Exception as e:
         print("Error fetching Daraja access token:", e)
         return None
@@ -128,6 +112,7 @@ def mark_payment_sent():
         supabase.table("user").update({
             "wallet_status": "pending"
         }).eq("id", user_id).execute()
+        wallet_ledger.forget(user_id)
         
         return jsonify({"message": "Payment marked as sent"}), 200
     except Exception as e:
@@ -143,14 +128,14 @@ def check_wallet():
         return jsonify({"wallet_balance": 0.0, "wallet_status": "unauthorized"}), 401
 
     try:
-        res = supabase.table("user").select("wallet_balance, wallet_status").eq("id", user_id).execute()
+        # Served from the wallet ledger cache (refreshed on every credit/debit)
+        wallet = wallet_ledger.get_wallet(user_id)
 
-        if not res.data:
+        if not wallet:
             return jsonify({"wallet_balance": 0.0, "wallet_status": "not_found"}), 404
 
-        user = res.data[0]
-        balance = float(user.get("wallet_balance", 0.0))
-        status = user.get("wallet_status", "not_paid")
+        balance = wallet["wallet_balance"]
+        status = wallet["wallet_status"]
 
         return jsonify({
             "wallet_balance": balance, 
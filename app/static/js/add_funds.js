@@ -16,6 +16,85 @@ function closeAddMoneyModal() {
   document.getElementById("topupStatus").style.display = "none";
 }
 
+// STK pushes run in the background; progress arrives as payment_status
+// events on the user's Socket.IO room (GET /api/mpesa/stk-push/<job_id>
+// is only used if the socket is not connected). The events ride on the
+// page's call socket from webrtc.js: a second connection would replace
+// this tab in the server's active_users and break incoming calls.
+let paymentSocket = null;
+let currentTopupJob = null;
+
+const TOPUP_MESSAGES = {
+  submitted: {text: "Sending payment request...", color: "blue"},
+  accepted: {text: "✅ Check your M-Pesa for the payment prompt!", color: "green"},
+  success: {text: "✅ Payment received! Your wallet has been topped up.", color: "green"},
+  failed: {text: "Payment request failed.", color: "red"}
+};
+
+function showTopupStatus(job) {
+  const status = document.getElementById("topupStatus");
+  const message = TOPUP_MESSAGES[job.status] || TOPUP_MESSAGES.submitted;
+
+  status.textContent = job.status === "failed" && job.message ? job.message : message.text;
+  status.style.color = message.color;
+  status.style.display = "block";
+
+  if (job.status === "success") {
+    refreshWalletBalance();
+  }
+}
+
+async function refreshWalletBalance() {
+  try {
+    const res = await fetch("/api/check-wallet");
+    const data = await res.json();
+    const balance = document.getElementById("walletBalance");
+    if (balance && res.ok) balance.textContent = data.wallet_balance || 0;
+  } catch (err) {
+    console.error("Wallet refresh error:", err);
+  }
+}
+
+function handlePaymentStatus(job) {
+  if (!currentTopupJob) return;
+  if (job.job_id === currentTopupJob.job_id ||
+      (job.checkout_request_id && job.checkout_request_id === currentTopupJob.checkout_request_id)) {
+    currentTopupJob = {...currentTopupJob, ...job, job_id: currentTopupJob.job_id};
+    showTopupStatus(currentTopupJob);
+  }
+}
+
+function connectPaymentSocket() {
+  // webrtc.js's top-level `socket` (initSocket() may have replaced it since)
+  const shared = typeof socket !== "undefined" && socket ? socket : null;
+
+  if (shared) {
+    if (paymentSocket === shared) return;
+    paymentSocket = shared;
+  } else {
+    // Page without the call socket: open our own
+    if (paymentSocket || typeof io === "undefined") return;
+    paymentSocket = io({transports: ["websocket", "polling"]});
+  }
+  paymentSocket.on("payment_status", handlePaymentStatus);
+}
+
+async function pollTopupJob(jobId, attempts = 20) {
+  // Fallback only: stops as soon as the socket delivers a final status
+  for (let i = 0; i < attempts; i++) {
+    await new Promise(resolve => setTimeout(resolve, 3000));
+    if (!currentTopupJob || currentTopupJob.job_id !== jobId) return;
+    if (["success", "failed"].includes(currentTopupJob.status)) return;
+    connectPaymentSocket();
+    if (paymentSocket && paymentSocket.connected) continue;
+
+    const res = await fetch(`/api/mpesa/stk-push/${jobId}`);
+    if (!res.ok) return;
+    currentTopupJob = {...currentTopupJob, ...(await res.json())};
+    showTopupStatus(currentTopupJob);
+  }
+}
+
 async function submitTopup() {
   const amount = document.getElementById("topupAmount").value;
   const phone = document.getElementById("mpesaNumber").textContent.trim();
@@ -32,6 +111,8 @@ async function submitTopup() {
   status.style.display = "block";
   status.style.color = "blue";
 
+  connectPaymentSocket();
+
   try {
     const res = await fetch("/api/mpesa/stk-push", {
       method: "POST",
@@ -41,11 +122,12 @@ async function submitTopup() {
 
     const data = await res.json();
 
-    if (res.ok && data.ResponseCode === "0") {
-      status.textContent = "✅ Check your M-Pesa for the payment prompt!";
-      status.style.color = "green";
+    if (res.status === 202 && data.job_id) {
+      currentTopupJob = data;
+      showTopupStatus(data);
+      pollTopupJob(data.job_id);
     } else {
-      status.textContent = data.errorMessage || "Payment request failed.";
+      status.textContent = data.error || "Payment request failed.";
       status.style.color = "red";
     }
   } catch (err) {
@@ -53,4 +135,4 @@ async function submitTopup() {
     status.textContent = "Network error. Please try again.";
     status.style.color = "red";
   }
-}
\ No newline at end of file
+}
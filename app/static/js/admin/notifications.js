@@ -1,6 +1,7 @@
 // Load users and recent notifications on page load
 document.addEventListener('DOMContentLoaded', () => {
     loadUsers();
+    setupUserSearch();
     loadRecentNotifications();
     setupCharCounters();
     setupTargetToggle();
@@ -26,9 +27,24 @@ function setupTargetToggle() {
     });
 }
 
-async function loadUsers() {
+// Users are paginated server-side; the dropdown shows the first page
+// matching the typed username prefix
+const USER_OPTIONS_LIMIT = 100;
+let userSearchTimer = null;
+
+function setupUserSearch() {
+    document.getElementById('userSearch').addEventListener('input', (e) => {
+        clearTimeout(userSearchTimer);
+        userSearchTimer = setTimeout(() => loadUsers(e.target.value.trim()), 300);
+    });
+}
+
+async function loadUsers(prefix = '') {
     try {
-        const response = await fetch('/admin/api/users');
+        const params = new URLSearchParams({ limit: USER_OPTIONS_LIMIT, sort: 'id' });
+        if (prefix) params.set('q', prefix);
+
+        const response = await fetch(`/admin/api/users?${params}`);
         const data = await response.json();
         
         if (data.users) {
@@ -41,6 +57,13 @@ async function loadUsers() {
                 option.textContent = `${user.username} (ID: ${user.id})`;
                 select.appendChild(option);
             });
+
+            if (data.next_cursor) {
+                const option = document.createElement('option');
+                option.disabled = true;
+                option.textContent = 'More users - type to narrow the search';
+                select.appendChild(option);
+            }
         }
     } catch (error) {
         console.error('Error loading users:', error);
@@ -156,28 +156,47 @@ document.getElementById('cancelSaveBtn').addEventListener('click', () => {
     document.getElementById('saveContactModal').style.display = 'none';
 });
 
-async function loadCallHistory() {
+function renderCallHistoryItem(call) {
+    const icon = call.direction === 'outgoing' ? '📞' : '📲';
+    const duration = call.duration > 0 ? `${Math.floor(call.duration / 60)}:${(call.duration % 60).toString().padStart(2, '0')}` : '';
+    const time = new Date(call.started_at).toLocaleString();
+    
+    return `
+        <div class="call-history-item">
+            <span>${icon} ${call.other_username}</span>
+            <span style="color:#666; font-size:12px;">${call.status} ${duration}</span>
+            <span style="color:#999; font-size:11px;">${time}</span>
+        </div>
+    `;
+}
+
+// Pass the previous page's next_before to append older calls
+async function loadCallHistory(before = null) {
     try {
-        const response = await fetch('/api/call-history');
+        const url = before ? `/api/call-history?before=${encodeURIComponent(before)}` : '/api/call-history';
+        const response = await fetch(url);
         const data = await response.json();
         
         const historyList = document.getElementById('callHistoryList');
+        const loadMoreBtn = document.getElementById('loadOlderCallsBtn');
+        if (loadMoreBtn) loadMoreBtn.remove();
         
         if (data.success && data.calls.length > 0) {
-            historyList.innerHTML = data.calls.map(call => {
-                const icon = call.direction === 'outgoing' ? '📞' : '📲';
-                const duration = call.duration > 0 ? `${Math.floor(call.duration / 60)}:${(call.duration % 60).toString().padStart(2, '0')}` : '';
-                const time = new Date(call.started_at).toLocaleString();
-                
-                return `
-                    <div class="call-history-item">
-                        <span>${icon} ${call.other_username}</span>
-                        <span style="color:#666; font-size:12px;">${call.status} ${duration}</span>
-                        <span style="color:#999; font-size:11px;">${time}</span>
-                    </div>
-                `;
-            }).join('');
-        } else {
+            const items = data.calls.map(renderCallHistoryItem).join('');
+            if (before) {
+                historyList.insertAdjacentHTML('beforeend', items);
+            } else {
+                historyList.innerHTML = items;
+            }
+            
+            if (data.next_before) {
+                const btn = document.createElement('button');
+                btn.id = 'loadOlderCallsBtn';
+                btn.textContent = 'Load older calls';
+                btn.addEventListener('click', () => loadCallHistory(data.next_before));
+                historyList.appendChild(btn);
+            }
+        } else if (!before) {
             historyList.innerHTML = '<p style="color:#666;">No call history</p>';
         }
     } catch (error) {
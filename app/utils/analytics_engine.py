@@ -0,0 +1,334 @@
+# utils/analytics_engine.py - VECTORIZED (NUMPY) ANALYTICS FOR ADMIN REPORTS
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.utils.supabase_gateway import get_supabase
+
+# Rows per PostgREST page when loading columns
+PAGE_SIZE = int(os.getenv('ANALYTICS_ENGINE_PAGE_SIZE', 1000))
+# Seconds a loaded engine is reused by get_engine()
+ENGINE_TTL = int(os.getenv('ANALYTICS_ENGINE_TTL', 300))
+
+PERIODS = ('day', 'week', 'month')
+
+# Codes stored in AnalyticsEngine.payments['status']
+STATUS_PENDING = 0
+STATUS_VERIFIED = 1
+STATUS_REJECTED = 2
+
+_engine = None
+_engine_loaded_at = 0.0
+_engine_lock = threading.Lock()
+_loading = None  # threading.Event while a background load runs
+
+
+def _utc(value):
+    """ISO timestamp -> naive UTC datetime (offsets converted, naive taken as UTC)"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def to_datetime64(values):
+    """ISO timestamp strings -> UTC datetime64[s] array; missing -> NaT"""
+    return np.array([_utc(v) if v else 'NaT' for v in values], dtype='datetime64[s]')
+
+
+def period_ordinals(ts, period):
+    """
+    Map timestamps to integer period numbers
+
+    Args:
+        ts (ndarray): datetime64[s] array (no NaT)
+        period (str): 'day', 'week' (Monday start) or 'month'
+
+    Returns:
+        ndarray: int64 ordinals, consecutive periods differ by 1
+    """
+    if period == 'day':
+        return ts.astype('datetime64[D]').astype(np.int64)
+    if period == 'week':
+        # 1970-01-01 was a Thursday; +3 makes Monday the first day of a week
+        return (ts.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    if period == 'month':
+        return ts.astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"period must be one of {PERIODS}")
+
+
+def period_labels(ordinals, period):
+    """Period numbers -> 'YYYY-MM-DD' (period start) or 'YYYY-MM' labels"""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    if period == 'month':
+        return np.datetime_as_string(ordinals.astype('datetime64[M]'), unit='M').tolist()
+    if period == 'week':
+        ordinals = ordinals * 7 - 3
+    return np.datetime_as_string(ordinals.astype('datetime64[D]'), unit='D').tolist()
+
+
+def rollup(ts, period, weights=None):
+    """
+    Count (or sum weights) per period
+
+    Returns:
+        dict: {label: value} in chronological order
+    """
+    valid = ~np.isnat(ts)
+    if not valid.any():
+        return {}
+
+    ordinals = period_ordinals(ts[valid], period)
+    uniq, inverse = np.unique(ordinals, return_inverse=True)
+    totals = np.bincount(inverse, weights=None if weights is None else weights[valid], minlength=len(uniq))
+    return dict(zip(period_labels(uniq, period), totals.tolist()))
+
+
+class AnalyticsEngine:
+    """Columnar snapshot of payments, groups, users and wallet top-ups
+
+    Each table is loaded once into NumPy arrays (epoch timestamps, amounts,
+    status codes), then every report is a handful of vectorized operations
+    instead of a per-row Python loop.
+    """
+
+    def __init__(self, payments, groups, users, topups):
+        self.payments = payments
+        self.groups = groups
+        self.users = users
+        self.topups = topups
+
+    @staticmethod
+    def _fetch_all(supabase, table, columns, build=None):
+        """Keyset-page through a table by id, selecting only the given columns"""
+        rows = []
+        after_id = 0
+        while True:
+            query = supabase.table(table).select(columns)
+            if build:
+                query = build(query)
+            page = query.gt('id', after_id).order('id').limit(PAGE_SIZE).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            after_id = page[-1]['id']
+
+    @classmethod
+    def load(cls, supabase=None):
+        """Load the columns every report needs from Supabase (tables in parallel)"""
+        supabase = supabase or get_supabase()
+
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix='analytics-load') as pool:
+            payments = pool.submit(cls._fetch_all, supabase, 'payment', 'id, amount, created_at, verified, rejected')
+            groups = pool.submit(cls._fetch_all, supabase, 'group', 'id, created_at, status')
+            users = pool.submit(cls._fetch_all, supabase, 'user', 'id, created_at')
+            topups = pool.submit(
+                cls._fetch_all, supabase, 'transactions', 'id, user_id, amount, created_at',
+                lambda q: q.eq('status', 'success')
+            )
+
+            return cls.from_rows(payments.result(), groups.result(), users.result(), topups.result())
+
+    @classmethod
+    def from_rows(cls, payments, groups, users, topups):
+        """Build the columnar arrays from lists of row dicts"""
+        status = np.full(len(payments), STATUS_PENDING, dtype=np.int8)
+        status[np.array([bool(p.get('rejected')) for p in payments], dtype=bool)] = STATUS_REJECTED
+        status[np.array([bool(p.get('verified')) for p in payments], dtype=bool)] = STATUS_VERIFIED
+
+        return cls(
+            payments={
+                "ts": to_datetime64([p.get('created_at') for p in payments]),
+                "amount": np.array([float(p.get('amount') or 0) for p in payments], dtype=np.float64),
+                "status": status
+            },
+            groups={
+                "ts": to_datetime64([g.get('created_at') for g in groups]),
+                "status": np.array([g.get('status') or 'pending' for g in groups], dtype=object)
+            },
+            users={
+                "id": np.array([u['id'] for u in users], dtype=np.int64),
+                "ts": to_datetime64([u.get('created_at') for u in users])
+            },
+            topups={
+                "user_id": np.array([t.get('user_id') or -1 for t in topups], dtype=np.int64),
+                "ts": to_datetime64([t.get('created_at') for t in topups]),
+                "amount": np.array([float(t.get('amount') or 0) for t in topups], dtype=np.float64)
+            }
+        )
+
+    # ============ ROLLUPS ============
+
+    def revenue(self, period='day', since=None):
+        """Verified group-payment revenue per period"""
+        mask = self.payments['status'] == STATUS_VERIFIED
+        if since is not None:
+            mask &= self.payments['ts'] >= np.datetime64(since, 's')
+        return rollup(self.payments['ts'][mask], period, self.payments['amount'][mask])
+
+    def wallet_topups(self, period='day', since=None):
+        """Successful wallet top-up amount per period"""
+        mask = np.ones(len(self.topups['ts']), dtype=bool)
+        if since is not None:
+            mask &= self.topups['ts'] >= np.datetime64(since, 's')
+        return rollup(self.topups['ts'][mask], period, self.topups['amount'][mask])
+
+    def group_formation(self, period='day'):
+        """Groups created per period"""
+        return {label: int(n) for label, n in rollup(self.groups['ts'], period).items()}
+
+    # ============ COHORTS ============
+
+    def _activity(self, period):
+        """(user row index, period ordinal) for every top-up by a known user"""
+        order = np.argsort(self.users['id'])
+        sorted_ids = self.users['id'][order]
+
+        active = ~np.isnat(self.topups['ts'])
+        user_ids = self.topups['user_id'][active]
+        pos = np.searchsorted(sorted_ids, user_ids)
+        pos_clipped = np.minimum(pos, max(len(sorted_ids) - 1, 0))
+        known = (pos < len(sorted_ids)) & (sorted_ids[pos_clipped] == user_ids) if len(sorted_ids) else np.zeros(len(user_ids), dtype=bool)
+
+        user_rows = order[pos_clipped[known]]
+        ordinals = period_ordinals(self.topups['ts'][active][known], period)
+        return user_rows, ordinals
+
+    def cohort_retention(self, period='month', periods=12):
+        """
+        Share of each signup cohort that topped up N periods after joining
+
+        Returns:
+            dict: cohorts (labels), sizes, matrix[cohort][offset] as fractions
+        """
+        has_signup = ~np.isnat(self.users['ts'])
+        if not has_signup.any():
+            return {"period": period, "cohorts": [], "sizes": [], "matrix": []}
+
+        cohort_of_user = np.full(len(self.users['id']), np.iinfo(np.int64).min, dtype=np.int64)
+        cohort_of_user[has_signup] = period_ordinals(self.users['ts'][has_signup], period)
+        cohorts, sizes = np.unique(cohort_of_user[has_signup], return_counts=True)
+
+        user_rows, ordinals = self._activity(period)
+        keep = has_signup[user_rows]
+        user_rows, ordinals = user_rows[keep], ordinals[keep]
+        offsets = ordinals - cohort_of_user[user_rows]
+        keep = (offsets >= 0) & (offsets < periods)
+
+        # Count each user once per (cohort, offset)
+        pairs = np.unique(np.stack([user_rows[keep], offsets[keep]]), axis=1)
+        rows = np.searchsorted(cohorts, cohort_of_user[pairs[0]])
+        counts = np.bincount(rows * periods + pairs[1], minlength=len(cohorts) * periods)
+        matrix = counts.reshape(len(cohorts), periods) / sizes[:, None]
+
+        return {
+            "period": period,
+            "cohorts": period_labels(cohorts, period),
+            "sizes": sizes.tolist(),
+            "matrix": np.round(matrix, 4).tolist()
+        }
+
+    def churn(self, period='month'):
+        """
+        Users active (topped up) in a period but not in the next one
+
+        The latest period is left out because its next period is not over.
+
+        Returns:
+            dict: {label: {"active", "churned", "churn_rate"}}
+        """
+        user_rows, ordinals = self._activity(period)
+        if len(ordinals) == 0:
+            return {}
+
+        n_users = len(self.users['id'])
+        first = ordinals.min()
+        keys = np.unique((ordinals - first) * n_users + user_rows)
+        churned = ~np.isin(keys + n_users, keys)
+
+        key_periods = keys // n_users
+        last = key_periods.max()
+        active = np.bincount(key_periods, minlength=last + 1)[:last]
+        lost = np.bincount(key_periods[churned], minlength=last + 1)[:last]
+        labels = period_labels(np.arange(last) + first, period)
+
+        return {
+            label: {
+                "active": int(a),
+                "churned": int(c),
+                "churn_rate": round(int(c) / int(a) * 100, 2) if a else 0
+            }
+            for label, a, c in zip(labels, active, lost)
+            if a
+        }
+
+
+def _reload(done):
+    """Background load; swaps the new snapshot in only when it is complete"""
+    global _engine, _engine_loaded_at, _loading
+
+    try:
+        start = time.perf_counter()
+        engine = AnalyticsEngine.load()
+        with _engine_lock:
+            _engine = engine
+            _engine_loaded_at = time.time()
+        print(f"✅ Analytics engine loaded in {(time.perf_counter() - start) * 1000:.0f}ms "
+              f"({len(engine.payments['ts'])} payments, {len(engine.topups['ts'])} top-ups)")
+    except Exception as e:
+        print(f"❌ Analytics engine load failed: {e}")
+    finally:
+        with _engine_lock:
+            _loading = None
+        done.set()
+
+
+def _start_reload():
+    """Start a background load unless one is running (call with _engine_lock held)"""
+    global _loading
+
+    if _loading is None:
+        _loading = threading.Event()
+        threading.Thread(target=_reload, args=(_loading,), name='analytics-engine', daemon=True).start()
+    return _loading
+
+
+def get_engine(refresh=False):
+    """
+    Shared engine; reloaded in the background when older than ENGINE_TTL
+
+    While a reload runs, callers get the previous snapshot. Only the very
+    first call waits, and concurrent first callers share one load.
+
+    Args:
+        refresh (bool): Start a reload now (the current snapshot is still returned)
+
+    Returns:
+        AnalyticsEngine: Latest complete snapshot
+
+    Raises:
+        RuntimeError: The first load failed
+    """
+    with _engine_lock:
+        engine = _engine
+        loading = None
+        if refresh or engine is None or time.time() - _engine_loaded_at > ENGINE_TTL:
+            loading = _start_reload()
+
+    if engine is not None:
+        return engine
+
+    loading.wait()
+    if _engine is None:
+        raise RuntimeError("Analytics engine failed to load")
+    return _engine
+
+
+def engine_status():
+    """When the current snapshot was loaded and whether a reload is running"""
+    return {"loaded_at": _engine_loaded_at or None, "refreshing": _loading is not None}
@@ -1,49 +1,170 @@
 # utils/analytics_service.py - MIGRATED TO SUPABASE
 
+from collections import Counter
 from datetime import datetime, timedelta
-from supabase import create_client
-import os
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+from app.utils.analytics_store import analytics_store, REVENUE_WINDOW_DAYS
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Database functions (sql/003_analytics.sql) found missing in this process
+_missing_rpcs = set()
+
+
 class AnalyticsService:
-    """MYFI Analytics - Business Intelligence (Supabase)"""
-    
+    """MYFI Analytics - Business Intelligence (Supabase)
+
+    Dashboard totals and recent revenue are read from the running counters
+    in analytics_store. Everything else (and the counters' reconciliation)
+    is computed by Postgres: count-only HEAD requests for row counts and
+    the analytics_* functions for sums and day buckets. When a function is
+    not installed the method falls back to a narrow query that only pulls
+    the columns it needs.
+    """
+
     def __init__(self):
-        self.supabase = create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
-        )
-    
+        self.supabase = get_supabase()
+
+    def _count(self, table, build=None):
+        """Row count without transferring rows (HEAD + count=exact)"""
+        query = self.supabase.table(table).select('id', count='exact', head=True)
+        if build:
+            query = build(query)
+        return query.execute().count or 0
+
+    def _rpc(self, fn, params=None):
+        """Call an analytics function; None if it is not installed"""
+        if fn in _missing_rpcs:
+            return None
+        try:
+            return self.supabase.rpc(fn, params or {}).execute().data
+        except Exception as e:
+            if not is_missing_rpc(e):
+                raise
+            print(f"⚠️ {fn} RPC not installed - using fallback query")
+            _missing_rpcs.add(fn)
+            return None
+
+    def _dashboard_stats_from_db(self):
+        """Dashboard totals straight from Supabase (raises on failure)"""
+        stats = self._rpc('analytics_dashboard_stats')
+        if stats is not None:
+            return {
+                "total_users": int(stats['total_users']),
+                "total_groups": int(stats['total_groups']),
+                "active_groups": int(stats['active_groups']),
+                "expired_groups": int(stats['expired_groups']),
+                "pending_groups": int(stats.get('pending_groups') or 0),
+                "total_revenue": float(stats['total_revenue']),
+                "pending_payments": int(stats['pending_payments'])
+            }
+
+        verified = self.supabase.table('payment').select('amount').eq('verified', True).execute()
+
+        return {
+            "total_users": self._count('user'),
+            "total_groups": self._count('group'),
+            "active_groups": self._count('group', lambda q: q.eq('status', 'active')),
+            "expired_groups": self._count('group', lambda q: q.eq('status', 'expired')),
+            "pending_groups": self._count('group', lambda q: q.eq('status', 'pending')),
+            "total_revenue": sum(float(p.get('amount') or 0) for p in verified.data),
+            "pending_payments": self._count('payment', lambda q: q.or_('verified.is.null,verified.eq.false').or_('rejected.is.null,rejected.eq.false'))
+        }
+
+    def _revenue_trend_from_db(self, days):
+        """Daily verified revenue straight from Supabase (raises on failure)"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+
+        rows = self._rpc('analytics_revenue_by_day', {'p_since': start_date.isoformat()})
+        if rows is not None:
+            return {row['day']: float(row['revenue']) for row in rows}
+
+        # Fallback: date filter pushed down, only two columns transferred
+        payments = self.supabase.table('payment')\
+            .select('amount, created_at')\
+            .eq('verified', True)\
+            .gte('created_at', start_date.isoformat())\
+            .execute()
+
+        revenue_by_date = {}
+        for payment in payments.data:
+            date_key = payment['created_at'][:10]
+            revenue_by_date[date_key] = revenue_by_date.get(date_key, 0) + float(payment.get('amount') or 0)
+
+        return revenue_by_date
+
+    def _wallet_topups_from_db(self, days):
+        """Successful wallet top-ups: count, total and daily buckets"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+
+        summary = self._rpc('analytics_wallet_topups', {'p_since': start_date.isoformat()})
+        if summary is not None:
+            return {
+                "count": int(summary['count']),
+                "total": float(summary['total']),
+                "by_day": {day: float(amount) for day, amount in (summary.get('by_day') or {}).items()}
+            }
+
+        topups = self.supabase.table('transactions')\
+            .select('amount, updated_at, created_at')\
+            .eq('status', 'success')\
+            .execute()
+
+        by_day = {}
+        since = start_date.strftime('%Y-%m-%d')
+        for tx in topups.data:
+            day = (tx.get('updated_at') or tx.get('created_at') or '')[:10]
+            if day >= since:
+                by_day[day] = by_day.get(day, 0) + float(tx.get('amount') or 0)
+
+        return {
+            "count": len(topups.data),
+            "total": sum(float(tx.get('amount') or 0) for tx in topups.data),
+            "by_day": by_day
+        }
+
+    def compute_counters(self, window_days=90):
+        """
+        Full recount used by analytics_store reconciliation
+
+        Args:
+            window_days (int): Days of daily buckets to rebuild
+
+        Returns:
+            dict: Counter values in analytics_store layout
+        """
+        stats = self._dashboard_stats_from_db()
+        topups = self._wallet_topups_from_db(window_days)
+
+        return {
+            "total_users": stats['total_users'],
+            "groups_by_status": {
+                "active": stats['active_groups'],
+                "expired": stats['expired_groups'],
+                "pending": stats['pending_groups']
+            },
+            "total_revenue": stats['total_revenue'],
+            "pending_payments": stats['pending_payments'],
+            "revenue_by_day": self._revenue_trend_from_db(window_days),
+            "wallet_topups": topups['count'],
+            "wallet_topup_total": topups['total'],
+            "wallet_topups_by_day": topups['by_day']
+        }
+
     def get_dashboard_stats(self):
-        """Get main dashboard statistics"""
+        """Get main dashboard statistics (O(1) from running counters)"""
         try:
-            # Get counts
-            users = self.supabase.table('user').select('*', count='exact').execute()
-            groups = self.supabase.table('group').select('*', count='exact').execute()
-            payments = self.supabase.table('payment').select('*').execute()
-            
-            total_users = len(users.data)
-            total_groups = len(groups.data)
-            
-            # Filter active/expired groups
-            active_groups = [g for g in groups.data if g.get('status') == 'active']
-            expired_groups = [g for g in groups.data if g.get('status') == 'expired']
-            
-            # Calculate revenue
-            verified_payments = [p for p in payments.data if p.get('verified')]
-            total_revenue = sum(float(p.get('amount', 0)) for p in verified_payments)
-            
-            pending_payments = [p for p in payments.data if not p.get('verified') and not p.get('rejected')]
-            
+            counters = analytics_store.snapshot()
+            by_status = counters['groups_by_status']
+
             return {
-                "total_users": total_users,
-                "total_groups": total_groups,
-                "active_groups": len(active_groups),
-                "expired_groups": len(expired_groups),
-                "total_revenue": total_revenue,
-                "pending_payments": len(pending_payments)
+                "total_users": counters['total_users'],
+                "total_groups": sum(by_status.values()),
+                "active_groups": by_status.get('active', 0),
+                "expired_groups": by_status.get('expired', 0),
+                "total_revenue": counters['total_revenue'],
+                "pending_payments": counters['pending_payments']
             }
         except Exception as e:
             print(f"❌ Analytics error: {e}")
@@ -55,52 +176,42 @@ class AnalyticsService:
                 "total_revenue": 0,
                 "pending_payments": 0
             }
-    
+
     def get_revenue_trend(self, days=30):
         """Get daily revenue for last N days"""
         try:
-            start_date = datetime.utcnow() - timedelta(days=days)
-            
-            # Get verified payments
-            payments = self.supabase.table('payment').select('*').eq('verified', True).execute()
-            
-            # Group by date
-            revenue_by_date = {}
-            for payment in payments.data:
-                created_at = datetime.fromisoformat(payment['created_at'].replace('Z', '+00:00'))
-                if created_at >= start_date:
-                    date_key = created_at.strftime('%Y-%m-%d')
-                    revenue_by_date[date_key] = revenue_by_date.get(date_key, 0) + float(payment.get('amount', 0))
-            
-            return revenue_by_date
+            if days <= REVENUE_WINDOW_DAYS:
+                return analytics_store.revenue_trend(days)
+            return self._revenue_trend_from_db(days)
         except Exception as e:
             print(f"❌ Revenue trend error: {e}")
             return {}
-    
+
     def get_group_formation_rate(self):
         """Groups created per day"""
         try:
-            groups = self.supabase.table('group').select('*').execute()
-            
+            rows = self._rpc('analytics_groups_by_day')
+            if rows is not None:
+                return {row['day']: int(row['groups']) for row in rows}
+
+            groups = self.supabase.table('group').select('created_at').execute()
+
             groups_by_date = {}
             for group in groups.data:
-                created_at = datetime.fromisoformat(group['created_at'].replace('Z', '+00:00'))
-                date_key = created_at.strftime('%Y-%m-%d')
+                date_key = group['created_at'][:10]
                 groups_by_date[date_key] = groups_by_date.get(date_key, 0) + 1
-            
+
             return groups_by_date
         except Exception as e:
             print(f"❌ Group formation error: {e}")
             return {}
-    
+
     def get_user_retention(self):
         """Users with active groups vs total users"""
         try:
-            users = self.supabase.table('user').select('*').execute()
-            
-            total_users = len(users.data)
-            active_users = len([u for u in users.data if u.get('member_id')])
-            
+            total_users = self._count('user')
+            active_users = self._count('user', lambda q: q.not_.is_('member_id', 'null'))
+
             return {
                 "total": total_users,
                 "active": active_users,
@@ -109,34 +220,41 @@ class AnalyticsService:
         except Exception as e:
             print(f"❌ User retention error: {e}")
             return {"total": 0, "active": 0, "retention_rate": 0}
-    
+
     def get_popular_group_sizes(self):
         """Distribution of group sizes"""
         try:
-            groups = self.supabase.table('group').select('*, member(*)').execute()
-            
             size_distribution = {1: 0, 2: 0, 3: 0, 4: 0}
-            for group in groups.data:
-                size = len(group.get('member', []))
-                if size in size_distribution:
-                    size_distribution[size] += 1
-            
+
+            rows = self._rpc('analytics_group_sizes')
+            if rows is None:
+                # Fallback: one narrow column, sized in Python
+                members = self.supabase.table('member').select('group_id').execute()
+                sizes = Counter(m['group_id'] for m in members.data)
+                rows = [{'size': size, 'groups': n} for size, n in Counter(sizes.values()).items()]
+
+            for row in rows:
+                if int(row['size']) in size_distribution:
+                    size_distribution[int(row['size'])] = int(row['groups'])
+
             return size_distribution
         except Exception as e:
             print(f"❌ Group sizes error: {e}")
             return {1: 0, 2: 0, 3: 0, 4: 0}
-    
+
     def get_churn_analysis(self):
         """Users who left groups or expired"""
         try:
-            now = datetime.utcnow()
-            
-            groups = self.supabase.table('group').select('*, member(*)').eq('status', 'expired').execute()
-            
-            churned_users = sum(len(g.get('member', [])) for g in groups.data)
-            
+            expired_groups = self._count('group', lambda q: q.eq('status', 'expired'))
+
+            # Members of expired groups, counted through the embedded group filter
+            churned_users = self.supabase.table('member')\
+                .select('id, group!inner(status)', count='exact', head=True)\
+                .eq('group.status', 'expired')\
+                .execute().count or 0
+
             return {
-                "expired_groups": len(groups.data),
+                "expired_groups": expired_groups,
                 "churned_users": churned_users
             }
         except Exception as e:
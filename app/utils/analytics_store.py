@@ -0,0 +1,174 @@
+# utils/analytics_store.py - INCREMENTAL ANALYTICS COUNTERS
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Full recount from Supabase at most this often (seconds); corrects drift
+RECONCILE_INTERVAL = int(os.getenv('ANALYTICS_RECONCILE_SECONDS', 900))
+# Daily revenue buckets kept in memory
+REVENUE_WINDOW_DAYS = int(os.getenv('ANALYTICS_REVENUE_WINDOW_DAYS', 90))
+
+
+def _day_key(when=None):
+    """'YYYY-MM-DD' bucket for an ISO string, datetime or now (UTC)"""
+    if when is None:
+        return datetime.utcnow().strftime('%Y-%m-%d')
+    if isinstance(when, datetime):
+        return when.strftime('%Y-%m-%d')
+    return str(when)[:10]
+
+
+class AnalyticsStore:
+    """Running counters for the admin dashboard
+
+    Routes call the record_* methods as events happen, so reads are O(1)
+    instead of scanning tables. Counters live in process memory: the first
+    read (and any read older than RECONCILE_INTERVAL) triggers a full
+    recount from Supabase that replaces them, so restarts and missed
+    events self-correct.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+        self._counters = None
+        self._reconciled_at = 0.0
+
+    # ============ EVENTS ============
+
+    def _apply(self, fn):
+        with self._lock:
+            if self._counters is not None:
+                fn(self._counters)
+
+    def record_signup(self, count=1):
+        """New user account(s) created"""
+        def apply(c):
+            c['total_users'] += count
+        self._apply(apply)
+
+    def record_user_deleted(self, count=1):
+        def apply(c):
+            c['total_users'] = max(0, c['total_users'] - count)
+        self._apply(apply)
+
+    def record_payment_submitted(self):
+        """Group payment waiting for admin verification"""
+        def apply(c):
+            c['pending_payments'] += 1
+        self._apply(apply)
+
+    def record_payment_verified(self, amount, created_at=None, was_pending=True):
+        """Group payment approved - counts towards revenue"""
+        amount = float(amount or 0)
+        day = _day_key(created_at)
+
+        def apply(c):
+            c['total_revenue'] += amount
+            c['revenue_by_day'][day] = c['revenue_by_day'].get(day, 0) + amount
+            if was_pending:
+                c['pending_payments'] = max(0, c['pending_payments'] - 1)
+        self._apply(apply)
+
+    def record_payment_rejected(self, was_pending=True):
+        def apply(c):
+            if was_pending:
+                c['pending_payments'] = max(0, c['pending_payments'] - 1)
+        self._apply(apply)
+
+    def record_group_status_change(self, old_status, new_status, count=1):
+        """Group(s) moved between pending/active/expired"""
+        def apply(c):
+            by_status = c['groups_by_status']
+            by_status[old_status] = max(0, by_status.get(old_status, 0) - count)
+            by_status[new_status] = by_status.get(new_status, 0) + count
+        self._apply(apply)
+
+    def record_wallet_topup(self, amount, when=None):
+        """Wallet credited (M-Pesa callback or manual approval)"""
+        amount = float(amount or 0)
+        day = _day_key(when)
+
+        def apply(c):
+            c['wallet_topups'] += 1
+            c['wallet_topup_total'] += amount
+            c['wallet_topups_by_day'][day] = c['wallet_topups_by_day'].get(day, 0) + amount
+        self._apply(apply)
+
+    # ============ READS ============
+
+    def snapshot(self):
+        """
+        Current counters (reconciles first if never loaded or stale)
+
+        Returns:
+            dict: Copy of all counters
+        """
+        if self._counters is None:
+            self.reconcile()
+        elif time.time() - self._reconciled_at > RECONCILE_INTERVAL:
+            self.reconcile_in_background()
+
+        with self._lock:
+            c = self._counters or self._empty()
+            snap = dict(c)
+            snap['groups_by_status'] = dict(c['groups_by_status'])
+            snap['revenue_by_day'] = dict(c['revenue_by_day'])
+            snap['wallet_topups_by_day'] = dict(c['wallet_topups_by_day'])
+            snap['reconciled_at'] = self._reconciled_at
+            return snap
+
+    def revenue_trend(self, days=30):
+        """Daily verified revenue for the last N days (from counters)"""
+        since = _day_key(datetime.utcnow() - timedelta(days=days))
+        buckets = self.snapshot()['revenue_by_day']
+        return {day: amount for day, amount in sorted(buckets.items()) if day >= since}
+
+    # ============ RECONCILIATION ============
+
+    @staticmethod
+    def _empty():
+        return {
+            "total_users": 0,
+            "groups_by_status": {},
+            "total_revenue": 0.0,
+            "pending_payments": 0,
+            "revenue_by_day": {},
+            "wallet_topups": 0,
+            "wallet_topup_total": 0.0,
+            "wallet_topups_by_day": {}
+        }
+
+    def reconcile(self):
+        """Recount everything from Supabase and replace the counters"""
+        if not self._reconcile_lock.acquire(blocking=self._counters is None):
+            return False  # Another thread is already recounting
+
+        try:
+            from app.utils.analytics_service import AnalyticsService
+            service = AnalyticsService()
+
+            counters = service.compute_counters(REVENUE_WINDOW_DAYS)
+
+            with self._lock:
+                self._counters = counters
+                self._reconciled_at = time.time()
+
+            print(f"✅ Analytics counters reconciled ({counters['total_users']} users)")
+            return True
+        except Exception as e:
+            print(f"❌ Analytics reconcile error: {e}")
+            return False
+        finally:
+            self._reconcile_lock.release()
+
+    def reconcile_in_background(self):
+        """Recount without blocking the caller (stale reads are served meanwhile)"""
+        if not self._reconcile_lock.locked():
+            threading.Thread(target=self.reconcile, daemon=True).start()
+
+
+# One store per process
+analytics_store = AnalyticsStore()
@@ -0,0 +1,130 @@
+# utils/cache.py - TTL CACHE FOR ADMIN READ ENDPOINTS
+
+import os
+import threading
+import time
+
+# Seconds a cached value is served as fresh
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', 30))
+# Extra seconds a stale value is still served while it refreshes in the background
+ADMIN_CACHE_STALE_TTL = float(os.getenv('ADMIN_CACHE_STALE_TTL', 300))
+
+# Keys used by the admin dashboard / database tools
+ADMIN_DASHBOARD = 'admin_dashboard'
+SYSTEM_STATS = 'system_stats'
+LIST_TABLES = 'list_tables'
+
+
+class _Flight:
+    """One in-progress load that concurrent callers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """In-memory cache with stale-while-revalidate and single-flight loads
+
+    - Fresh (age < ttl): returned as is
+    - Stale (age < ttl + stale_ttl): returned immediately, one background
+      thread reloads it
+    - Missing / too old / invalidated: the first caller loads it, concurrent
+      callers for the same key wait for that result instead of loading too
+
+    invalidate() drops the entry, so the next read after a write sees
+    current data.
+    """
+
+    def __init__(self, ttl=ADMIN_CACHE_TTL, stale_ttl=ADMIN_CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._generation = {}
+
+    def get_or_load(self, key, loader):
+        """
+        Get a cached value, loading it with loader() when needed
+
+        Args:
+            key (str): Cache key
+            loader (callable): No-arg function returning the value
+
+        Returns:
+            Cached or freshly loaded value (loader errors are re-raised)
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                value, stored_at = entry
+                age = now - stored_at
+                if age < self.ttl:
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    if key not in self._inflight:
+                        flight = self._inflight[key] = _Flight()
+                        threading.Thread(
+                            target=self._load, args=(key, loader, flight, self._generation.get(key, 0)),
+                            daemon=True
+                        ).start()
+                    return value
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            generation = self._generation.get(key, 0)
+
+        if leader:
+            self._load(key, loader, flight, generation)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, loader, flight, generation):
+        try:
+            flight.value = loader()
+            with self._lock:
+                # Don't store a result that was invalidated while loading
+                if self._generation.get(key, 0) == generation:
+                    self._entries[key] = (flight.value, time.monotonic())
+        except Exception as e:
+            flight.error = e
+            print(f"❌ Cache load error ({key}): {e}")
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.event.set()
+
+    def invalidate(self, *keys):
+        """Drop cached values so the next read reloads them"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+                self._generation[key] = self._generation.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._generation[key] = self._generation.get(key, 0) + 1
+            self._entries.clear()
+            self._inflight.clear()
+
+
+# Shared by admin read endpoints
+admin_cache = TTLCache()
+
+
+def invalidate_admin_stats():
+    """Call after writes that change dashboard numbers (payments, wallets, groups)"""
+    admin_cache.invalidate(ADMIN_DASHBOARD, SYSTEM_STATS, LIST_TABLES)
@@ -0,0 +1,214 @@
+# utils/daraja.py - SAFARICOM DARAJA CLIENT (CACHED TOKEN, POOLED SESSION)
+
+import base64
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.exceptions import NewConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DARAJA_HOSTS = {
+    "sandbox": "https://sandbox.safaricom.co.ke",
+    "production": "https://api.safaricom.co.ke"
+}
+
+# Sandbox defaults (public test shortcode / passkey)
+DEFAULT_SHORTCODE = "174379"
+DEFAULT_PASSKEY = "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"
+
+# Refresh the token this many seconds before Safaricom says it expires
+TOKEN_MARGIN = int(os.getenv('DARAJA_TOKEN_MARGIN', 60))
+# Extra attempts after a connection error or 5xx/429 (STK push: only if the connection was never made)
+RETRIES = int(os.getenv('DARAJA_RETRIES', 2))
+RETRY_BACKOFF = float(os.getenv('DARAJA_RETRY_BACKOFF', 0.5))
+TIMEOUT = (
+    float(os.getenv('DARAJA_CONNECT_TIMEOUT', 5)),
+    float(os.getenv('DARAJA_TIMEOUT', 30))
+)
+POOL_SIZE = int(os.getenv('DARAJA_POOL_SIZE', 20))
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _never_sent(error):
+    """True if the connection failed before any of the request went out"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests wraps urllib3's MaxRetryError, whose reason is the original error
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
+
+class DarajaClient:
+    """One pooled HTTP session and one cached OAuth token per process
+
+    The token is reused until TOKEN_MARGIN seconds before expires_in; when
+    it runs out, the first caller refreshes it under a lock while
+    concurrent callers wait for that result instead of fetching their own.
+    """
+
+    def __init__(self):
+        env = os.getenv('DARAJA_ENV', 'sandbox')
+        # DARAJA_BASE_URL points the app at a local simulator
+        self.base_url = (os.getenv('DARAJA_BASE_URL') or DARAJA_HOSTS.get(env, DARAJA_HOSTS['sandbox'])).rstrip('/')
+        self.consumer_key = os.getenv('MPESA_CONSUMER_KEY')
+        self.consumer_secret = os.getenv('MPESA_CONSUMER_SECRET')
+        self.shortcode = os.getenv('MPESA_SHORTCODE', DEFAULT_SHORTCODE)
+        self.passkey = os.getenv('MPESA_PASSKEY', DEFAULT_PASSKEY)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    # ============ HTTP ============
+
+    def _send(self, method, path, idempotent=False, **kwargs):
+        """
+        Request with timeouts and bounded retries
+
+        Idempotent calls (token, STK query) are retried on any connection
+        error and on 5xx/429. Others (STK push) only when the connection
+        itself could not be made (connect timeout, refused, DNS): a reset
+        or read timeout may come after Safaricom accepted the push, and
+        sending it again would prompt the customer twice.
+        """
+        url = self.base_url + path
+        for attempt in range(RETRIES + 1):
+            try:
+                response = self.session.request(method, url, timeout=TIMEOUT, **kwargs)
+            except requests.ConnectionError as e:
+                if attempt == RETRIES or not (idempotent or _never_sent(e)):
+                    raise
+            else:
+                if not (idempotent and response.status_code in _RETRY_STATUSES) or attempt == RETRIES:
+                    return response
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+    def _authorized(self, method, path, idempotent=False, **kwargs):
+        """Call an API endpoint with the cached token (refreshed once on 401)"""
+        response = self._send(method, path, idempotent,
+                              headers={"Authorization": f"Bearer {self.get_token()}"}, **kwargs)
+        if response.status_code == 401:
+            self.invalidate_token()
+            response = self._send(method, path, idempotent,
+                                  headers={"Authorization": f"Bearer {self.get_token()}"}, **kwargs)
+        return response
+
+    # ============ TOKEN ============
+
+    def get_token(self):
+        """
+        Cached OAuth access token
+
+        Returns:
+            str: Access token
+
+        Raises:
+            RuntimeError: Missing credentials or Safaricom returned no token
+        """
+        if self._token and time.time() < self._token_expires_at:
+            return self._token
+
+        with self._token_lock:
+            # Another thread may have refreshed it while we waited
+            if self._token and time.time() < self._token_expires_at:
+                return self._token
+
+            if not self.consumer_key or not self.consumer_secret:
+                raise RuntimeError("Missing Daraja API credentials in .env")
+
+            response = self._send(
+                'GET', '/oauth/v1/generate',
+                idempotent=True,
+                params={'grant_type': 'client_credentials'},
+                auth=HTTPBasicAuth(self.consumer_key, self.consumer_secret)
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            if not data.get('access_token'):
+                raise RuntimeError(f"Daraja returned no access token: {data}")
+
+            expires_in = int(data.get('expires_in') or 3599)
+            self._token = data['access_token']
+            self._token_expires_at = time.time() + max(expires_in - TOKEN_MARGIN, 0)
+            print(f"✅ Daraja token refreshed (valid {expires_in}s)")
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    # ============ STK ============
+
+    def _password(self):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        password = base64.b64encode((self.shortcode + self.passkey + timestamp).encode('utf-8')).decode('utf-8')
+        return password, timestamp
+
+    def stk_push(self, phone, amount, callback_url, account_reference="MYFI WIFI", description="Wallet Top-up"):
+        """
+        Send an STK push (Lipa na M-Pesa Online) request
+
+        Returns:
+            requests.Response: Safaricom's response
+        """
+        password, timestamp = self._password()
+        payload = {
+            "BusinessShortCode": self.shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": int(amount),
+            "PartyA": phone,
+            "PartyB": self.shortcode,
+            "PhoneNumber": phone,
+            "CallBackURL": callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": description
+        }
+        return self._authorized('POST', '/mpesa/stkpush/v1/processrequest', json=payload)
+
+    def stk_query(self, checkout_request_id):
+        """
+        Query the result of an STK push (safe to retry)
+
+        Returns:
+            requests.Response: Safaricom's response
+        """
+        password, timestamp = self._password()
+        payload = {
+            "BusinessShortCode": self.shortcode,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id
+        }
+        return self._authorized('POST', '/mpesa/stkpushquery/v1/query', idempotent=True, json=payload)
+
+
+# One client (session + token) per process
+daraja = DarajaClient()
+
+
+def format_phone(phone):
+    """Normalize 07XX / 7XX / 2547XX numbers to 2547XX"""
+    phone = str(phone).strip().lstrip('+')
+    if phone.startswith("0"):
+        return "254" + phone[1:]
+    if not phone.startswith("254"):
+        return "254" + phone
+    return phone
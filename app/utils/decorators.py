@@ -2,17 +2,15 @@
 
 from functools import wraps
 from flask import session, redirect, url_for, render_template, jsonify, request
+import hmac
 import os
-from supabase import create_client
+from app.utils.supabase_gateway import get_supabase
 #from functools import wraps
 #from flask import session, redirect, url_for, jsonify, request
 
 
-# Initialize Supabase (if not already done in this file)
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Shared Supabase client (one connection pool per process)
+supabase = get_supabase()
 
 def login_required(f):
     """
@@ -150,6 +148,23 @@ def admin_required(f):
     return decorated_function
 
 
+def cron_required(f):
+    """
+    Decorator for /cron/* jobs: an X-Cron-Secret header matching
+    CRON_SECRET, or a logged-in admin. Without CRON_SECRET only admins
+    get through.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        secret = os.getenv('CRON_SECRET', '')
+        provided = request.headers.get('X-Cron-Secret', '')
+        if not session.get('is_admin') and not (
+            secret and hmac.compare_digest(provided.encode(), secret.encode())
+        ):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+
+        return f(*args, **kwargs)
+    return decorated_function
 
 
 
@@ -0,0 +1,109 @@
+# utils/group_payments.py - GROUP PAYMENT SUBMISSION (ONE ROUND TRIP)
+
+from postgrest.exceptions import APIError
+
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+from app.utils.helpers import calculate_group_progress
+
+_rpc_available = True
+
+
+def _already_submitted(mpesa_code):
+    return f"M-Pesa code {mpesa_code} has already been submitted"
+
+
+def _submit_fallback(user_id, amount, mpesa_code):
+    """Without submit_payment: narrow selects for user -> member/group, then insert"""
+    supabase = get_supabase()
+
+    user_result = supabase.table('user').select('member_id').eq('id', user_id).execute()
+    if not user_result.data:
+        raise LookupError("User not found")
+
+    member_id = user_result.data[0].get('member_id')
+    if not member_id:
+        raise ValueError("You're not in a group")
+
+    member_result = supabase.table('member')\
+        .select('id, name, group(id, name, current_balance, target_amount)')\
+        .eq('id', member_id)\
+        .execute()
+    if not member_result.data:
+        raise LookupError("Member not found")
+
+    member = member_result.data[0]
+    group = member.get('group')
+    if not group:
+        raise LookupError("Group not found")
+
+    try:
+        result = supabase.table('payment').insert({
+            'member_id': member['id'],
+            'group_id': group['id'],
+            'amount': amount,
+            'mpesa_code': mpesa_code,
+            'verified': False,
+            'member_name': member['name'],
+            'group_name': group['name']
+        }).execute()
+    except APIError as e:
+        if e.code == '23505':
+            raise ValueError(_already_submitted(mpesa_code))
+        raise
+    if not result.data:
+        raise RuntimeError("Failed to create payment")
+
+    return {"payment": result.data[0], "group": group}
+
+
+def submit_payment(user_id, amount, mpesa_code=None):
+    """
+    Record an unverified payment from the user's group membership
+
+    Args:
+        user_id (int): Paying user
+        amount (float): KSh
+        mpesa_code (str): Optional M-Pesa code
+
+    Returns:
+        dict: {"payment", "group": {id, name, current_balance, target_amount},
+               "progress": calculate_group_progress(...)}
+
+    Raises:
+        LookupError: User, member or group not found
+        ValueError: User is not in a group, or mpesa_code was already
+                    submitted (sql/014_unique_payment_codes.sql)
+    """
+    global _rpc_available
+
+    mpesa_code = (mpesa_code or '').strip() or None
+    submitted = None
+
+    if _rpc_available:
+        try:
+            submitted = get_supabase().rpc('submit_payment', {
+                'p_user_id': user_id,
+                'p_amount': amount,
+                'p_mpesa_code': mpesa_code
+            }).execute().data
+        except APIError as e:
+            if e.code == 'P0002':
+                raise LookupError(e.message)
+            if e.code == 'P0001':
+                raise ValueError(e.message)
+            if e.code == '23505':
+                raise ValueError(_already_submitted(mpesa_code))
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ submit_payment RPC not installed - using separate queries")
+            _rpc_available = False
+
+    if submitted is None:
+        submitted = _submit_fallback(user_id, amount, mpesa_code)
+
+    group = submitted['group']
+    submitted['progress'] = calculate_group_progress(
+        float(group.get('current_balance') or 0),
+        float(group.get('target_amount') or 0)
+    )
+    return submitted
@@ -0,0 +1,435 @@
+# utils/mpesa_callbacks.py - M-PESA CALLBACK INBOX + BACKGROUND WORKER
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from postgrest.exceptions import APIError
+
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+from app.utils.analytics_store import analytics_store
+from app.utils import wallet_ledger, stk_jobs
+from app.utils.receipt_index import receipt_index
+
+# Threads applying queued callbacks
+WORKERS = int(os.getenv('MPESA_CALLBACK_WORKERS', 2))
+# Failed callbacks are retried by sweep() up to this many attempts
+MAX_ATTEMPTS = int(os.getenv('MPESA_CALLBACK_MAX_ATTEMPTS', 5))
+# Queued rows older than this (seconds) are assumed lost (e.g. restart) and re-queued
+STALE_AFTER = int(os.getenv('MPESA_CALLBACK_STALE_SECONDS', 60))
+# Seconds between in-process sweep() runs (0 disables; /cron/mpesa-callbacks still works)
+SWEEP_INTERVAL = int(os.getenv('MPESA_CALLBACK_SWEEP_INTERVAL', 60))
+
+_queue = queue.Queue()  # (inbox id, parsed callback, attempts so far)
+_queued_ids = set()  # Inbox ids waiting in or being applied from _queue
+_queued_lock = threading.Lock()
+_workers = []
+_workers_lock = threading.Lock()
+_sweeper = None
+_sweeper_lock = threading.Lock()
+_inbox_available = True
+_rpc_available = True
+
+
+def parse_callback(data):
+    """
+    Validate a Daraja STK callback
+
+    Returns:
+        dict: checkout_request_id, result_code, result_desc, amount,
+              mpesa_receipt_number, phone
+
+    Raises:
+        ValueError: Payload is not an STK callback
+    """
+    body = (data or {}).get('Body', {}).get('stkCallback') if isinstance(data, dict) else None
+    if not isinstance(body, dict):
+        raise ValueError("Missing Body.stkCallback")
+
+    checkout_request_id = body.get('CheckoutRequestID')
+    if not checkout_request_id:
+        raise ValueError("Missing CheckoutRequestID")
+
+    try:
+        result_code = int(body.get('ResultCode'))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid ResultCode")
+
+    parsed = {
+        "checkout_request_id": checkout_request_id,
+        "result_code": result_code,
+        "result_desc": body.get('ResultDesc'),
+        "amount": None,
+        "mpesa_receipt_number": None,
+        "phone": None
+    }
+
+    for item in body.get('CallbackMetadata', {}).get('Item', []):
+        if item.get('Name') == 'Amount':
+            parsed['amount'] = item.get('Value')
+        elif item.get('Name') == 'MpesaReceiptNumber':
+            parsed['mpesa_receipt_number'] = item.get('Value')
+        elif item.get('Name') == 'PhoneNumber':
+            parsed['phone'] = str(item.get('Value'))
+
+    if result_code == 0 and (parsed['amount'] is None or not parsed['mpesa_receipt_number']):
+        raise ValueError("Successful callback without Amount/MpesaReceiptNumber")
+
+    return parsed
+
+
+def enqueue(data):
+    """
+    Store a callback durably and hand it to the worker
+
+    One insert into mpesa_callback; a callback whose CheckoutRequestID or
+    receipt is already stored is reported as a duplicate and not queued.
+
+    Returns:
+        dict: {"checkout_request_id", "duplicate"}
+
+    Raises:
+        ValueError: Invalid payload
+    """
+    global _inbox_available
+
+    callback = parse_callback(data)
+    inbox_id = None
+
+    if _inbox_available:
+        try:
+            result = get_supabase().table('mpesa_callback').upsert({
+                'checkout_request_id': callback['checkout_request_id'],
+                'mpesa_receipt_number': callback['mpesa_receipt_number'],
+                'result_code': callback['result_code'],
+                'payload': data
+            }, on_conflict='checkout_request_id', ignore_duplicates=True).execute()
+
+            if not result.data:
+                return {"checkout_request_id": callback['checkout_request_id'], "duplicate": True}
+            inbox_id = result.data[0]['id']
+        except APIError as e:
+            if e.code == '23505':  # Same receipt under another CheckoutRequestID
+                return {"checkout_request_id": callback['checkout_request_id'], "duplicate": True}
+            if e.code not in ('42P01', 'PGRST205'):
+                raise
+            print("⚠️ mpesa_callback table missing - callbacks are queued in memory only")
+            _inbox_available = False
+
+    _put(inbox_id, callback, 0)
+    start_workers()
+    return {"checkout_request_id": callback['checkout_request_id'], "duplicate": False}
+
+
+def _release_receipt(supabase, tx, receipt, checkout_request_id):
+    """
+    Take the receipt off another transaction before this push stores it
+
+    Returns:
+        dict: {"id", "user_id"} of a successful transaction that already
+              holds the receipt (the push must not be credited), otherwise None
+    """
+    other = supabase.table('transactions')\
+        .select('id, user_id, status')\
+        .eq('mpesa_receipt_number', receipt)\
+        .neq('id', tx['id'])\
+        .limit(1)\
+        .execute()
+    if not other.data:
+        return None
+    if other.data[0]['status'] == 'success':
+        return other.data[0]
+
+    # Pending/rejected manual submission of the same receipt: the push settles it
+    released = supabase.table('transactions').update({
+        'status': 'failed',
+        'mpesa_receipt_number': None,
+        'result_desc': f"Receipt {receipt} credited by STK push {checkout_request_id}",
+        'updated_at': datetime.now().isoformat()
+    }).eq('id', other.data[0]['id']).neq('status', 'success').execute()
+    if not released.data:
+        return other.data[0]  # Approved in the meantime
+    return None
+
+
+def _apply_success_fallback(callback):
+    """Credit first, then mark success, so a failed credit is simply retried"""
+    supabase = get_supabase()
+    tx_result = supabase.table('transactions')\
+        .select('id, user_id, amount, status')\
+        .eq('checkout_request_id', callback['checkout_request_id'])\
+        .order('id')\
+        .limit(1)\
+        .execute()
+    if not tx_result.data:
+        return None
+
+    tx = tx_result.data[0]
+    if tx['status'] == 'success':
+        return {"applied": False, "user_id": tx['user_id'], "amount": tx['amount']}
+
+    receipt = callback['mpesa_receipt_number']
+    if receipt:
+        conflict = _release_receipt(supabase, tx, receipt, callback['checkout_request_id'])
+        if conflict:
+            supabase.table('transactions').update({
+                'status': 'failed',
+                'result_desc': f"Receipt {receipt} already credited (transaction {conflict['id']})",
+                'updated_at': datetime.now().isoformat()
+            }).eq('id', tx['id']).execute()
+            return {
+                "applied": False,
+                "conflict": conflict['id'],
+                "conflict_user_id": conflict['user_id'],
+                "user_id": tx['user_id'],
+                "amount": tx['amount']
+            }
+
+    amount = callback['amount'] if callback['amount'] is not None else tx['amount']
+    entry = wallet_ledger.credit(
+        tx['user_id'], amount, 'mpesa_topup',
+        reference=callback['checkout_request_id'],
+        wallet_status='approved'
+    )
+
+    update = {
+        'status': 'success',
+        'result_desc': callback['result_desc'],
+        'updated_at': datetime.now().isoformat()
+    }
+    if receipt:
+        update['mpesa_receipt_number'] = receipt
+    try:
+        supabase.table('transactions').update(update).eq('id', tx['id']).execute()
+    except APIError as e:
+        if e.code != '23505':
+            raise
+        # A submission claimed the receipt after _release_receipt; the credit
+        # has posted, so record the success and leave the receipt to review
+        print(f"⚠️ Receipt {receipt} stored on another transaction - {callback['checkout_request_id']} saved without it")
+        update.pop('mpesa_receipt_number')
+        supabase.table('transactions').update(update).eq('id', tx['id']).execute()
+
+    return {
+        "applied": True,
+        "user_id": tx['user_id'],
+        "amount": amount,
+        "balance": entry['balance'],
+        "duplicate": entry['duplicate']
+    }
+
+
+def _apply_success(callback):
+    """
+    Credit the wallet for a successful payment and mark the transaction success
+
+    Returns:
+        dict: {"applied", "user_id", "amount"} plus "balance" and "duplicate"
+              when applied, or "conflict" and "conflict_user_id" (the
+              transaction and its owner) when the receipt was already
+              credited; None if no transaction has this CheckoutRequestID
+
+    Raises:
+        RuntimeError: Receipt stored by another transaction mid-write (retry)
+    """
+    global _rpc_available
+
+    if _rpc_available:
+        try:
+            data = get_supabase().rpc('apply_stk_payment', {
+                'p_checkout_request_id': callback['checkout_request_id'],
+                'p_amount': callback['amount'],
+                'p_receipt': callback['mpesa_receipt_number'],
+                'p_result_desc': callback['result_desc']
+            }).execute().data
+            if not data.get('found'):
+                return None
+            if data['applied']:
+                wallet_ledger.forget(data['user_id'])
+            return data
+        except APIError as e:
+            if e.code == '23505':
+                # A submission stored the receipt mid-transaction; nothing was written
+                raise RuntimeError(f"Receipt {callback['mpesa_receipt_number']} claimed concurrently")
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ apply_stk_payment RPC not installed - crediting before the status update")
+            _rpc_available = False
+
+    return _apply_success_fallback(callback)
+
+
+def apply_callback(callback):
+    """
+    Apply one callback: wallet credit + transaction status
+
+    Idempotent: the credit is keyed on the CheckoutRequestID (one push, one
+    payment) and the transaction is only marked success once the credit
+    has posted, so a callback that fails halfway is safe to retry. A
+    receipt already held by a manual submission is taken over, unless that
+    submission was credited (then the push is not credited again). Also
+    used for STK query results (stk_reconciler), which carry no receipt or
+    amount: the stored transaction amount is credited.
+    """
+    stk_jobs.ensure_transaction(callback['checkout_request_id'])
+
+    if callback['result_code'] != 0:
+        tx_result = get_supabase().table('transactions').update({
+            'status': 'failed',
+            'result_desc': callback['result_desc'],
+            'updated_at': datetime.now().isoformat()
+        }).eq('checkout_request_id', callback['checkout_request_id']).eq('status', 'pending').execute()
+
+        if tx_result.data:
+            stk_jobs.notify_result(callback['checkout_request_id'], tx_result.data[0]['user_id'], False, callback['result_desc'])
+        print(f"✗ Payment failed: {callback['result_desc']}")
+        return
+
+    result = _apply_success(callback)
+    if result is None:
+        # Callback beat the insert made after Daraja accepted the push; sweep() retries it
+        raise RuntimeError("Transaction not recorded yet")
+
+    # Only once the receipt is in the database
+    if callback['mpesa_receipt_number']:
+        receipt_index.add(callback['mpesa_receipt_number'])
+
+    if result.get('conflict'):
+        print(f"⚠️ Receipt {callback['mpesa_receipt_number']} already credited by transaction {result['conflict']} - "
+              f"{callback['checkout_request_id']} not credited again")
+        if str(result.get('conflict_user_id')) == str(result['user_id']):
+            stk_jobs.notify_result(callback['checkout_request_id'], result['user_id'], True, "Payment already credited to your wallet")
+        else:
+            # Someone else's submission was credited with this receipt: never tell this payer it is theirs
+            stk_jobs.notify_result(
+                callback['checkout_request_id'], result['user_id'], False,
+                f"Receipt {callback['mpesa_receipt_number']} was already used by another account. "
+                f"Contact support to review this payment."
+            )
+        return
+
+    if not result['applied']:
+        print(f"⚠️ Transaction {callback['checkout_request_id']} already applied")
+        return
+
+    user_id, amount = result['user_id'], result['amount']
+    if not result['duplicate']:
+        analytics_store.record_wallet_topup(amount)
+    stk_jobs.notify_result(callback['checkout_request_id'], user_id, True, f"KSh {amount} added to your wallet")
+    print(f"✓ Wallet updated: User {user_id}, New balance: {result['balance']}")
+
+
+def _mark(inbox_id, status, attempts=None, error=None):
+    if inbox_id is None or not _inbox_available:
+        return
+    update = {'status': status, 'error': error, 'processed_at': datetime.utcnow().isoformat()}
+    if attempts is not None:
+        update['attempts'] = attempts
+    try:
+        get_supabase().table('mpesa_callback').update(update).eq('id', inbox_id).execute()
+    except Exception as e:
+        print(f"⚠️ Failed to mark callback {inbox_id} {status}: {e}")
+
+
+def _put(inbox_id, callback, attempts):
+    """Queue a callback unless its inbox row is already queued here"""
+    with _queued_lock:
+        if inbox_id is not None:
+            if inbox_id in _queued_ids:
+                return False
+            _queued_ids.add(inbox_id)
+    _queue.put((inbox_id, callback, attempts))
+    return True
+
+
+def _work():
+    while True:
+        inbox_id, callback, attempts = _queue.get()
+        try:
+            apply_callback(callback)
+            _mark(inbox_id, 'done', attempts + 1)
+        except Exception as e:
+            print(f"❌ M-Pesa callback {callback['checkout_request_id']} failed: {e}")
+            _mark(inbox_id, 'failed', attempts + 1, str(e))
+        finally:
+            with _queued_lock:
+                _queued_ids.discard(inbox_id)
+            _queue.task_done()
+
+
+def start_workers():
+    """Start the worker threads once per process"""
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(WORKERS):
+            worker = threading.Thread(target=_work, name=f'mpesa-callback-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def sweep():
+    """
+    Re-queue callbacks that were stored but never finished
+
+    Picks up rows left 'queued' by a restart and 'failed' rows with
+    attempts left, skipping rows already in this process's queue. Also
+    records accepted STK pushes whose transaction insert failed. Runs
+    every SWEEP_INTERVAL seconds (start_sweeper) and from /cron/mpesa-callbacks.
+
+    Returns:
+        int: Callbacks re-queued
+    """
+    stk_jobs.save_unsaved()
+
+    if not _inbox_available:
+        return 0
+
+    cutoff = (datetime.utcnow() - timedelta(seconds=STALE_AFTER)).isoformat()
+    rows = get_supabase().table('mpesa_callback')\
+        .select('id, payload, attempts')\
+        .or_(f'and(status.eq.queued,received_at.lt."{cutoff}"),and(status.eq.failed,attempts.lt.{MAX_ATTEMPTS})')\
+        .order('received_at')\
+        .limit(500)\
+        .execute()
+
+    requeued = 0
+    for row in rows.data or []:
+        try:
+            if _put(row['id'], parse_callback(row['payload']), row.get('attempts') or 0):
+                requeued += 1
+        except ValueError as e:
+            _mark(row['id'], 'failed', MAX_ATTEMPTS, str(e))
+
+    if requeued:
+        start_workers()
+    return requeued
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            requeued = sweep()
+            if requeued:
+                print(f"🔁 Re-queued {requeued} M-Pesa callbacks")
+        except Exception as e:
+            print(f"❌ M-Pesa callback sweep error: {e}")
+
+
+def start_sweeper():
+    """Start the periodic sweep once per process"""
+    global _sweeper
+    if SWEEP_INTERVAL <= 0:
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, name='mpesa-callback-sweeper', daemon=True)
+            _sweeper.start()
+
+
+def pending_count():
+    """Callbacks waiting in this process's queue"""
+    return _queue.qsize()
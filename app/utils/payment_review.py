@@ -0,0 +1,347 @@
+# utils/payment_review.py - BULK ADMIN APPROVAL / REJECTION OF MANUAL PAYMENTS
+
+import math
+import os
+from datetime import datetime
+
+from postgrest.exceptions import APIError
+
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+from app.utils.analytics_store import analytics_store
+from app.utils.cache import invalidate_admin_stats
+from app.utils import wallet_ledger
+
+# Items accepted per bulk request
+MAX_ITEMS = int(os.getenv('BULK_REVIEW_MAX_ITEMS', 500))
+
+# Per-item outcomes
+CONFIRMED = 'confirmed'
+REJECTED = 'rejected'
+INVALID = 'invalid'
+NOT_FOUND = 'not_found'
+DUPLICATE = 'duplicate'
+NOT_PENDING = 'not_pending'
+USER_NOT_FOUND = 'user_not_found'
+ERROR = 'error'
+
+_MESSAGES = {
+    CONFIRMED: "Payment confirmed",
+    REJECTED: "Payment rejected",
+    NOT_FOUND: "No pending transaction with this M-Pesa code",
+    DUPLICATE: "M-Pesa code was already credited",
+    NOT_PENDING: "Transaction is no longer pending",
+    USER_NOT_FOUND: "User not found"
+}
+
+_rpc_available = True
+
+
+def _outcome(item, status, message=None, **extra):
+    return {
+        "user_id": item.get('user_id'),
+        "mpesa_code": item.get('mpesa_code'),
+        "status": status,
+        "ok": status in (CONFIRMED, REJECTED),
+        "message": message or _MESSAGES.get(status),
+        **extra
+    }
+
+
+def _pending_by_user(user_ids):
+    """All pending transactions of these users in one query, newest first"""
+    if not user_ids:
+        return {}
+    rows = get_supabase().table('transactions')\
+        .select('id, user_id, amount, mpesa_receipt_number, created_at')\
+        .eq('status', 'pending')\
+        .in_('user_id', list(user_ids))\
+        .order('created_at', desc=True)\
+        .execute().data or []
+
+    pending = {}
+    for row in rows:
+        pending.setdefault(str(row['user_id']), []).append(row)
+    return pending
+
+
+def _normalize(raw, need_amount):
+    """Validated copy of one request item, or (None, error message)"""
+    if not isinstance(raw, dict) or not raw.get('user_id'):
+        return None, "user_id required"
+
+    # Checked here so one bad item can't fail the whole batch in the database
+    if isinstance(raw['user_id'], bool):
+        return None, "user_id must be a number"
+    try:
+        user_id = int(str(raw['user_id']).strip())
+    except ValueError:
+        return None, "user_id must be a number"
+
+    item = {
+        "user_id": user_id,
+        "mpesa_code": str(raw.get('mpesa_code') or '').upper().strip() or None,
+        "notes": str(raw.get('notes') or '').strip()
+    }
+
+    if need_amount:
+        if not item['mpesa_code']:
+            return None, "mpesa_code required"
+        try:
+            item['amount'] = float(raw.get('verified_amount', raw.get('amount')))
+        except (TypeError, ValueError):
+            return None, "verified_amount required"
+        if not math.isfinite(item['amount']):
+            return None, "verified_amount must be a number"
+        if item['amount'] < 1:
+            return None, "Amount must be at least 1 KSh"
+    return item, None
+
+
+def _match(item, pending, claimed):
+    """The pending transaction an item refers to (by code, else the user's newest)"""
+    for tx in pending.get(str(item['user_id']), []):
+        if tx['id'] in claimed:
+            continue
+        code = (tx.get('mpesa_receipt_number') or '').upper().strip()
+        if item['mpesa_code'] is None or code == item['mpesa_code']:
+            return tx
+    return None
+
+
+def _prepare(raw_items, need_amount):
+    """Validate items and match them to pending transactions (one query)"""
+    results = [None] * len(raw_items)
+    items = []
+    for index, raw in enumerate(raw_items):
+        item, error = _normalize(raw, need_amount)
+        if error:
+            results[index] = _outcome(raw if isinstance(raw, dict) else {}, INVALID, error)
+        else:
+            items.append((index, item))
+
+    pending = _pending_by_user({str(item['user_id']) for _, item in items})
+    matched = []
+    claimed = set()
+    for index, item in items:
+        tx = _match(item, pending, claimed)
+        if tx is None:
+            results[index] = _outcome(item, NOT_FOUND, None if item['mpesa_code'] else "No pending transaction found")
+            continue
+        claimed.add(tx['id'])
+        matched.append((index, item, tx))
+    return results, matched
+
+
+def _confirm_fallback(entries):
+    """Without confirm_manual_payments: claim, then credit, one item at a time"""
+    supabase = get_supabase()
+    outcomes = []
+    for entry in entries:
+        try:
+            claimed = supabase.table('transactions').update({
+                'status': 'success',
+                'amount': entry['amount'],
+                'mpesa_receipt_number': entry['reference'],
+                'result_desc': entry['result_desc'],
+                'updated_at': datetime.now().isoformat()
+            }).eq('id', entry['transaction_id']).eq('status', 'pending').execute()
+        except APIError as e:
+            outcomes.append({"status": ERROR, "message": e.message})
+            continue
+
+        if not claimed.data:
+            outcomes.append({"status": NOT_PENDING})
+            continue
+
+        try:
+            posted = wallet_ledger.credit(entry['user_id'], entry['amount'], 'mpesa_topup',
+                                          reference=entry['reference'], wallet_status='approved')
+        except LookupError:
+            posted = None
+        except Exception as e:
+            if not isinstance(e, wallet_ledger.UncertainPost):
+                # Nothing was credited: put the claim back
+                supabase.table('transactions').update({'status': 'pending'}).eq('id', entry['transaction_id']).execute()
+            outcomes.append({"status": ERROR, "message": str(e)})
+            continue
+
+        if posted is None or posted['duplicate']:
+            # Put the claim back so the row can be reviewed again
+            supabase.table('transactions').update({'status': 'pending'}).eq('id', entry['transaction_id']).execute()
+            outcomes.append({"status": USER_NOT_FOUND if posted is None else DUPLICATE})
+        else:
+            outcomes.append({"status": CONFIRMED, "balance": posted['balance']})
+    return outcomes
+
+
+def _confirm_entries(entries):
+    global _rpc_available
+
+    if _rpc_available:
+        try:
+            return get_supabase().rpc('confirm_manual_payments', {'p_items': entries}).execute().data or []
+        except APIError as e:
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ confirm_manual_payments RPC not installed - confirming one by one")
+            _rpc_available = False
+    return _confirm_fallback(entries)
+
+
+def _settle_credited(entry):
+    """
+    Mark a pending transaction success when its receipt was already credited
+    to the same user (a credit that posted before the status update failed)
+
+    Returns:
+        dict: Confirmed outcome, or None if the credit is not this user's
+    """
+    posted = wallet_ledger.find_entry('mpesa_topup', entry['reference'])
+    if not posted or str(posted['user_id']) != str(entry['user_id']):
+        return None
+
+    settled = get_supabase().table('transactions').update({
+        'status': 'success',
+        'amount': float(posted['amount']),
+        'mpesa_receipt_number': entry['reference'],
+        'result_desc': f"{entry['result_desc']} (credit already posted)",
+        'updated_at': datetime.now().isoformat()
+    }).eq('id', entry['transaction_id']).eq('status', 'pending').execute()
+    if not settled.data:
+        return None
+
+    wallet_ledger.forget(entry['user_id'])
+    wallet = wallet_ledger.get_wallet(entry['user_id']) or {}
+    return {
+        "status": CONFIRMED,
+        "balance": wallet.get('wallet_balance', 0),
+        "message": "Payment was already credited; transaction marked confirmed"
+    }
+
+
+def confirm_one(transaction_id, user_id, amount, reference, result_desc):
+    """
+    Approve one pending transaction: status and credit in one database call
+
+    A receipt already credited to the same user means an earlier approval
+    posted the credit but never marked the row; it is marked now instead of
+    being refused forever.
+
+    Returns:
+        dict: {"status", "balance"?, "message"?} with a status constant
+    """
+    entry = {
+        "transaction_id": transaction_id,
+        "user_id": user_id,
+        "amount": float(amount),
+        "reference": reference,
+        "result_desc": result_desc
+    }
+    outcome = _confirm_entries([entry])[0]
+
+    if outcome['status'] == CONFIRMED:
+        wallet_ledger.forget(user_id)
+        analytics_store.record_wallet_topup(entry['amount'])
+        invalidate_admin_stats()
+    elif outcome['status'] == DUPLICATE:
+        settled = _settle_credited(entry)
+        if settled:
+            invalidate_admin_stats()
+            return settled
+    return outcome
+
+
+def confirm_payments(raw_items):
+    """
+    Approve many manual payments
+
+    Args:
+        raw_items (list): [{"user_id", "verified_amount", "mpesa_code", "notes"?}]
+
+    Returns:
+        list: One result per item, in order: {"user_id", "mpesa_code", "status",
+              "ok", "message", "new_balance"?}
+    """
+    results, matched = _prepare(raw_items, need_amount=True)
+
+    entries = [{
+        "transaction_id": tx['id'],
+        "user_id": item['user_id'],
+        "amount": item['amount'],
+        "reference": item['mpesa_code'],
+        "result_desc": f"Approved by admin. {item['notes']}".strip()
+    } for _, item, tx in matched]
+
+    outcomes = _confirm_entries(entries) if entries else []
+
+    confirmed = 0
+    for (index, item, _), outcome in zip(matched, outcomes):
+        if outcome['status'] == CONFIRMED:
+            confirmed += 1
+            balance = float(outcome['balance'])
+            wallet_ledger.forget(item['user_id'])
+            analytics_store.record_wallet_topup(item['amount'])
+            results[index] = _outcome(item, CONFIRMED, new_balance=balance)
+        else:
+            results[index] = _outcome(item, outcome['status'], outcome.get('message'))
+
+    if confirmed:
+        invalidate_admin_stats()
+    print(f"✅ Bulk approve: {confirmed}/{len(raw_items)} confirmed")
+    return results
+
+
+def reject_payments(raw_items, reason=None):
+    """
+    Reject many manual payments
+
+    Args:
+        raw_items (list): [{"user_id", "mpesa_code"?, "reason"?}]; without a
+            code the user's newest pending transaction is rejected
+        reason (str): Used for items without their own reason
+
+    Returns:
+        list: One result per item, in order
+    """
+    results, matched = _prepare(raw_items, need_amount=False)
+    supabase = get_supabase()
+    now = datetime.now().isoformat()
+
+    # One update per distinct reason (usually just one)
+    by_reason = {}
+    for index, item, tx in matched:
+        item_reason = str(raw_items[index].get('reason') or reason or '').strip()
+        if not item_reason:
+            results[index] = _outcome(item, INVALID, "Rejection reason required")
+            continue
+        by_reason.setdefault(item_reason, []).append((index, item, tx))
+
+    rejected_users = set()
+    for item_reason, group in by_reason.items():
+        try:
+            updated = supabase.table('transactions').update({
+                'status': 'failed',
+                'result_desc': f"Rejected by admin: {item_reason}",
+                'updated_at': now
+            }).in_('id', [tx['id'] for _, _, tx in group]).eq('status', 'pending').execute()
+        except Exception as e:
+            for index, item, _ in group:
+                results[index] = _outcome(item, ERROR, str(e))
+            continue
+
+        done = {row['id'] for row in updated.data or []}
+        for index, item, tx in group:
+            if tx['id'] in done:
+                rejected_users.add(item['user_id'])
+                results[index] = _outcome(item, REJECTED)
+            else:
+                results[index] = _outcome(item, NOT_PENDING)
+
+    if rejected_users:
+        supabase.table('user').update({'wallet_status': 'rejected'}).in_('id', list(rejected_users)).execute()
+        for user_id in rejected_users:
+            wallet_ledger.forget(user_id)
+        invalidate_admin_stats()
+
+    print(f"❌ Bulk reject: {sum(1 for r in results if r['status'] == REJECTED)}/{len(raw_items)} rejected")
+    return results
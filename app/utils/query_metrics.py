@@ -0,0 +1,206 @@
+# utils/query_metrics.py - PER-REQUEST SUPABASE QUERY INSTRUMENTATION
+
+import os
+import re
+import threading
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlsplit
+
+from flask import g, has_app_context, request
+
+# Same query shape repeated this many times in one request is flagged as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', 3))
+METRICS_ENABLED = os.getenv('QUERY_METRICS_ENABLED', 'true').lower() != 'false'
+
+# Params whose value is part of the query shape (not user data)
+_SHAPE_PARAMS = {'select', 'order', 'on_conflict', 'columns'}
+_FILTER_VALUE = re.compile(r'^(not\.)?([a-z]+)\.')
+_LOGIC_VALUE = re.compile(r'\b([a-z_]+)\.(not\.)?([a-z]+)\.[^,()]*')
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+def query_shape(method, url, params=None):
+    """
+    Reduce a PostgREST request to its shape (table + filters, no values)
+
+    Args:
+        method (str): HTTP method
+        url (str): Request path, e.g. '/user' or '/rpc/get_user_contacts'
+        params: Query params (httpx QueryParams, dict or None)
+
+    Returns:
+        tuple: (table, shape) e.g. ('user', 'GET user?id=eq&select=username')
+    """
+    path = urlsplit(str(url)).path.rstrip('/')
+    table = path.rsplit('/', 2)
+    table = f"rpc:{table[-1]}" if len(table) > 1 and table[-2] == 'rpc' else table[-1]
+
+    parts = []
+    for key, value in (params.multi_items() if hasattr(params, 'multi_items') else (params or {}).items()):
+        value = str(value)
+        if key in _SHAPE_PARAMS:
+            parts.append(f"{key}={value}")
+        elif key in ('or', 'and'):
+            parts.append(f"{key}={_LOGIC_VALUE.sub(lambda m: f'{m.group(1)}.{m.group(3)}', value)}")
+        else:
+            match = _FILTER_VALUE.match(value)
+            parts.append(f"{key}={match.group(0).rstrip('.')}" if match else key)
+
+    shape = f"{method} {table}"
+    if parts:
+        shape += '?' + '&'.join(sorted(parts))
+    return table, shape
+
+
+def record_query(method, url, params, duration, status=None):
+    """Record one Supabase round-trip against the current request/event"""
+    if not METRICS_ENABLED or not has_app_context():
+        return
+
+    table, shape = query_shape(method, url, params)
+    log = g.setdefault('supabase_queries', [])
+    log.append({
+        "table": table,
+        "shape": shape,
+        "ms": duration * 1000,
+        "status": status
+    })
+
+
+def current_queries():
+    """Queries recorded so far in this request/event"""
+    if not has_app_context():
+        return []
+    return g.get('supabase_queries', [])
+
+
+def summarize(queries):
+    """
+    Summarize one request's queries
+
+    Returns:
+        dict: count, total_ms, per-table counts and N+1 suspects
+    """
+    shapes = Counter(q['shape'] for q in queries)
+    return {
+        "count": len(queries),
+        "total_ms": round(sum(q['ms'] for q in queries), 2),
+        "tables": dict(Counter(q['table'] for q in queries)),
+        "n_plus_one": {shape: n for shape, n in shapes.items() if n >= N_PLUS_ONE_THRESHOLD}
+    }
+
+
+def finish(name):
+    """Fold the current request's queries into the process-wide aggregates"""
+    summary = summarize(current_queries())
+    if summary['count'] == 0:
+        return summary
+
+    with _lock:
+        stats = _endpoints.setdefault(name, {
+            "requests": 0,
+            "queries": 0,
+            "db_ms": 0.0,
+            "max_queries": 0,
+            "n_plus_one_requests": 0,
+            "tables": Counter(),
+            "n_plus_one_shapes": Counter()
+        })
+        stats['requests'] += 1
+        stats['queries'] += summary['count']
+        stats['db_ms'] += summary['total_ms']
+        stats['max_queries'] = max(stats['max_queries'], summary['count'])
+        stats['tables'].update(summary['tables'])
+        if summary['n_plus_one']:
+            stats['n_plus_one_requests'] += 1
+            stats['n_plus_one_shapes'].update(summary['n_plus_one'])
+
+    for shape, n in summary['n_plus_one'].items():
+        print(f"⚠️ N+1 suspected in {name}: {shape} x{n}")
+
+    return summary
+
+
+def get_stats():
+    """
+    Process-wide query aggregates per endpoint / Socket.IO event
+
+    Returns:
+        list: One entry per endpoint, worst (most queries per request) first
+    """
+    with _lock:
+        rows = []
+        for name, stats in _endpoints.items():
+            rows.append({
+                "endpoint": name,
+                "requests": stats['requests'],
+                "queries": stats['queries'],
+                "avg_queries": round(stats['queries'] / stats['requests'], 2),
+                "max_queries": stats['max_queries'],
+                "avg_db_ms": round(stats['db_ms'] / stats['requests'], 2),
+                "n_plus_one_requests": stats['n_plus_one_requests'],
+                "tables": dict(stats['tables']),
+                "n_plus_one_shapes": dict(stats['n_plus_one_shapes'].most_common(5))
+            })
+    rows.sort(key=lambda r: r['avg_queries'], reverse=True)
+    return rows
+
+
+def reset_stats():
+    """Clear all aggregates"""
+    with _lock:
+        _endpoints.clear()
+
+
+def track_queries(event_name):
+    """
+    Decorator to aggregate queries for a Socket.IO event handler
+
+    Usage:
+        @socketio.on('call_user')
+        @track_queries('call_user')
+        def handle_call_user(data):
+            ...
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.supabase_queries = []
+            try:
+                return f(*args, **kwargs)
+            finally:
+                finish(f"socket:{event_name}")
+        return decorated_function
+    return decorator
+
+
+def init_query_metrics(app):
+    """
+    Attach per-request query accounting to the Flask app
+
+    Adds `Server-Timing` and `X-DB-Queries` headers to every response that
+    touched Supabase and folds the request into the aggregates served by
+    /admin/tools/api/query-stats.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_query_log():
+        g.supabase_queries = []
+
+    @app.after_request
+    def _report_queries(response):
+        summary = finish(request.endpoint or request.path)
+        if summary['count']:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={summary["total_ms"]:.1f};desc="{summary["count"]} queries"'
+            )
+            response.headers['X-DB-Queries'] = str(summary['count'])
+            if summary['n_plus_one']:
+                response.headers['X-DB-N-Plus-One'] = str(len(summary['n_plus_one']))
+        return response
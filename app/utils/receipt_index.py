@@ -0,0 +1,109 @@
+# utils/receipt_index.py - IN-MEMORY INDEX OF KNOWN M-PESA RECEIPT NUMBERS
+
+import threading
+import time
+
+from app.utils.supabase_gateway import get_supabase
+
+PAGE_SIZE = 1000
+
+
+def normalize(code):
+    return str(code or '').upper().strip()
+
+
+class ReceiptIndex:
+    """Every mpesa_receipt_number already in transactions, as a set
+
+    Loaded once in the background at startup and updated on every insert,
+    so a resubmitted code is refused without a query. Submissions claim a
+    code under the lock before inserting, so two concurrent requests in
+    this process can't both pass; across processes the unique index from
+    sql/010 decides. Until the first load finishes (or if it failed),
+    is_loaded() is False and callers check Supabase instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._codes = set()
+        self._loaded = False
+
+    def load(self):
+        """Read all receipt numbers from Supabase (keyset pages by id)"""
+        if not self._load_lock.acquire(blocking=False):
+            return False  # Already loading
+
+        try:
+            started = time.perf_counter()
+            supabase = get_supabase()
+            codes = set()
+            after_id = 0
+            while True:
+                page = supabase.table('transactions')\
+                    .select('id, mpesa_receipt_number')\
+                    .not_.is_('mpesa_receipt_number', 'null')\
+                    .gt('id', after_id)\
+                    .order('id')\
+                    .limit(PAGE_SIZE)\
+                    .execute().data or []
+                codes.update(normalize(row['mpesa_receipt_number']) for row in page)
+                if len(page) < PAGE_SIZE:
+                    break
+                after_id = page[-1]['id']
+
+            with self._lock:
+                # Keep codes added while we were paging
+                self._codes |= codes
+                self._loaded = True
+            print(f"✅ Receipt index loaded ({len(codes)} codes, {(time.perf_counter() - started) * 1000:.0f}ms)")
+            return True
+        except Exception as e:
+            print(f"❌ Receipt index load failed: {e}")
+            return False
+        finally:
+            self._load_lock.release()
+
+    def load_in_background(self):
+        threading.Thread(target=self.load, name='receipt-index', daemon=True).start()
+
+    def is_loaded(self):
+        return self._loaded
+
+    def contains(self, code):
+        with self._lock:
+            return normalize(code) in self._codes
+
+    def claim(self, code):
+        """Reserve a code before inserting it; False if it is already known"""
+        code = normalize(code)
+        with self._lock:
+            if code in self._codes:
+                return False
+            self._codes.add(code)
+            return True
+
+    def release(self, code):
+        """
+        Undo claim() when the insert failed for another reason
+
+        Not called when the code turns out to be stored already (found by
+        the fallback check or refused with 23505): it is taken either way,
+        so keeping the claim is harmless.
+        """
+        with self._lock:
+            self._codes.discard(normalize(code))
+
+    def add(self, code):
+        """Record a receipt written by another path (e.g. STK callbacks)"""
+        if code:
+            with self._lock:
+                self._codes.add(normalize(code))
+
+    def size(self):
+        with self._lock:
+            return len(self._codes)
+
+
+# One index per process
+receipt_index = ReceiptIndex()
@@ -0,0 +1,190 @@
+# utils/statement_reconciler.py - MATCH M-PESA STATEMENT CSV AGAINST PENDING MANUAL PAYMENTS
+
+import csv
+import io
+import os
+import re
+
+from app.utils.supabase_gateway import get_supabase
+
+# Unmatched / mismatched rows listed in the report (counts are always complete)
+REPORT_LIMIT = int(os.getenv('STATEMENT_REPORT_LIMIT', 200))
+PAGE_SIZE = 1000
+
+# Header aliases used by M-Pesa org portal and app statement exports
+_COLUMNS = {
+    "receipt": ("receipt no.", "receipt no", "receipt", "transaction id", "transaction code"),
+    "amount": ("paid in", "amount", "credit"),
+    "status": ("transaction status", "status"),
+    "phone": ("other party info", "phone", "phone number", "msisdn", "details"),
+    "time": ("completion time", "date", "transaction date")
+}
+
+_PHONE = re.compile(r'(?:\+?254|0)?([17][\d*]{8})')
+
+
+def _norm_header(cell):
+    return (cell or '').strip().lower()
+
+
+def _find_columns(header):
+    """Map our field names to column positions (None if the column is absent)"""
+    cells = [_norm_header(c) for c in header]
+    found = {}
+    for field, aliases in _COLUMNS.items():
+        found[field] = next((cells.index(a) for a in aliases if a in cells), None)
+    return found
+
+
+def _amount(value):
+    try:
+        return float(str(value).replace(',', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+def _phone_key(value):
+    """Last 9 digits of the first phone-looking token ('*' kept for masked numbers)"""
+    match = _PHONE.search(str(value or '').replace(' ', ''))
+    return match.group(1) if match else None
+
+
+def _same_phone(statement_phone, stored_phone):
+    return all(a == '*' or a == b for a, b in zip(statement_phone, stored_phone))
+
+
+def _pending_manual():
+    """Pending manual payments keyed by receipt number (one pass over the pending slice)"""
+    supabase = get_supabase()
+    index = {}
+    after_id = 0
+    while True:
+        # Keyset pages: rows approved meanwhile can't shift later pages and skip one
+        page = supabase.table('transactions')\
+            .select('id, user_id, amount, mpesa_receipt_number, default_mpesa_phone')\
+            .eq('status', 'pending')\
+            .not_.is_('mpesa_receipt_number', 'null')\
+            .gt('id', after_id)\
+            .order('id')\
+            .limit(PAGE_SIZE)\
+            .execute().data or []
+        for tx in page:
+            index[tx['mpesa_receipt_number'].upper().strip()] = tx
+        if len(page) < PAGE_SIZE:
+            return index
+        after_id = page[-1]['id']
+
+
+def _rows(stream):
+    """Yield (row number, cells, columns) from a CSV stream, skipping any preamble before the header"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline=''))
+    columns = None
+    for cells in reader:
+        if columns is None:
+            if any('receipt' in _norm_header(c) or 'transaction id' in _norm_header(c) for c in cells):
+                columns = _find_columns(cells)
+                if columns['receipt'] is None or columns['amount'] is None:
+                    raise ValueError("Statement needs a receipt number and a 'Paid In' / amount column")
+            continue
+        yield reader.line_num, cells, columns
+
+    if columns is None:
+        raise ValueError("No header row with a receipt number column found")
+
+
+def _cell(cells, position):
+    return cells[position].strip() if position is not None and position < len(cells) else ''
+
+
+def reconcile_statement(stream, require_phone=False):
+    """
+    Match a statement export against pending manual payments
+
+    The file is read row by row; each row is looked up in a dict of
+    pending transactions keyed by receipt, so matching is linear in
+    statement rows + pending payments.
+
+    Args:
+        stream: Binary file-like object with the CSV
+        require_phone (bool): A row whose phone is missing on either side
+            is reported as mismatched instead of matched (set when the
+            matches will be approved)
+
+    Returns:
+        dict: "matched" (items ready for payment_review.confirm_payments,
+              amounts taken from the statement), "mismatched", "unmatched_rows"
+              (paid in, but nothing pending), "pending_not_in_statement" and
+              "summary" counts
+
+    Raises:
+        ValueError: Not a readable statement
+    """
+    pending = _pending_manual()
+    seen = set()
+    matched = []
+    mismatched = []
+    unmatched_rows = []
+    counts = {"rows": 0, "skipped": 0, "duplicates": 0, "mismatched": 0, "unmatched": 0}
+
+    for line, cells, columns in _rows(stream):
+        counts['rows'] += 1
+        receipt = _cell(cells, columns['receipt']).upper()
+        amount = _amount(_cell(cells, columns['amount']))
+        status = _cell(cells, columns['status']).lower()
+
+        if not receipt or amount <= 0 or (status and status != 'completed'):
+            counts['skipped'] += 1  # Withdrawals, failed / reversed rows, blank lines
+            continue
+        if receipt in seen:
+            counts['duplicates'] += 1
+            continue
+        seen.add(receipt)
+
+        tx = pending.get(receipt)
+        if tx is None:
+            counts['unmatched'] += 1
+            if len(unmatched_rows) < REPORT_LIMIT:
+                unmatched_rows.append({"line": line, "mpesa_code": receipt, "amount": amount,
+                                       "time": _cell(cells, columns['time'])})
+            continue
+
+        problems = []
+        if abs(float(tx['amount'] or 0) - amount) > 0.009:
+            problems.append(f"amount: claimed {tx['amount']}, statement {amount:g}")
+        statement_phone = _phone_key(_cell(cells, columns['phone']))
+        stored_phone = _phone_key(tx.get('default_mpesa_phone'))
+        if statement_phone and stored_phone:
+            if not _same_phone(statement_phone, stored_phone):
+                problems.append(f"phone: claimed {tx.get('default_mpesa_phone')}, statement {statement_phone}")
+        elif require_phone:
+            problems.append(f"phone: missing (claimed {tx.get('default_mpesa_phone') or '-'}, "
+                            f"statement {statement_phone or '-'}) - check by hand")
+
+        if problems:
+            counts['mismatched'] += 1
+            if len(mismatched) < REPORT_LIMIT:
+                mismatched.append({"line": line, "transaction_id": tx['id'], "user_id": tx['user_id'],
+                                   "mpesa_code": receipt, "amount": amount, "problems": problems})
+            continue
+
+        matched.append({
+            "transaction_id": tx['id'],
+            "user_id": tx['user_id'],
+            "mpesa_code": receipt,
+            "verified_amount": amount,
+            "notes": f"Matched to statement line {line}"
+        })
+
+    not_in_statement = [
+        {"transaction_id": tx['id'], "user_id": tx['user_id'], "mpesa_code": code, "amount": tx['amount']}
+        for code, tx in pending.items() if code not in seen
+    ]
+
+    counts.update(matched=len(matched), pending=len(pending), pending_not_in_statement=len(not_in_statement))
+    return {
+        "summary": counts,
+        "matched": matched,
+        "mismatched": mismatched,
+        "unmatched_rows": unmatched_rows,
+        "pending_not_in_statement": not_in_statement[:REPORT_LIMIT]
+    }
@@ -0,0 +1,290 @@
+# utils/stk_jobs.py - BACKGROUND STK PUSH QUEUE + SOCKET.IO STATUS EVENTS
+
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app.utils.supabase_gateway import get_supabase
+from app.utils.daraja import daraja
+
+# Threads talking to Safaricom; pushes beyond the queue size are refused
+WORKERS = int(os.getenv('STK_PUSH_WORKERS', 4))
+QUEUE_SIZE = int(os.getenv('STK_PUSH_QUEUE_SIZE', 500))
+# Finished jobs are kept this long for GET /api/mpesa/stk-push/<job_id>
+JOB_TTL = int(os.getenv('STK_PUSH_JOB_TTL', 3600))
+# Attempts at recording an accepted push before it is held in memory for the sweep
+SAVE_ATTEMPTS = int(os.getenv('STK_PUSH_SAVE_ATTEMPTS', 3))
+SAVE_BACKOFF = float(os.getenv('STK_PUSH_SAVE_BACKOFF', 0.5))
+
+# Statuses sent to the client, in order
+SUBMITTED = 'submitted'
+ACCEPTED = 'accepted'
+SUCCESS = 'success'
+FAILED = 'failed'
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_jobs = {}
+_checkout_jobs = {}
+_unsaved = {}  # checkout_request_id -> transactions row Daraja accepted but we could not insert
+_lock = threading.Lock()
+_workers = []
+_socketio = None
+
+
+def init_stk_jobs(socketio):
+    """Give the queue the Socket.IO server used for status events"""
+    global _socketio
+    _socketio = socketio
+
+
+def user_room(user_id):
+    """Socket.IO room every connection of a logged-in user joins"""
+    return f"user_{user_id}"
+
+
+def _emit(job):
+    if _socketio is None or not job.get('user_id'):
+        return
+    try:
+        _socketio.emit('payment_status', public_job(job), room=user_room(job['user_id']))
+    except Exception as e:
+        print(f"⚠️ payment_status emit failed: {e}")
+
+
+def public_job(job):
+    """Job fields safe to send to the browser"""
+    return {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "amount": job['amount'],
+        "checkout_request_id": job.get('checkout_request_id'),
+        "message": job.get('message')
+    }
+
+
+def _update(job_id, **changes):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(changes, updated_at=time.time())
+        if job.get('checkout_request_id'):
+            _checkout_jobs[job['checkout_request_id']] = job_id
+        snapshot = dict(job)
+    _emit(snapshot)
+    return snapshot
+
+
+def _prune():
+    cutoff = time.time() - JOB_TTL
+    with _lock:
+        for job_id in [j for j, job in _jobs.items() if job['updated_at'] < cutoff]:
+            job = _jobs.pop(job_id)
+            _checkout_jobs.pop(job.get('checkout_request_id'), None)
+
+
+def submit(user_id, phone, amount, callback_url):
+    """
+    Queue an STK push and return at once
+
+    Args:
+        user_id (int): Logged-in user (receives status events)
+        phone (str): 2547XXXXXXXX
+        amount (float): KSh
+        callback_url (str): Daraja callback URL
+
+    Returns:
+        dict: Public job (status 'submitted')
+
+    Raises:
+        queue.Full: Too many pushes waiting
+    """
+    _prune()
+    now = time.time()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "phone": phone,
+        "amount": float(amount),
+        "callback_url": callback_url,
+        "status": SUBMITTED,
+        "checkout_request_id": None,
+        "message": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+    with _lock:
+        _jobs[job['job_id']] = job
+    try:
+        _queue.put_nowait(job['job_id'])
+    except queue.Full:
+        with _lock:
+            _jobs.pop(job['job_id'], None)
+        raise
+
+    start_workers()
+    return public_job(job)
+
+
+def get_job(job_id, user_id=None):
+    """Public job by id (None if unknown, expired or owned by someone else)"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or (user_id is not None and job['user_id'] != user_id):
+            return None
+        return public_job(job)
+
+
+def notify_result(checkout_request_id, user_id, success, message=None):
+    """Report a callback / status-query outcome for an STK push"""
+    with _lock:
+        job_id = _checkout_jobs.get(checkout_request_id)
+
+    status = SUCCESS if success else FAILED
+    if job_id and _update(job_id, status=status, message=message):
+        return
+
+    # Push made before a restart (or by another path): still tell the user
+    _emit({
+        "job_id": None,
+        "user_id": user_id,
+        "status": status,
+        "amount": None,
+        "checkout_request_id": checkout_request_id,
+        "message": message
+    })
+
+
+def _run(job_id):
+    with _lock:
+        job = dict(_jobs.get(job_id) or {})
+    if not job:
+        return
+
+    try:
+        response = daraja.stk_push(job['phone'], job['amount'], job['callback_url'])
+        data = response.json()
+    except Exception as e:
+        print(f"❌ STK push error: {e}")
+        _update(job_id, status=FAILED, message="Payment request failed. Please try again.")
+        return
+
+    if not (response.ok and data.get('ResponseCode') == "0"):
+        _update(job_id, status=FAILED, message=data.get('errorMessage') or data.get('ResponseDescription') or "Payment request failed.")
+        return
+
+    checkout_request_id = data.get('CheckoutRequestID')
+    row = {
+        'user_id': job['user_id'],
+        'phone': job['phone'],
+        'amount': job['amount'],
+        'status': 'pending',
+        'checkout_request_id': checkout_request_id,
+        'merchant_request_id': data.get('MerchantRequestID'),
+        'created_at': datetime.now().isoformat()
+    }
+    if not _save_transaction(row):
+        # The customer still gets the prompt: keep the row so the callback
+        # (or the next sweep) can record it, and don't report ACCEPTED yet
+        with _lock:
+            _unsaved[checkout_request_id] = row
+        _update(job_id, checkout_request_id=checkout_request_id)
+        return
+
+    print(f"✓ Transaction saved: {checkout_request_id}")
+    _update(job_id, status=ACCEPTED, checkout_request_id=checkout_request_id,
+            message=data.get('CustomerMessage'))
+
+
+def _save_transaction(row, attempts=None, check_first=False):
+    """Insert a pending STK transaction, retrying; False if it never made it"""
+    supabase = get_supabase()
+    attempts = attempts or SAVE_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            if check_first or attempt:
+                # A failed insert may still have landed
+                existing = supabase.table('transactions')\
+                    .select('id')\
+                    .eq('checkout_request_id', row['checkout_request_id'])\
+                    .limit(1)\
+                    .execute()
+                if existing.data:
+                    return True
+            supabase.table('transactions').insert(row).execute()
+            return True
+        except Exception as e:
+            print(f"⚠️ Failed to save transaction {row['checkout_request_id']} (attempt {attempt + 1}): {e}")
+            if attempt + 1 < attempts:
+                time.sleep(SAVE_BACKOFF * (2 ** attempt))
+    return False
+
+
+def _saved(checkout_request_id):
+    with _lock:
+        _unsaved.pop(checkout_request_id, None)
+        job_id = _checkout_jobs.get(checkout_request_id)
+        job = _jobs.get(job_id) if job_id else None
+        waiting = job is not None and job['status'] == SUBMITTED
+    if waiting:
+        _update(job_id, status=ACCEPTED)
+
+
+def ensure_transaction(checkout_request_id):
+    """
+    Record the transaction for a push accepted while its insert was failing
+
+    Called before a callback is applied; a no-op for pushes already saved.
+
+    Raises:
+        RuntimeError: The insert still fails (the callback is retried later)
+    """
+    with _lock:
+        row = _unsaved.get(checkout_request_id)
+    if row is None:
+        return
+    if not _save_transaction(row, attempts=1, check_first=True):
+        raise RuntimeError(f"Transaction {checkout_request_id} could not be saved")
+    _saved(checkout_request_id)
+
+
+def save_unsaved():
+    """
+    Retry recording accepted pushes whose transaction insert failed
+
+    Returns:
+        int: Transactions saved
+    """
+    with _lock:
+        rows = list(_unsaved.values())
+
+    saved = 0
+    for row in rows:
+        if _save_transaction(row, attempts=1, check_first=True):
+            _saved(row['checkout_request_id'])
+            saved += 1
+    return saved
+
+
+def _work():
+    while True:
+        job_id = _queue.get()
+        try:
+            _run(job_id)
+        finally:
+            _queue.task_done()
+
+
+def start_workers():
+    """Start the worker threads once per process"""
+    with _lock:
+        if _workers:
+            return
+        for i in range(WORKERS):
+            worker = threading.Thread(target=_work, name=f'stk-push-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
@@ -0,0 +1,158 @@
+# utils/stk_reconciler.py - RESOLVE PENDING STK TRANSACTIONS VIA STK QUERY
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.utils.supabase_gateway import get_supabase
+from app.utils.daraja import daraja
+from app.utils import mpesa_callbacks
+
+# Seconds between background runs (0 disables the loop; /cron/reconcile-stk still works)
+INTERVAL = int(os.getenv('STK_RECONCILE_INTERVAL', 300))
+# Only pushes older than this are queried, so normal callbacks get there first
+MIN_AGE = int(os.getenv('STK_RECONCILE_MIN_AGE', 120))
+# Pushes Daraja no longer knows about after this long are marked failed
+GIVE_UP_AFTER = int(os.getenv('STK_RECONCILE_GIVE_UP_AFTER', 86400))
+BATCH_SIZE = int(os.getenv('STK_RECONCILE_BATCH_SIZE', 100))
+MAX_PER_RUN = int(os.getenv('STK_RECONCILE_MAX_PER_RUN', 1000))
+# Concurrent STK queries (all share the Daraja session and cached token)
+WORKERS = int(os.getenv('STK_RECONCILE_WORKERS', 8))
+
+# Outcomes of one query
+RESOLVED = 'resolved'
+STILL_PENDING = 'pending'
+EXPIRED = 'expired'
+ERROR = 'error'
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='stk-reconcile')
+_run_lock = threading.Lock()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _pending_batch(after_id, cutoff):
+    """Next page of STK transactions still pending (manual payments have no CheckoutRequestID)"""
+    return get_supabase().table('transactions')\
+        .select('id, checkout_request_id, created_at')\
+        .eq('status', 'pending')\
+        .not_.is_('checkout_request_id', 'null')\
+        .lt('created_at', cutoff)\
+        .gt('id', after_id)\
+        .order('id')\
+        .limit(BATCH_SIZE)\
+        .execute().data or []
+
+
+def _age_seconds(created_at):
+    try:
+        created = datetime.fromisoformat(str(created_at).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return 0
+    return (datetime.now() - created).total_seconds()
+
+
+def _reconcile_one(tx):
+    """Query one push and apply the result through the callback path"""
+    checkout_request_id = tx['checkout_request_id']
+    try:
+        response = daraja.stk_query(checkout_request_id)
+        data = response.json()
+    except Exception as e:
+        print(f"⚠️ STK query {checkout_request_id} failed: {e}")
+        return ERROR
+
+    if data.get('ResultCode') is None:
+        # errorCode 500.001.1001 = still being processed; 400.x = Daraja no longer knows it
+        if str(data.get('errorCode', '')).startswith('400') and _age_seconds(tx['created_at']) > GIVE_UP_AFTER:
+            try:
+                mpesa_callbacks.apply_callback({
+                    "checkout_request_id": checkout_request_id,
+                    "result_code": 1037,
+                    "result_desc": "No result from M-Pesa (expired)",
+                    "amount": None,
+                    "mpesa_receipt_number": None,
+                    "phone": None
+                })
+            except Exception as e:
+                print(f"❌ Expiring STK push {checkout_request_id} failed: {e}")
+                return ERROR
+            return EXPIRED
+        return STILL_PENDING
+
+    try:
+        mpesa_callbacks.apply_callback({
+            "checkout_request_id": checkout_request_id,
+            "result_code": int(data['ResultCode']),
+            "result_desc": data.get('ResultDesc'),
+            "amount": None,
+            "mpesa_receipt_number": None,
+            "phone": None
+        })
+    except Exception as e:
+        print(f"❌ Applying STK result {checkout_request_id} failed: {e}")
+        return ERROR
+    return RESOLVED
+
+
+def reconcile():
+    """
+    Query Daraja for pending STK transactions and settle them
+
+    Walks pending rows older than MIN_AGE in id order, BATCH_SIZE at a
+    time, querying WORKERS pushes concurrently.
+
+    Returns:
+        dict: Counts per outcome plus "checked" and "duration_ms",
+              or None if another run is in progress
+    """
+    if not _run_lock.acquire(blocking=False):
+        return None
+
+    try:
+        started = time.perf_counter()
+        cutoff = (datetime.now() - timedelta(seconds=MIN_AGE)).isoformat()
+        counts = {RESOLVED: 0, STILL_PENDING: 0, EXPIRED: 0, ERROR: 0}
+        after_id = 0
+        checked = 0
+
+        while checked < MAX_PER_RUN:
+            batch = _pending_batch(after_id, cutoff)
+            if not batch:
+                break
+            for outcome in _executor.map(_reconcile_one, batch):
+                counts[outcome] += 1
+            checked += len(batch)
+            after_id = batch[-1]['id']
+            if len(batch) < BATCH_SIZE:
+                break
+
+        counts['checked'] = checked
+        counts['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if checked:
+            print(f"✅ STK reconcile: {counts}")
+        return counts
+    finally:
+        _run_lock.release()
+
+
+def _run_forever():
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            reconcile()
+        except Exception as e:
+            print(f"❌ STK reconcile error: {e}")
+
+
+def start_reconciler():
+    """Start the periodic background run once per process"""
+    global _loop
+    if INTERVAL <= 0:
+        return
+    with _loop_lock:
+        if _loop is None:
+            _loop = threading.Thread(target=_run_forever, name='stk-reconciler', daemon=True)
+            _loop.start()
@@ -0,0 +1,150 @@
+# utils/supabase_gateway.py - SHARED SUPABASE CLIENT
+
+import atexit
+import os
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+from postgrest import SyncPostgrestClient
+from postgrest.exceptions import APIError
+from postgrest.utils import SyncClient
+from supabase import Client, ClientOptions
+
+from app.utils.query_metrics import record_query
+
+load_dotenv()
+
+_client = None
+_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_pool_config():
+    """
+    Read connection pool settings from the environment
+
+    Returns:
+        dict: Pool size, keep-alive and timeout settings
+    """
+    return {
+        "max_connections": _env_int('SUPABASE_POOL_SIZE', 20),
+        "max_keepalive_connections": _env_int('SUPABASE_POOL_KEEPALIVE', 10),
+        "keepalive_expiry": _env_float('SUPABASE_KEEPALIVE_EXPIRY', 30.0),
+        "timeout": _env_float('SUPABASE_TIMEOUT', 10.0),
+        "connect_timeout": _env_float('SUPABASE_CONNECT_TIMEOUT', 5.0),
+        "http2": os.getenv('SUPABASE_HTTP2', 'true').lower() != 'false',
+    }
+
+
+class InstrumentedSession(SyncClient):
+    """HTTP session that reports every PostgREST round-trip to query_metrics"""
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            record_query(method, url, kwargs.get('params'), time.perf_counter() - start, status)
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client backed by one bounded keep-alive HTTP/2 pool"""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        config = get_pool_config()
+        return InstrumentedSession(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(config['timeout'], connect=config['connect_timeout']),
+            limits=httpx.Limits(
+                max_connections=config['max_connections'],
+                max_keepalive_connections=config['max_keepalive_connections'],
+                keepalive_expiry=config['keepalive_expiry'],
+            ),
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=config['http2'],
+        )
+
+
+class GatewayClient(Client):
+    """Supabase client whose table/rpc calls share the pooled PostgREST session"""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None, verify=True, proxy=None):
+        return PooledPostgrestClient(
+            rest_url,
+            headers=headers,
+            schema=schema,
+            verify=verify,
+            proxy=proxy,
+        )
+
+
+def get_supabase():
+    """
+    Get the process-wide Supabase client
+
+    The client (and its HTTP connection pool) is created once and shared by
+    every blueprint, service and cron path. httpx pools are thread-safe, and
+    creation is guarded by a lock so concurrent first requests cannot build
+    two pools. Callers must not mutate shared state on it (auth(), schema()).
+
+    Returns:
+        Client: Shared Supabase client
+    """
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _lock:
+        if _client is None:
+            client = GatewayClient(
+                os.getenv('SUPABASE_URL'),
+                os.getenv('SUPABASE_KEY'),
+                ClientOptions(),
+            )
+            # Build the PostgREST session now rather than lazily on a request thread
+            client.postgrest
+            _client = client
+            print(f"✅ Supabase gateway ready (pool size {get_pool_config()['max_connections']})")
+
+    return _client
+
+
+def is_missing_rpc(error):
+    """True if a PostgREST error means the called database function is not installed"""
+    return isinstance(error, APIError) and error.code == 'PGRST202'
+
+
+def close_supabase():
+    """Close the shared client's connection pool"""
+    global _client
+
+    with _lock:
+        if _client is not None and _client._postgrest is not None:
+            _client._postgrest.aclose()
+        _client = None
+
+
+atexit.register(close_supabase)
@@ -0,0 +1,97 @@
+# utils/table_stats.py - COUNT-ONLY TABLE STATISTICS
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.supabase_gateway import get_supabase
+
+# Tables shown by the admin database tools
+TABLES = ('user', 'group', 'member', 'payment', 'wifi_credential')
+
+# Parallel count requests (bounded by the Supabase pool anyway)
+MAX_WORKERS = int(os.getenv('TABLE_STATS_WORKERS', 8))
+# Tables the planner estimates above this many rows keep the estimate
+# instead of paying for an exact count(*)
+EXACT_BELOW = int(os.getenv('TABLE_STATS_EXACT_BELOW', 100000))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='table-stats')
+
+
+def _head_count(table, method, build=None):
+    """HEAD request returning only the Content-Range count (no rows)"""
+    query = get_supabase().table(table).select('*', count=method, head=True)
+    if build:
+        query = build(query)
+    return query.execute().count or 0
+
+
+def count_rows(table, build=None, exact=False):
+    """
+    Count rows in a table without transferring them
+
+    Args:
+        table (str): Table name
+        build (callable): Optional function adding filters to the query
+        exact (bool): Always run count(*) instead of trusting the planner
+
+    Returns:
+        dict: {"rows", "exact", "latency_ms"} or {"rows": "Error", "error", "latency_ms"}
+    """
+    start = time.perf_counter()
+    try:
+        if exact:
+            rows, is_exact = _head_count(table, 'exact', build), True
+        else:
+            # Planner estimate is O(1); small tables get a cheap exact count
+            rows = _head_count(table, 'planned', build)
+            is_exact = rows < EXACT_BELOW
+            if is_exact:
+                rows = _head_count(table, 'exact', build)
+
+        return {
+            "rows": rows,
+            "exact": is_exact,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+    except Exception as e:
+        return {
+            "rows": "Error",
+            "error": str(e),
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+
+
+def count_many(specs, exact=False):
+    """
+    Run several counts concurrently
+
+    Args:
+        specs (dict): {key: table} or {key: (table, build)}
+        exact (bool): Passed to count_rows
+
+    Returns:
+        dict: {key: count_rows result}, in the order of specs
+    """
+    futures = {}
+    for key, spec in specs.items():
+        table, build = spec if isinstance(spec, tuple) else (spec, None)
+        futures[key] = _executor.submit(count_rows, table, build, exact)
+
+    return {key: future.result() for key, future in futures.items()}
+
+
+def table_stats(tables=TABLES, exact=False):
+    """
+    Row count and query latency for each table
+
+    Returns:
+        dict: {"tables": [{"name", "rows", "exact", "latency_ms"}], "total_ms"}
+    """
+    start = time.perf_counter()
+    counts = count_many({table: table for table in tables}, exact)
+
+    return {
+        "tables": [{"name": table, **result} for table, result in counts.items()],
+        "total_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
@@ -0,0 +1,304 @@
+# utils/wallet_ledger.py - WALLET LEDGER (ATOMIC CREDITS / DEBITS)
+
+import os
+import threading
+import time
+
+from postgrest.exceptions import APIError
+
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+
+# Seconds a user's balance/status is served from memory by get_wallet()
+WALLET_CACHE_TTL = int(os.getenv('WALLET_CACHE_TTL', 60))
+# Compare-and-swap attempts when wallet_post is not installed
+CAS_RETRIES = 5
+# balance_after of a fallback ledger row whose balance update has not been confirmed
+PENDING_BALANCE = -1
+
+_rpc_available = True
+_ledger_available = True
+_cache = {}  # str(user_id) -> (wallet dict, stored_at)
+_cache_lock = threading.Lock()
+
+
+def _result(balance, entry_id=None, duplicate=False):
+    return {"balance": float(balance or 0), "entry_id": entry_id, "duplicate": duplicate}
+
+
+def _remember(user_id, balance, wallet_status=None):
+    """Refresh the cached balance after a write we know the result of"""
+    with _cache_lock:
+        entry = _cache.get(str(user_id))
+        if entry is None and wallet_status is None:
+            return
+        wallet = dict(entry[0]) if entry else {}
+        wallet['wallet_balance'] = float(balance)
+        if wallet_status is not None:
+            wallet['wallet_status'] = wallet_status
+        if 'wallet_status' in wallet:
+            _cache[str(user_id)] = (wallet, time.monotonic())
+
+
+def forget(user_id):
+    """Drop a cached wallet (call after writing wallet_status elsewhere)"""
+    with _cache_lock:
+        _cache.pop(str(user_id), None)
+
+
+def get_wallet(user_id):
+    """
+    A user's balance and wallet status, cached for WALLET_CACHE_TTL seconds
+
+    Returns:
+        dict: {"wallet_balance", "wallet_status"} or None if the user doesn't exist
+    """
+    with _cache_lock:
+        entry = _cache.get(str(user_id))
+        if entry and time.monotonic() - entry[1] < WALLET_CACHE_TTL:
+            return dict(entry[0])
+
+    res = get_supabase().table('user').select('wallet_balance, wallet_status').eq('id', user_id).execute()
+    if not res.data:
+        return None
+
+    wallet = {
+        "wallet_balance": float(res.data[0].get('wallet_balance') or 0),
+        "wallet_status": res.data[0].get('wallet_status') or 'not_paid'
+    }
+    with _cache_lock:
+        _cache[str(user_id)] = (wallet, time.monotonic())
+    return dict(wallet)
+
+
+def post(user_id, amount, kind, reference=None, wallet_status=None):
+    """
+    Atomically apply a credit (amount > 0) or debit (amount < 0)
+
+    Args:
+        user_id (int): Wallet owner
+        amount (float): Signed amount in KSh
+        kind (str): Entry type, e.g. 'mpesa_topup', 'manual_topup'
+        reference (str): External id (receipt, payment id); an entry with the
+            same kind + reference is only applied once
+        wallet_status (str): Optional new wallet_status set in the same write
+
+    Returns:
+        dict: {"balance", "entry_id", "duplicate"}
+
+    Raises:
+        LookupError: User does not exist
+        ValueError: Debit would make the balance negative
+        RuntimeError: Fallback could not post safely (reference in flight,
+            ledger table missing, or UncertainPost when the outcome is unknown)
+    """
+    global _rpc_available
+
+    amount = float(amount)
+    reference = str(reference) if reference else None
+
+    if _rpc_available:
+        try:
+            data = get_supabase().rpc('wallet_post', {
+                'p_user_id': user_id,
+                'p_amount': amount,
+                'p_kind': kind,
+                'p_reference': reference,
+                'p_wallet_status': wallet_status
+            }).execute().data
+            result = _result(data['balance'], data.get('entry_id'), bool(data.get('duplicate')))
+            if not result['duplicate']:
+                _remember(user_id, result['balance'], wallet_status)
+            return result
+        except APIError as e:
+            if e.code == 'P0002':
+                raise LookupError("User not found")
+            if e.code == 'P0001':
+                raise ValueError("Insufficient wallet balance")
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ wallet_post RPC not installed - using compare-and-swap fallback")
+            _rpc_available = False
+
+    return _post_fallback(user_id, amount, kind, reference, wallet_status)
+
+
+def credit(user_id, amount, kind, reference=None, wallet_status=None):
+    """Add money to a wallet (see post)"""
+    return post(user_id, abs(float(amount)), kind, reference, wallet_status)
+
+
+def debit(user_id, amount, kind, reference=None, wallet_status=None):
+    """Take money from a wallet (see post)"""
+    return post(user_id, -abs(float(amount)), kind, reference, wallet_status)
+
+
+def find_entry(kind, reference):
+    """
+    The settled ledger entry for a kind + reference
+
+    Returns:
+        dict: {"id", "user_id", "amount", "balance_after"}, or None if there
+              is none or its fallback post is still unconfirmed
+    """
+    found = get_supabase().table('wallet_ledger')\
+        .select('id, user_id, amount, balance_after')\
+        .eq('kind', kind)\
+        .eq('reference', reference)\
+        .limit(1)\
+        .execute().data
+    if not found or float(found[0]['balance_after']) == PENDING_BALANCE:
+        return None
+    return found[0]
+
+
+class UncertainPost(RuntimeError):
+    """The balance update was sent but its outcome is unknown"""
+
+
+def _missing_table(error):
+    return isinstance(error, APIError) and error.code in ('PGRST205', '42P01')
+
+
+def _claim_entry(user_id, amount, kind, reference):
+    """
+    Insert the ledger row before the balance moves. The unique (kind,
+    reference) index lets exactly one concurrent poster through; the row
+    stays at PENDING_BALANCE until its balance update lands.
+
+    Returns:
+        tuple: (claimed entry id, None) or (None, existing entry) for a duplicate
+
+    Raises:
+        RuntimeError: Another poster holds the claim and has not finished
+    """
+    global _ledger_available
+
+    supabase = get_supabase()
+    for _ in range(CAS_RETRIES):
+        try:
+            res = supabase.table('wallet_ledger').insert({
+                'user_id': user_id,
+                'amount': amount,
+                'balance_after': PENDING_BALANCE,
+                'kind': kind,
+                'reference': reference
+            }).execute()
+            return res.data[0]['id'], None
+        except APIError as e:
+            if _missing_table(e):
+                _ledger_available = False
+                raise RuntimeError("wallet_ledger table missing - apply sql/006_wallet_ledger.sql")
+            if e.code == '23503':
+                raise LookupError("User not found")
+            if e.code != '23505':
+                raise
+
+        found = supabase.table('wallet_ledger')\
+            .select('id, balance_after')\
+            .eq('kind', kind)\
+            .eq('reference', reference)\
+            .limit(1)\
+            .execute().data
+        if not found:
+            continue  # The other claim was released meanwhile
+
+        entry = found[0]
+        if float(entry['balance_after']) != PENDING_BALANCE:
+            return None, entry
+        # In flight elsewhere - or its poster died, and then only the user's
+        # balance history can tell whether it landed, so never re-apply
+        raise RuntimeError(f"Wallet ledger entry {entry['id']} for {kind}/{reference} is still pending")
+
+    raise RuntimeError("Could not claim wallet ledger entry, try again")
+
+
+def _append_entry(user_id, amount, balance, kind):
+    """Ledger row for a post without a reference (nothing to deduplicate)"""
+    global _ledger_available
+
+    if not _ledger_available:
+        return None
+    try:
+        res = get_supabase().table('wallet_ledger').insert({
+            'user_id': user_id,
+            'amount': amount,
+            'balance_after': balance,
+            'kind': kind
+        }).execute()
+        return res.data[0]['id'] if res.data else None
+    except Exception as e:
+        if _missing_table(e):
+            print("⚠️ wallet_ledger table unavailable - balances update without ledger entries")
+            _ledger_available = False
+        else:
+            print(f"⚠️ Failed to append wallet ledger entry: {e}")
+        return None
+
+
+def _apply_balance(user_id, amount, wallet_status):
+    """Compare-and-swap the balance, retried on conflict; returns the new balance"""
+    supabase = get_supabase()
+
+    for _ in range(CAS_RETRIES):
+        res = supabase.table('user').select('wallet_balance').eq('id', user_id).execute()
+        if not res.data:
+            raise LookupError("User not found")
+
+        current = res.data[0].get('wallet_balance')
+        new_balance = float(current or 0) + amount
+        if new_balance < 0:
+            raise ValueError("Insufficient wallet balance")
+
+        update = {'wallet_balance': new_balance}
+        if wallet_status is not None:
+            update['wallet_status'] = wallet_status
+
+        query = supabase.table('user').update(update).eq('id', user_id)
+        query = query.is_('wallet_balance', 'null') if current is None else query.eq('wallet_balance', current)
+        try:
+            updated = query.execute().data
+        except Exception as e:
+            raise UncertainPost(f"Wallet update for user {user_id} may or may not have applied: {e}") from e
+        if updated:
+            return new_balance
+
+    raise RuntimeError("Wallet update conflicted too many times, try again")
+
+
+def _post_fallback(user_id, amount, kind, reference, wallet_status):
+    """Without wallet_post: claim the ledger row first (so a reference is
+    applied once), then a conditional balance update retried on conflict"""
+    if not reference:
+        new_balance = _apply_balance(user_id, amount, wallet_status)
+        entry_id = _append_entry(user_id, amount, new_balance, kind)
+        _remember(user_id, new_balance, wallet_status)
+        return _result(new_balance, entry_id)
+
+    if not _ledger_available:
+        raise RuntimeError("wallet_ledger table missing - apply sql/006_wallet_ledger.sql")
+
+    entry_id, existing = _claim_entry(user_id, amount, kind, reference)
+    if existing:
+        return _result(existing['balance_after'], existing['id'], True)
+
+    supabase = get_supabase()
+    try:
+        new_balance = _apply_balance(user_id, amount, wallet_status)
+    except UncertainPost:
+        # Keep the claim: a retry must not credit again if the update landed
+        raise
+    except Exception:
+        # Nothing was applied: free the reference for a retry
+        supabase.table('wallet_ledger').delete().eq('id', entry_id).execute()
+        raise
+
+    for attempt in range(CAS_RETRIES):
+        try:
+            supabase.table('wallet_ledger').update({'balance_after': new_balance}).eq('id', entry_id).execute()
+            break
+        except Exception as e:
+            # The money moved; the entry stays pending (and blocks a re-post) until fixed
+            print(f"❌ Wallet ledger entry {entry_id} not finalised (attempt {attempt + 1}): {e}")
+
+    _remember(user_id, new_balance, wallet_status)
+    return _result(new_balance, entry_id)
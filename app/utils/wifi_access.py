@@ -0,0 +1,194 @@
+# utils/wifi_access.py - WIFI ACCESS GATES (ONE ROUND TRIP)
+
+import functools
+from datetime import datetime
+
+from postgrest.exceptions import APIError
+
+from app.utils.supabase_gateway import get_supabase, is_missing_rpc
+
+MIN_WALLET_BALANCE = 100
+
+_rpc_available = True
+
+
+class AccessDecision:
+    """Outcome of the WiFi gates
+
+    reason is None when allowed, else one of: not_logged_in, user_not_found,
+    low_wallet, no_group, group_not_found, group_pending, group_not_started,
+    group_expired, payment_incomplete. action tells the page what to offer
+    (auth, wallet, group or payment).
+    """
+
+    def __init__(self, reason=None, message=None, action=None, user=None, group=None,
+                 remaining_amount=None, remaining_members=None, week_end=None):
+        self.reason = reason
+        self.message = message
+        self.action = action
+        self.user = user
+        self.group = group
+        self.remaining_amount = remaining_amount
+        self.remaining_members = remaining_members
+        self.week_end = week_end
+
+    @property
+    def allowed(self):
+        return self.reason is None
+
+    def to_dict(self):
+        return {
+            "allowed": self.allowed,
+            "reason": self.reason,
+            "message": self.message,
+            "action": self.action,
+            "remaining_amount": self.remaining_amount,
+            "remaining_members": self.remaining_members,
+            "group_id": self.group['id'] if self.group else None,
+            "week_end": self.week_end.isoformat() if self.week_end else None
+        }
+
+    def template_context(self):
+        """index.html kwargs explaining a denial"""
+        if self.action == 'auth':
+            return {"open_auth_modal": True}
+        return {"error_message": self.message, "error_action": self.action}
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_week_end(value):
+    """Naive UTC datetime from a week_end timestamp (groups share a few values)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _fetch_fallback(user_id):
+    """Without the wifi_access RPC: narrow selects for user, member/group and count"""
+    supabase = get_supabase()
+
+    user_result = supabase.table('user')\
+        .select('id, username, wallet_balance, member_id')\
+        .eq('id', user_id)\
+        .execute()
+    if not user_result.data:
+        return None
+
+    user = user_result.data[0]
+    row = {"user": user, "group": None, "member_count": None}
+    if not user.get('member_id'):
+        return row
+
+    member_result = supabase.table('member')\
+        .select('id, group(id, name, status, week_end, current_balance, target_amount, max_members)')\
+        .eq('id', user['member_id'])\
+        .execute()
+    if not member_result.data or not member_result.data[0].get('group'):
+        return row
+
+    group = member_result.data[0]['group']
+    row['group'] = group
+    if group.get('status', 'pending') == 'pending':
+        row['member_count'] = supabase.table('member')\
+            .select('id', count='exact', head=True)\
+            .eq('group_id', group['id'])\
+            .execute().count or 0
+    return row
+
+
+def fetch_access_row(user_id):
+    """{"user", "group", "member_count"} for the gates, or None if the user is gone"""
+    global _rpc_available
+
+    if _rpc_available:
+        try:
+            return get_supabase().rpc('wifi_access', {'p_user_id': user_id}).execute().data
+        except APIError as e:
+            if not is_missing_rpc(e):
+                raise
+            print("⚠️ wifi_access RPC not installed - using separate queries")
+            _rpc_available = False
+
+    return _fetch_fallback(user_id)
+
+
+def evaluate(row, now=None):
+    """
+    Run the gates over a fetched row (no database access)
+
+    Args:
+        row (dict): fetch_access_row() result, or None
+        now (datetime): Naive UTC time to compare week_end with (default: now)
+
+    Returns:
+        AccessDecision
+    """
+    if not row or not row.get('user'):
+        return AccessDecision('user_not_found', "Please log in.", 'auth')
+
+    user = row['user']
+    group = row.get('group')
+
+    wallet_balance = float(user.get('wallet_balance') or 0)
+    if wallet_balance < MIN_WALLET_BALANCE:
+        return AccessDecision(
+            'low_wallet',
+            f"Wallet balance too low (KSh {wallet_balance:.0f}). Add at least KSh {MIN_WALLET_BALANCE}.",
+            'wallet', user,
+            remaining_amount=MIN_WALLET_BALANCE - wallet_balance
+        )
+
+    if not user.get('member_id'):
+        return AccessDecision('no_group', "You're not in a group. Join a group first.", 'group', user)
+
+    if not group:
+        return AccessDecision('group_not_found', "Group not found. Join a valid group.", 'group', user)
+
+    group_status = group.get('status', 'pending')
+    if group_status == 'pending':
+        remaining = (group.get('max_members') or 3) - int(row.get('member_count') or 0)
+        return AccessDecision(
+            'group_pending',
+            f"Group not active yet. Waiting for {remaining} more member(s) to join.",
+            'group', user, group,
+            remaining_members=remaining
+        )
+
+    if not group.get('week_end'):
+        return AccessDecision(
+            'group_not_started', "Group has not started yet. Wait for all members to join.",
+            'group', user, group
+        )
+
+    week_end = parse_week_end(group['week_end'])
+    now = now or datetime.utcnow()
+    if group_status == 'expired' or now > week_end:
+        return AccessDecision(
+            'group_expired', "Your group access expired. Leave and join a new group.",
+            'group', user, group, week_end=week_end
+        )
+
+    current_balance = float(group.get('current_balance') or 0)
+    target_amount = float(group.get('target_amount') or 0)
+    if current_balance < target_amount:
+        remaining = target_amount - current_balance
+        return AccessDecision(
+            'payment_incomplete', f"Group payment incomplete. KSh {remaining:.0f} remaining.",
+            'payment', user, group,
+            remaining_amount=remaining, week_end=week_end
+        )
+
+    return AccessDecision(user=user, group=group, week_end=week_end)
+
+
+def check_access(user_id):
+    """
+    Decide whether a user may get the WiFi QR (one database call)
+
+    Args:
+        user_id (int): Session user, or None
+
+    Returns:
+        AccessDecision
+    """
+    if not user_id:
+        return AccessDecision('not_logged_in', "Please log in.", 'auth')
+    return evaluate(fetch_access_row(user_id))
@@ -0,0 +1,106 @@
+# utils/wifi_entitlement.py - SIGNED WIFI ACCESS PASSES
+
+import os
+import threading
+import time
+from datetime import timezone
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+COOKIE_NAME = 'wifi_pass'
+# Longest a pass is trusted before the gates run against Supabase again (also capped at week_end)
+WIFI_ENTITLEMENT_TTL = int(os.getenv('WIFI_ENTITLEMENT_TTL', 3600))
+
+_SALT = 'wifi-entitlement'
+_revoked_users = {}  # str(user_id) -> revoked at (epoch seconds)
+_revoked_groups = {}  # str(group_id) -> revoked at
+_lock = threading.Lock()
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt=_SALT)
+
+
+def issue(decision, now=None):
+    """
+    Signed pass for a user who just passed every gate
+
+    Args:
+        decision (AccessDecision): Allowed decision from wifi_access
+        now (float): Epoch seconds (default: now)
+
+    Returns:
+        tuple: (token, expires_at epoch seconds)
+    """
+    now = now or time.time()
+    expires_at = now + WIFI_ENTITLEMENT_TTL
+    if decision.week_end:
+        expires_at = min(expires_at, decision.week_end.replace(tzinfo=timezone.utc).timestamp())
+
+    token = _serializer().dumps({
+        "u": decision.user['id'],
+        "g": decision.group['id'],
+        "iat": round(now, 3),
+        "exp": int(expires_at)
+    })
+    return token, int(expires_at)
+
+
+def verify(token, user_id, now=None):
+    """
+    Pass payload if the token is genuine, belongs to user_id, has not
+    expired and was not revoked afterwards - else None. No database access.
+    """
+    if not token or not user_id:
+        return None
+
+    try:
+        payload = _serializer().loads(token)
+    except BadSignature:
+        return None
+
+    now = now or time.time()
+    if str(payload.get('u')) != str(user_id) or payload.get('exp', 0) <= now:
+        return None
+
+    with _lock:
+        revoked_at = max(
+            _revoked_users.get(str(payload['u']), 0),
+            _revoked_groups.get(str(payload.get('g')), 0)
+        )
+    if payload.get('iat', 0) <= revoked_at:
+        return None
+    return payload
+
+
+def set_cookie(response, decision):
+    """Attach a fresh pass to a response for an allowed decision"""
+    token, expires_at = issue(decision)
+    response.set_cookie(
+        COOKIE_NAME, token,
+        expires=expires_at,
+        httponly=True,
+        secure=current_app.config.get('SESSION_COOKIE_SECURE', False),
+        samesite=current_app.config.get('SESSION_COOKIE_SAMESITE', 'Lax')
+    )
+    return response
+
+
+def _revoke(revoked, key):
+    now = time.time()
+    with _lock:
+        revoked[str(key)] = now
+        # Passes issued before TTL ago have expired anyway
+        for stale in [k for k, at in revoked.items() if at < now - WIFI_ENTITLEMENT_TTL]:
+            del revoked[stale]
+
+
+def revoke_user(user_id):
+    """Invalidate every pass already issued to a user (e.g. account deleted)"""
+    _revoke(_revoked_users, user_id)
+
+
+def revoke_group(group_id):
+    """Invalidate every pass for a group (e.g. expired early by an admin)"""
+    _revoke(_revoked_groups, group_id)
@@ -0,0 +1,333 @@
+# utils/wifi_qr.py - WIFI QR RENDERING CACHE
+
+import base64
+import functools
+import hashlib
+import io
+import os
+import threading
+
+import qrcode
+from PIL import Image, ImageColor, ImageDraw
+
+# Optional directory for rendered images (survives restarts)
+QR_CACHE_DIR = os.getenv('QR_CACHE_DIR')
+LOGO_PATH = os.getenv('QR_LOGO_PATH', 'myfi_logo.png')
+# Rendered variants kept in memory (credential versions x formats x modes x styles)
+MAX_ENTRIES = 16
+
+# The look generate_qr has always produced
+DEFAULT_STYLE = {
+    "box_size": 10,
+    "border": 4,
+    "fill": "#0051FF",
+    "logo": True,
+    "frame": 20,
+    "corner_radius": 30
+}
+
+FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+_cache = {}  # (credential version, format, mode, style key) -> rendered dict
+_lock = threading.Lock()
+_render_locks = {}
+_logo = None  # (path, mtime, Image or None)
+
+
+def wifi_credentials():
+    """(ssid, password, security) from the environment"""
+    return (
+        os.getenv('SSID_NAME'),
+        os.getenv('SSID_PASSWORD'),
+        os.getenv('SSID_SECURITY', 'WPA2')
+    )
+
+
+def credential_version(credentials=None):
+    """Short hash of the credentials; changes whenever they rotate"""
+    raw = '\x1f'.join(str(c) for c in (credentials or wifi_credentials()))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def wifi_string(credentials=None):
+    ssid, password, security = credentials or wifi_credentials()
+    return f"WIFI:S:{ssid};T:{security};P:{password};H:False;;"
+
+
+def _style_key(style):
+    return tuple(sorted(style.items()))
+
+
+def _load_logo():
+    """Logo image, read from disk once (and again only if the file changes)"""
+    global _logo
+
+    try:
+        mtime = os.path.getmtime(LOGO_PATH)
+    except OSError:
+        mtime = None
+
+    if _logo is None or _logo[:2] != (LOGO_PATH, mtime):
+        image = None
+        if mtime is not None:
+            try:
+                image = Image.open(LOGO_PATH)
+                image.load()
+            except Exception as e:
+                print(f"⚠️ QR logo {LOGO_PATH} unreadable: {e}")
+        _logo = (LOGO_PATH, mtime, image)
+    return _logo[2]
+
+
+def _render_png(data, style):
+    """QR with optional round logo and rounded frame, PNG-encoded"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=style['box_size'],
+        border=style['border'],
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=style['fill'], back_color="white").convert("RGB")
+
+    logo = _load_logo() if style['logo'] else None
+    if logo is not None:
+        qr_width, qr_height = img.size
+        logo_size = int(qr_width * 0.2)
+        logo = logo.resize((logo_size, logo_size))
+        pos = ((qr_width - logo_size) // 2, (qr_height - logo_size) // 2)
+
+        mask = Image.new("L", (logo_size, logo_size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, logo_size, logo_size), fill=255)
+
+        img.paste(Image.new("RGB", (logo_size, logo_size), "white"), pos, mask=mask)
+        img.paste(logo, pos, mask=logo if logo.mode == "RGBA" else None)
+
+    if style['frame']:
+        frame = style['frame']
+        framed_size = (img.size[0] + frame * 2, img.size[1] + frame * 2)
+        framed = Image.new("RGB", framed_size, "white")
+        ImageDraw.Draw(framed).rounded_rectangle([(0, 0), framed_size], radius=style['corner_radius'], outline="black", width=4)
+        framed.paste(img, (frame, frame))
+        img = framed
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=8)
+def _matrix(data, border):
+    """QR modules (border included) as rows of booleans, shared by the matrix-based renderers"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+def _logo_bytes():
+    """Raw logo file for embedding in SVG (no decoding needed)"""
+    if not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, 'rb') as f:
+        return f.read()
+
+
+def _render_svg(data, style):
+    """
+    QR as one <path> of horizontal runs; built from the module matrix
+    without PIL. Sized in modules via viewBox, so it scales losslessly.
+    """
+    matrix = _matrix(data, style['border'])
+    size = len(matrix)
+
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+
+    pixels = size * style['box_size']
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">',
+        f'<rect width="{size}" height="{size}" fill="#fff"/>',
+        f'<path fill="{style["fill"]}" d="{"".join(runs)}"/>'
+    ]
+
+    logo = _logo_bytes() if style['logo'] else None
+    if logo:
+        logo_size = size * 0.2
+        offset = (size - logo_size) / 2
+        parts.append(f'<circle cx="{size / 2}" cy="{size / 2}" r="{logo_size / 2}" fill="#fff"/>')
+        parts.append(
+            f'<image x="{offset}" y="{offset}" width="{logo_size}" height="{logo_size}" '
+            f'href="data:image/png;base64,{base64.b64encode(logo).decode("ascii")}"/>'
+        )
+
+    parts.append('</svg>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _render_png_compact(data, style):
+    """
+    Small PNG for slow links: 1 pixel per module scaled with nearest
+    neighbour, no frame, saved as a 1-bit palette image (4-bit with a logo)
+    """
+    matrix = _matrix(data, style['border'])
+    size = len(matrix)
+    pixels = size * style['box_size']
+    fill = ImageColor.getrgb(style['fill'])
+
+    logo = _load_logo() if style['logo'] else None
+    if logo is None:
+        # Two-colour palette: white background, brand fill
+        img = Image.new('1', (size, size), 1)
+        img.putdata([0 if dark else 1 for row in matrix for dark in row])
+        paletted = img.resize((pixels, pixels), Image.NEAREST).convert('P')
+        paletted.putpalette([*fill, 255, 255, 255] + [0, 0, 0] * 254)
+        buf = io.BytesIO()
+        paletted.save(buf, format="PNG", optimize=True, bits=1)
+        return buf.getvalue()
+
+    # Dark modules as an 'L' mask (255 = fill), built from the matrix
+    dark = Image.new('L', (size, size), 0)
+    dark.putdata([255 if module else 0 for row in matrix for module in row])
+    rgb = Image.new('RGB', (pixels, pixels), 'white')
+    rgb.paste(fill, mask=dark.resize((pixels, pixels), Image.NEAREST))
+    logo_size = int(pixels * 0.2)
+    pos = ((pixels - logo_size) // 2, (pixels - logo_size) // 2)
+    mask = Image.new("L", (logo_size, logo_size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, logo_size, logo_size), fill=255)
+    rgb.paste(Image.new("RGB", (logo_size, logo_size), "white"), pos, mask=mask)
+    resized = logo.resize((logo_size, logo_size))
+    rgb.paste(resized, pos, mask=resized if resized.mode == "RGBA" else None)
+
+    buf = io.BytesIO()
+    rgb.quantize(colors=16, method=Image.Quantize.FASTOCTREE).save(buf, format="PNG", optimize=True, bits=4)
+    return buf.getvalue()
+
+
+# Renderers per format; the first mode listed is the fallback default
+MODES = {
+    "png": {"styled": _render_png, "compact": _render_png_compact},
+    "svg": {"path": _render_svg}
+}
+DEFAULT_MODES = {
+    "png": os.getenv('QR_PNG_MODE', 'styled'),
+    "svg": "path"
+}
+
+
+def resolve_mode(fmt, mode=None):
+    """Requested mode if the format has it, else the format's default"""
+    modes = MODES[fmt]
+    if mode in modes:
+        return mode
+    default = DEFAULT_MODES.get(fmt)
+    return default if default in modes else next(iter(modes))
+
+
+def _disk_path(key):
+    name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:24]
+    return os.path.join(QR_CACHE_DIR, f"wifi_qr_{name}.{key[1]}")
+
+
+def _render(credentials, style, key):
+    path = _disk_path(key) if QR_CACHE_DIR else None
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    data = MODES[key[1]][key[2]](wifi_string(credentials), style)
+
+    if path:
+        try:
+            os.makedirs(QR_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ QR disk cache write failed: {e}")
+    return data
+
+
+def get_qr(style=None, fmt='png', mode=None):
+    """
+    Rendered WiFi QR for the current credentials
+
+    Rendered once per (credentials, format, mode, style) and then served
+    from memory; concurrent first requests wait for one render. Rotating
+    SSID_* values changes the credential version, so the next call
+    renders afresh.
+
+    Args:
+        style (dict): Overrides for DEFAULT_STYLE
+        fmt (str): Key of FORMATS
+        mode (str): Renderer from MODES[fmt] (default: DEFAULT_MODES)
+
+    Returns:
+        dict: {"data": bytes, "b64": str, "mimetype": str, "mode": str,
+               "version": str, "etag": str}
+    """
+    style = {**DEFAULT_STYLE, **(style or {})}
+    mode = resolve_mode(fmt, mode)
+    credentials = wifi_credentials()
+    version = credential_version(credentials)
+    key = (version, fmt, mode, _style_key(style))
+
+    entry = _cache.get(key)
+    if entry is not None:
+        return entry
+
+    with _lock:
+        render_lock = _render_locks.setdefault(key, threading.Lock())
+
+    with render_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            return entry
+
+        data = _render(credentials, style, key)
+        entry = {
+            "data": data,
+            "b64": base64.b64encode(data).decode('utf-8'),
+            "mimetype": FORMATS[fmt],
+            "mode": mode,
+            "version": version,
+            "etag": f"{version}-{hashlib.sha256(data).hexdigest()[:16]}"
+        }
+
+        with _lock:
+            # Drop variants for rotated credentials first, then oldest
+            for stale in [k for k in _cache if k[0] != version]:
+                _cache.pop(stale, None)
+                _render_locks.pop(stale, None)
+            while len(_cache) >= MAX_ENTRIES:
+                _cache.pop(next(iter(_cache)))
+            _cache[key] = entry
+
+        print(f"✅ WiFi QR rendered ({fmt}/{mode}, {len(data)} bytes, version {version})")
+        return entry
+
+
+def clear():
+    """Forget every rendered QR (e.g. after changing the logo or style)"""
+    with _lock:
+        _cache.clear()
+        _render_locks.clear()
@@ -1,8 +1,9 @@
 # utils/wifi_service.py - MIGRATED TO SUPABASE
 
 from datetime import datetime
-from supabase import create_client
-import os
+from app.utils.supabase_gateway import get_supabase
+from app.utils.analytics_store import analytics_store
+from app.utils.cache import invalidate_admin_stats
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,10 +12,7 @@ class WiFiService:
     """WiFi and group management service (Supabase)"""
     
     def __init__(self):
-        self.supabase = create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
-        )
+        self.supabase = get_supabase()
     
     def check_expired_groups(self):
         """Check and expire groups that have passed their week_end date"""
@@ -35,9 +33,11 @@ class WiFiService:
                         'password_revealed': False
                     }).eq('id', group['id']).execute()
                     
+                    analytics_store.record_group_status_change(group.get('status', 'pending'), 'expired')
                     expired_count += 1
             
             if expired_count > 0:
+                invalidate_admin_stats()
                 print(f"✅ Expired {expired_count} groups")
             
             return expired_count
@@ -0,0 +1,55 @@
+# bench_qr.py - WIFI QR RENDERER MICRO-BENCHMARK
+#
+# Renders the WiFi QR with every format/mode in app/utils/wifi_qr.py (with
+# and without the logo) and reports render time and size, raw and gzipped.
+# Renders bypass the caches (including the shared module matrix), so times
+# are what a cache miss costs.
+#
+#   SSID_NAME=MyFi SSID_PASSWORD=secret python bench_qr.py --runs 200
+
+import argparse
+import gzip
+import os
+import statistics
+import time
+
+os.environ.setdefault('SSID_NAME', 'MyFi-Guest')
+os.environ.setdefault('SSID_PASSWORD', 'correct-horse-battery')
+
+from app.utils import wifi_qr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WiFi QR renderer benchmark")
+    parser.add_argument('--runs', type=int, default=100)
+    args = parser.parse_args()
+
+    data = wifi_qr.wifi_string()
+    logo_available = wifi_qr._load_logo() is not None
+
+    print(f"{'mode':<16}{'logo':<6}{'p50 ms':>9}{'p99 ms':>9}{'bytes':>9}{'gzip':>9}")
+    for fmt, modes in wifi_qr.MODES.items():
+        for mode, render in modes.items():
+            for logo in ((False, True) if logo_available else (False,)):
+                style = {**wifi_qr.DEFAULT_STYLE, "logo": logo}
+                render(data, style)  # warm up
+
+                times = []
+                for _ in range(args.runs):
+                    wifi_qr._matrix.cache_clear()
+                    started = time.perf_counter()
+                    output = render(data, style)
+                    times.append((time.perf_counter() - started) * 1000)
+
+                times.sort()
+                p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+                print(f"{fmt + '/' + mode:<16}{'yes' if logo else 'no':<6}"
+                      f"{statistics.median(times):>9.2f}{p99:>9.2f}"
+                      f"{len(output):>9}{len(gzip.compress(output)):>9}")
+
+    if not logo_available:
+        print(f"\n(no logo at {wifi_qr.LOGO_PATH}; set QR_LOGO_PATH to include logo variants)")
+
+
+if __name__ == '__main__':
+    main()
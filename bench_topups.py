@@ -0,0 +1,190 @@
+# bench_topups.py - STK TOP-UP LOAD TEST (run against daraja_simulator.py)
+#
+# Creates bench users, fires concurrent POST /api/mpesa/stk-push requests,
+# follows every job to success/failed, then compares each user's wallet
+# with what the simulator says the phone actually paid.
+#
+#   python daraja_simulator.py --port 8090 --duplicate-rate 0.2 &
+#   DARAJA_BASE_URL=http://127.0.0.1:8090 BASE_URL=http://127.0.0.1:5000 python main.py &
+#   python bench_topups.py --app http://127.0.0.1:5000 --sim http://127.0.0.1:8090 \
+#       --users 50 --topups 2000 --concurrency 100
+
+import argparse
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PASSWORD = "bench-password"
+DONE = ('success', 'failed')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def summary(name, values):
+    if not values:
+        return f"{name}: no samples"
+    return (f"{name}: n={len(values)} p50={percentile(values, 50) * 1000:.1f}ms "
+            f"p99={percentile(values, 99) * 1000:.1f}ms max={max(values) * 1000:.1f}ms "
+            f"mean={statistics.mean(values) * 1000:.1f}ms")
+
+
+class BenchUser:
+    def __init__(self, app_url, run_id, index, pool_size):
+        self.app_url = app_url
+        self.username = f"bench_{run_id}_{index}"
+        self.phone = f"2547{random.randint(10000000, 99999999)}"
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        self.start_balance = 0.0
+
+    def sign_up(self):
+        response = self.session.post(f"{self.app_url}/api/signup", json={
+            "username": self.username,
+            "password": PASSWORD,
+            "mpesa_phone": self.phone
+        }, timeout=30)
+        if response.status_code != 201:
+            raise RuntimeError(f"Signup failed for {self.username}: {response.status_code} {response.text[:200]}")
+
+    def balance(self):
+        response = self.session.get(f"{self.app_url}/api/check-wallet", timeout=30)
+        response.raise_for_status()
+        return float(response.json().get('wallet_balance') or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent STK top-up benchmark")
+    parser.add_argument('--app', default='http://127.0.0.1:5000', help="App base URL")
+    parser.add_argument('--sim', default='http://127.0.0.1:8090', help="Daraja simulator base URL")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--topups', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--min-amount', type=int, default=10)
+    parser.add_argument('--max-amount', type=int, default=500)
+    parser.add_argument('--settle-timeout', type=float, default=120, help="Seconds to wait for callbacks to land")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:6]
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    per_user_pool = max(4, args.concurrency // max(args.users, 1) + 4)
+
+    print(f"▶ Run {run_id}: {args.users} users, {args.topups} top-ups, concurrency {args.concurrency}")
+    sim_before = requests.get(f"{args.sim}/sim/state", timeout=10).json()
+
+    # 1. Users
+    users = [BenchUser(args.app, run_id, i, per_user_pool) for i in range(args.users)]
+    list(pool.map(lambda u: u.sign_up(), users))
+    for user, balance in zip(users, pool.map(lambda u: u.balance(), users)):
+        user.start_balance = balance
+    print(f"✓ {len(users)} users ready")
+
+    # 2. Fire top-ups
+    submit_latency = []
+    errors = {}
+    jobs = {}
+    lock = threading.Lock()
+
+    def top_up(n):
+        user = users[n % len(users)]
+        amount = random.randint(args.min_amount, args.max_amount)
+        started = time.perf_counter()
+        try:
+            response = user.session.post(f"{args.app}/api/mpesa/stk-push",
+                                         json={"phone": user.phone, "amount": amount}, timeout=60)
+            elapsed = time.perf_counter() - started
+        except requests.RequestException as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            return
+
+        with lock:
+            submit_latency.append(elapsed)
+            if response.status_code == 202:
+                jobs[response.json()['job_id']] = {"user": user, "started": started, "finished": None, "status": None}
+            else:
+                key = f"HTTP {response.status_code}"
+                errors[key] = errors.get(key, 0) + 1
+
+    wall_start = time.perf_counter()
+    list(pool.map(top_up, range(args.topups)))
+    submit_wall = time.perf_counter() - wall_start
+
+    # 3. Follow jobs to success/failed
+    def poll(job_id):
+        job = jobs[job_id]
+        try:
+            response = job['user'].session.get(f"{args.app}/api/mpesa/stk-push/{job_id}", timeout=30)
+            status = response.json().get('status') if response.ok else None
+        except requests.RequestException:
+            return
+        if status in DONE:
+            job['status'] = status
+            job['finished'] = time.perf_counter()
+
+    deadline = time.perf_counter() + args.settle_timeout
+    while time.perf_counter() < deadline:
+        open_jobs = [job_id for job_id, job in jobs.items() if job['finished'] is None]
+        if not open_jobs:
+            break
+        list(pool.map(poll, open_jobs))
+        time.sleep(args.poll_interval)
+    total_wall = time.perf_counter() - wall_start
+
+    # 4. Wallets vs what the simulator says each phone paid (retry until they agree or time out)
+    while True:
+        paid = requests.get(f"{args.sim}/sim/state", timeout=10).json()['paid_by_phone']
+        paid_before = sim_before['paid_by_phone']
+        rows = []
+        for user, balance in zip(users, pool.map(lambda u: u.balance(), users)):
+            expected = paid.get(user.phone, 0) - paid_before.get(user.phone, 0)
+            rows.append((user, expected, balance - user.start_balance))
+        mismatched = [r for r in rows if abs(r[1] - r[2]) > 0.001]
+        if not mismatched or time.perf_counter() >= deadline:
+            break
+        time.sleep(args.poll_interval * 4)
+
+    sim_after = requests.get(f"{args.sim}/sim/state", timeout=10).json()
+    end_to_end = [j['finished'] - j['started'] for j in jobs.values() if j['finished']]
+    statuses = {}
+    for job in jobs.values():
+        statuses[job['status'] or 'unresolved'] = statuses.get(job['status'] or 'unresolved', 0) + 1
+
+    print("\n============ RESULTS ============")
+    print(f"Submitted: {len(jobs)}/{args.topups} accepted (202) in {submit_wall:.2f}s "
+          f"= {len(jobs) / submit_wall if submit_wall else 0:.1f} req/s")
+    print(f"Completed: {len(end_to_end)} in {total_wall:.2f}s "
+          f"= {len(end_to_end) / total_wall if total_wall else 0:.1f} top-ups/s")
+    print(summary("Submit latency (HTTP 202)", submit_latency))
+    print(summary("End-to-end (submit → success/failed)", end_to_end))
+    print(f"Job outcomes: {statuses}")
+    if errors:
+        print(f"Errors: {errors}")
+
+    stats_before, stats_after = sim_before['stats'], sim_after['stats']
+    print("Simulator: " + ", ".join(f"{k}={stats_after[k] - stats_before.get(k, 0)}" for k in stats_after))
+
+    over = [r for r in mismatched if r[2] > r[1]]
+    under = [r for r in mismatched if r[2] < r[1]]
+    print(f"\nWallet check: {len(users) - len(mismatched)}/{len(users)} consistent, "
+          f"{len(over)} over-credited, {len(under)} under-credited")
+    for user, expected, credited in mismatched[:20]:
+        print(f"  ✗ {user.username} ({user.phone}): paid {expected}, credited {credited:g}")
+
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
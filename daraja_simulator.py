@@ -0,0 +1,265 @@
+# daraja_simulator.py - LOCAL SAFARICOM DARAJA STAND-IN FOR LOAD TESTING
+#
+# Serves the three Daraja endpoints the app uses (OAuth, STK push, STK query)
+# and sends STK callbacks back to the app with configurable latency, failure
+# and duplicate rates. Point the app at it with:
+#
+#   DARAJA_BASE_URL=http://127.0.0.1:8090 BASE_URL=http://127.0.0.1:5000 \
+#   MPESA_CONSUMER_KEY=sim MPESA_CONSUMER_SECRET=sim python main.py
+#
+# then run:  python daraja_simulator.py --port 8090 --failure-rate 0.1
+# (bench_topups.py drives load through the app and checks balances against
+# GET /sim/state)
+
+import argparse
+import random
+import string
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+config = {
+    "latency_ms": 50,            # Added to every API response
+    "callback_delay": 2.0,       # Seconds before the callback is sent (mean)
+    "callback_jitter": 1.0,      # +/- seconds around callback_delay
+    "failure_rate": 0.1,         # Share of pushes the "customer" cancels (ResultCode 1032)
+    "reject_rate": 0.0,          # Share of pushes Daraja refuses outright (HTTP 500)
+    "duplicate_rate": 0.05,      # Share of callbacks delivered twice
+    "drop_rate": 0.0,            # Share of callbacks never delivered (for reconcilers)
+    "token_ttl": 3599
+}
+
+_lock = threading.Lock()
+_tokens = set()
+_pushes = {}
+_stats = {
+    "tokens_issued": 0,
+    "pushes": 0,
+    "rejected": 0,
+    "queries": 0,
+    "callbacks_sent": 0,
+    "callbacks_failed": 0,
+    "duplicates_sent": 0,
+    "dropped": 0
+}
+
+_http = requests.Session()
+_http.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=64))
+_http.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=64))
+
+
+def _count(key, n=1):
+    with _lock:
+        _stats[key] += n
+
+
+def _latency():
+    if config['latency_ms']:
+        time.sleep(config['latency_ms'] / 1000)
+
+
+def _authorized():
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else None
+    with _lock:
+        return token in _tokens
+
+
+def _receipt():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def _callback_body(push):
+    body = {
+        "MerchantRequestID": push['merchant_request_id'],
+        "CheckoutRequestID": push['checkout_request_id'],
+        "ResultCode": push['result_code'],
+        "ResultDesc": push['result_desc']
+    }
+    if push['result_code'] == 0:
+        body["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": push['amount']},
+            {"Name": "MpesaReceiptNumber", "Value": push['receipt']},
+            {"Name": "TransactionDate", "Value": int(time.strftime('%Y%m%d%H%M%S'))},
+            {"Name": "PhoneNumber", "Value": int(push['phone'])}
+        ]}
+    return {"Body": {"stkCallback": body}}
+
+
+def _deliver(push, duplicate=False):
+    try:
+        response = _http.post(push['callback_url'], json=_callback_body(push), timeout=10)
+        _count('duplicates_sent' if duplicate else 'callbacks_sent')
+        if response.status_code >= 400:
+            _count('callbacks_failed')
+    except Exception as e:
+        _count('callbacks_failed')
+        print(f"⚠️ Callback to {push['callback_url']} failed: {e}")
+
+
+def _complete(checkout_request_id):
+    """Customer answers the prompt: settle the push and call the app back"""
+    delay = max(0.0, config['callback_delay'] + random.uniform(-config['callback_jitter'], config['callback_jitter']))
+    time.sleep(delay)
+
+    with _lock:
+        push = _pushes[checkout_request_id]
+        push['state'] = 'done'
+        push['completed_at'] = time.time()
+        snapshot = dict(push)
+
+    if random.random() < config['drop_rate']:
+        _count('dropped')
+        return
+
+    _deliver(snapshot)
+    if random.random() < config['duplicate_rate']:
+        time.sleep(random.uniform(0, 0.5))
+        _deliver(snapshot, duplicate=True)
+
+
+# ============ DARAJA API ============
+
+@app.route('/oauth/v1/generate', methods=['GET'])
+def oauth():
+    _latency()
+    if not request.authorization:
+        return jsonify({"errorCode": "400.008.01", "errorMessage": "Invalid Authentication passed"}), 400
+
+    token = uuid.uuid4().hex
+    with _lock:
+        _tokens.add(token)
+        _stats['tokens_issued'] += 1
+    return jsonify({"access_token": token, "expires_in": str(config['token_ttl'])})
+
+
+@app.route('/mpesa/stkpush/v1/processrequest', methods=['POST'])
+def stk_push():
+    _latency()
+    if not _authorized():
+        return jsonify({"errorCode": "404.001.04", "errorMessage": "Invalid Access Token"}), 401
+
+    data = request.get_json(silent=True) or {}
+    missing = [k for k in ('BusinessShortCode', 'Password', 'Timestamp', 'Amount', 'PartyA', 'PhoneNumber', 'CallBackURL') if not data.get(k)]
+    if missing:
+        return jsonify({"errorCode": "400.002.02", "errorMessage": f"Bad Request - Invalid {missing[0]}"}), 400
+
+    if random.random() < config['reject_rate']:
+        _count('rejected')
+        return jsonify({"errorCode": "500.001.1001", "errorMessage": "Unable to lock subscriber, a transaction is already in process for the current subscriber"}), 500
+
+    cancelled = random.random() < config['failure_rate']
+    push = {
+        "merchant_request_id": f"{random.randint(10000, 99999)}-{random.randint(1000000, 9999999)}-1",
+        "checkout_request_id": f"ws_CO_{time.strftime('%d%m%Y%H%M%S')}{uuid.uuid4().hex[:12]}",
+        "phone": str(data['PhoneNumber']),
+        "amount": int(data['Amount']),
+        "callback_url": data['CallBackURL'],
+        "result_code": 1032 if cancelled else 0,
+        "result_desc": "Request cancelled by user" if cancelled else "The service request is processed successfully.",
+        "receipt": None if cancelled else _receipt(),
+        "state": 'pending',
+        "created_at": time.time()
+    }
+
+    with _lock:
+        _pushes[push['checkout_request_id']] = push
+        _stats['pushes'] += 1
+
+    threading.Thread(target=_complete, args=(push['checkout_request_id'],), daemon=True).start()
+
+    return jsonify({
+        "MerchantRequestID": push['merchant_request_id'],
+        "CheckoutRequestID": push['checkout_request_id'],
+        "ResponseCode": "0",
+        "ResponseDescription": "Success. Request accepted for processing",
+        "CustomerMessage": "Success. Request accepted for processing"
+    })
+
+
+@app.route('/mpesa/stkpushquery/v1/query', methods=['POST'])
+def stk_query():
+    _latency()
+    if not _authorized():
+        return jsonify({"errorCode": "404.001.04", "errorMessage": "Invalid Access Token"}), 401
+
+    _count('queries')
+    data = request.get_json(silent=True) or {}
+    with _lock:
+        push = dict(_pushes.get(data.get('CheckoutRequestID')) or {})
+
+    if not push:
+        return jsonify({"requestId": uuid.uuid4().hex, "errorCode": "400.002.02", "errorMessage": "Bad Request - Invalid CheckoutRequestID"}), 400
+
+    if push['state'] == 'pending':
+        return jsonify({"requestId": uuid.uuid4().hex, "errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"}), 500
+
+    return jsonify({
+        "ResponseCode": "0",
+        "ResponseDescription": "The service request has been accepted successsfully",
+        "MerchantRequestID": push['merchant_request_id'],
+        "CheckoutRequestID": push['checkout_request_id'],
+        "ResultCode": str(push['result_code']),
+        "ResultDesc": push['result_desc']
+    })
+
+
+# ============ SIMULATOR CONTROL ============
+
+@app.route('/sim/state', methods=['GET'])
+def sim_state():
+    """Counters plus the money each phone actually paid (successful pushes)"""
+    paid = {}
+    with _lock:
+        pending = 0
+        for push in _pushes.values():
+            if push['state'] == 'pending':
+                pending += 1
+            elif push['result_code'] == 0:
+                paid[push['phone']] = paid.get(push['phone'], 0) + push['amount']
+        stats = dict(_stats)
+
+    return jsonify({"stats": stats, "pending": pending, "paid_by_phone": paid, "config": config})
+
+
+@app.route('/sim/config', methods=['POST'])
+def sim_config():
+    """Change rates/latency at runtime"""
+    for key, value in (request.get_json(silent=True) or {}).items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    return jsonify(config)
+
+
+@app.route('/sim/reset', methods=['POST'])
+def sim_reset():
+    with _lock:
+        _pushes.clear()
+        for key in _stats:
+            _stats[key] = 0
+    return jsonify({"reset": True})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local Daraja simulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=int, default=config['latency_ms'])
+    parser.add_argument('--callback-delay', type=float, default=config['callback_delay'])
+    parser.add_argument('--callback-jitter', type=float, default=config['callback_jitter'])
+    parser.add_argument('--failure-rate', type=float, default=config['failure_rate'])
+    parser.add_argument('--reject-rate', type=float, default=config['reject_rate'])
+    parser.add_argument('--duplicate-rate', type=float, default=config['duplicate_rate'])
+    parser.add_argument('--drop-rate', type=float, default=config['drop_rate'])
+    args = parser.parse_args()
+
+    for key in ('latency_ms', 'callback_delay', 'callback_jitter', 'failure_rate', 'reject_rate', 'duplicate_rate', 'drop_rate'):
+        config[key] = getattr(args, key)
+
+    print(f"✅ Daraja simulator on http://{args.host}:{args.port} {config}")
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -37,10 +37,30 @@ socketio = SocketIO(
 from app.routes import register_blueprints
 register_blueprints(app)
 
+# Per-request Supabase query counts (Server-Timing / X-DB-Queries headers)
+from app.utils.query_metrics import init_query_metrics
+init_query_metrics(app)
+
 # ⭐ ADD THIS LINE - Register SocketIO events for calls
 from app.routes.call_routes import register_socketio_events
 register_socketio_events(socketio)
 
+# STK push workers report payment progress to the user's sockets
+from app.utils.stk_jobs import init_stk_jobs
+init_stk_jobs(socketio)
+
+# Settle STK pushes whose callback never arrived
+from app.utils.stk_reconciler import start_reconciler
+start_reconciler()
+
+# Retry stored M-Pesa callbacks that failed or were lost by a restart
+from app.utils.mpesa_callbacks import start_sweeper
+start_sweeper()
+
+# Known M-Pesa receipt numbers for duplicate checks (loads in the background)
+from app.utils.receipt_index import receipt_index
+receipt_index.load_in_background()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -0,0 +1,25 @@
+-- sql/001_get_user_contacts.sql
+-- Contacts joined with usernames in one round-trip (used by GET /api/contacts).
+-- Run in the Supabase SQL editor. Without it the route falls back to a
+-- batched IN lookup.
+
+create index if not exists contacts_user_id_saved_at_idx
+    on contacts (user_id, saved_at desc);
+
+create or replace function get_user_contacts(p_user_id bigint)
+returns table (
+    id bigint,
+    contact_user_id bigint,
+    custom_name text,
+    saved_at timestamptz,
+    username text
+)
+language sql
+stable
+as $$
+    select c.id, c.contact_user_id, c.custom_name, c.saved_at, u.username
+    from contacts c
+    join "user" u on u.id = c.contact_user_id
+    where c.user_id = p_user_id
+    order by c.saved_at desc;
+$$;
@@ -0,0 +1,10 @@
+-- sql/002_call_history_indexes.sql
+-- GET /api/call-history filters on caller_id OR callee_id, orders by
+-- started_at desc, id desc and pages with a (started_at, id) keyset. One index per side
+-- lets Postgres answer each branch of the OR with a bounded index scan.
+
+create index if not exists call_history_caller_started_idx
+    on call_history (caller_id, started_at desc);
+
+create index if not exists call_history_callee_started_idx
+    on call_history (callee_id, started_at desc);
@@ -0,0 +1,67 @@
+-- sql/003_analytics.sql
+-- Aggregates for AnalyticsService. Each returns only the numbers the admin
+-- dashboard shows, so cost no longer scales with rows transferred.
+
+create or replace function analytics_dashboard_stats()
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'total_users', (select count(*) from "user"),
+        'total_groups', (select count(*) from "group"),
+        'active_groups', (select count(*) from "group" where status = 'active'),
+        'expired_groups', (select count(*) from "group" where status = 'expired'),
+        'total_revenue', (select coalesce(sum(amount), 0) from payment where verified),
+        'pending_payments', (
+            select count(*) from payment
+            where not coalesce(verified, false) and not coalesce(rejected, false)
+        )
+    );
+$$;
+
+create or replace function analytics_revenue_by_day(p_since timestamptz)
+returns table (day text, revenue numeric)
+language sql
+stable
+as $$
+    select to_char(created_at at time zone 'UTC', 'YYYY-MM-DD') as day,
+           sum(amount) as revenue
+    from payment
+    where verified and created_at >= p_since
+    group by 1
+    order by 1;
+$$;
+
+create or replace function analytics_groups_by_day()
+returns table (day text, groups bigint)
+language sql
+stable
+as $$
+    select to_char(created_at at time zone 'UTC', 'YYYY-MM-DD') as day,
+           count(*) as groups
+    from "group"
+    group by 1
+    order by 1;
+$$;
+
+create or replace function analytics_group_sizes()
+returns table (size int, groups bigint)
+language sql
+stable
+as $$
+    select s.size, count(*) as groups
+    from (
+        select count(*)::int as size
+        from member
+        group by group_id
+    ) s
+    group by s.size
+    order by s.size;
+$$;
+
+create index if not exists payment_verified_created_at_idx
+    on payment (created_at) where verified;
+
+create index if not exists group_status_idx
+    on "group" (status);
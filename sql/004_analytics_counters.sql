@@ -0,0 +1,43 @@
+-- sql/004_analytics_counters.sql
+-- Extra aggregates used to reconcile the in-memory analytics counters
+-- (app/utils/analytics_store.py). Replaces analytics_dashboard_stats from 003.
+
+create or replace function analytics_dashboard_stats()
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'total_users', (select count(*) from "user"),
+        'total_groups', (select count(*) from "group"),
+        'active_groups', (select count(*) from "group" where status = 'active'),
+        'expired_groups', (select count(*) from "group" where status = 'expired'),
+        'pending_groups', (select count(*) from "group" where status = 'pending'),
+        'total_revenue', (select coalesce(sum(amount), 0) from payment where verified),
+        'pending_payments', (
+            select count(*) from payment
+            where not coalesce(verified, false) and not coalesce(rejected, false)
+        )
+    );
+$$;
+
+create or replace function analytics_wallet_topups(p_since timestamptz)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'count', (select count(*) from transactions where status = 'success'),
+        'total', (select coalesce(sum(amount), 0) from transactions where status = 'success'),
+        'by_day', coalesce((
+            select json_object_agg(day, total)
+            from (
+                select to_char(coalesce(updated_at, created_at) at time zone 'UTC', 'YYYY-MM-DD') as day,
+                       sum(amount) as total
+                from transactions
+                where status = 'success' and coalesce(updated_at, created_at) >= p_since
+                group by 1
+            ) d
+        ), '{}'::json)
+    );
+$$;
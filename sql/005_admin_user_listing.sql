@@ -0,0 +1,17 @@
+-- sql/005_admin_user_listing.sql
+-- GET /admin/api/users pages with a (created_at, id) keyset, newest first,
+-- and filters by role / wallet_status / username prefix. These indexes keep
+-- every page a bounded index scan however large the user table grows.
+
+create index if not exists user_created_id_idx
+    on "user" (created_at desc, id desc);
+
+create index if not exists user_role_created_idx
+    on "user" (role, created_at desc, id desc);
+
+create index if not exists user_wallet_status_created_idx
+    on "user" (wallet_status, created_at desc, id desc);
+
+-- username like 'prefix%' (usernames are stored lowercase)
+create index if not exists user_username_prefix_idx
+    on "user" (username text_pattern_ops);
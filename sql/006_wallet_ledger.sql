@@ -0,0 +1,77 @@
+-- sql/006_wallet_ledger.sql
+-- Append-only wallet ledger plus one atomic credit/debit function
+-- (used by app/utils/wallet_ledger.py). The balance on "user" stays the
+-- materialized total; wallet_post changes it and records the entry in
+-- the same transaction, so concurrent callbacks can't lose money.
+
+create table if not exists wallet_ledger (
+    id bigserial primary key,
+    user_id bigint not null references "user" (id) on delete cascade,
+    amount numeric(12, 2) not null,          -- credit > 0, debit < 0
+    balance_after numeric(12, 2) not null,
+    kind text not null,                      -- mpesa_topup, manual_topup, group_payment, ...
+    reference text,                          -- receipt / checkout / payment id
+    created_at timestamptz not null default now()
+);
+
+create index if not exists wallet_ledger_user_created_idx
+    on wallet_ledger (user_id, created_at desc);
+
+-- One entry per external reference: retried callbacks become no-ops
+create unique index if not exists wallet_ledger_kind_reference_idx
+    on wallet_ledger (kind, reference)
+    where reference is not null;
+
+create or replace function wallet_post(
+    p_user_id bigint,
+    p_amount numeric,
+    p_kind text,
+    p_reference text default null,
+    p_wallet_status text default null
+)
+returns json
+language plpgsql
+as $$
+declare
+    v_balance numeric;
+    v_entry_id bigint;
+begin
+    if p_reference is not null then
+        select id, balance_after into v_entry_id, v_balance
+        from wallet_ledger
+        where kind = p_kind and reference = p_reference;
+
+        if found then
+            return json_build_object('balance', v_balance, 'entry_id', v_entry_id, 'duplicate', true);
+        end if;
+    end if;
+
+    begin
+        update "user"
+        set wallet_balance = coalesce(wallet_balance, 0) + p_amount,
+            wallet_status = coalesce(p_wallet_status, wallet_status)
+        where id = p_user_id
+          and coalesce(wallet_balance, 0) + p_amount >= 0
+        returning wallet_balance into v_balance;
+
+        if not found then
+            if exists (select 1 from "user" where id = p_user_id) then
+                raise exception 'insufficient wallet balance' using errcode = 'P0001';
+            end if;
+            raise exception 'user % not found', p_user_id using errcode = 'P0002';
+        end if;
+
+        insert into wallet_ledger (user_id, amount, balance_after, kind, reference)
+        values (p_user_id, p_amount, v_balance, p_kind, p_reference)
+        returning id into v_entry_id;
+    exception when unique_violation then
+        -- Same reference posted concurrently: the balance update is rolled back
+        select id, balance_after into v_entry_id, v_balance
+        from wallet_ledger
+        where kind = p_kind and reference = p_reference;
+        return json_build_object('balance', v_balance, 'entry_id', v_entry_id, 'duplicate', true);
+    end;
+
+    return json_build_object('balance', v_balance, 'entry_id', v_entry_id, 'duplicate', false);
+end;
+$$;
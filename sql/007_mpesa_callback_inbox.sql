@@ -0,0 +1,26 @@
+-- sql/007_mpesa_callback_inbox.sql
+-- Durable inbox for Daraja STK callbacks (app/utils/mpesa_callbacks.py).
+-- POST /api/mpesa/callback only inserts here and acknowledges; a
+-- background worker applies the payment. The unique keys make retried
+-- callbacks no-ops.
+
+create table if not exists mpesa_callback (
+    id bigserial primary key,
+    checkout_request_id text not null unique,
+    mpesa_receipt_number text unique,
+    result_code integer not null,
+    payload jsonb not null,
+    status text not null default 'queued',   -- queued, done, failed
+    attempts integer not null default 0,
+    error text,
+    received_at timestamptz not null default now(),
+    processed_at timestamptz
+);
+
+-- Sweeps only look at unfinished rows
+create index if not exists mpesa_callback_unfinished_idx
+    on mpesa_callback (received_at)
+    where status <> 'done';
+
+create index if not exists transactions_checkout_request_id_idx
+    on transactions (checkout_request_id);
@@ -0,0 +1,12 @@
+-- sql/008_pending_transactions.sql
+-- The STK reconciler (app/utils/stk_reconciler.py) pages through pending
+-- STK transactions by id; the admin wallet-confirmation page lists pending
+-- rows by created_at. Both only touch the small pending slice.
+
+create index if not exists transactions_pending_stk_idx
+    on transactions (id)
+    where status = 'pending' and checkout_request_id is not null;
+
+create index if not exists transactions_pending_created_at_idx
+    on transactions (created_at)
+    where status = 'pending';
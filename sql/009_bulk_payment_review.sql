@@ -0,0 +1,68 @@
+-- sql/009_bulk_payment_review.sql
+-- Bulk approval of manual M-Pesa payments in one round trip
+-- (POST /admin/dashboard/bulk-review, app/utils/payment_review.py).
+-- Each item is claimed (pending -> success) and credited through
+-- wallet_post inside its own savepoint, so one bad item never undoes the
+-- others and a receipt that was already credited leaves its transaction
+-- pending. Any other error (bad id, amount out of range) is reported as
+-- that item's 'error' instead of aborting the batch.
+
+create or replace function confirm_manual_payments(p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_item jsonb;
+    v_post json;
+    v_results jsonb := '[]'::jsonb;
+begin
+    for v_item in select * from jsonb_array_elements(p_items)
+    loop
+        begin
+            update transactions
+            set status = 'success',
+                amount = (v_item ->> 'amount')::numeric,
+                mpesa_receipt_number = v_item ->> 'reference',
+                result_desc = v_item ->> 'result_desc',
+                updated_at = now()
+            where id = (v_item ->> 'transaction_id')::bigint
+              and status = 'pending';
+
+            if not found then
+                v_results := v_results || jsonb_build_object(
+                    'transaction_id', v_item -> 'transaction_id', 'status', 'not_pending');
+                continue;
+            end if;
+
+            v_post := wallet_post(
+                (v_item ->> 'user_id')::bigint,
+                (v_item ->> 'amount')::numeric,
+                'mpesa_topup',
+                v_item ->> 'reference',
+                'approved'
+            );
+
+            if (v_post ->> 'duplicate')::boolean then
+                raise exception 'receipt already credited' using errcode = 'P0003';
+            end if;
+
+            v_results := v_results || jsonb_build_object(
+                'transaction_id', v_item -> 'transaction_id',
+                'status', 'confirmed',
+                'balance', v_post -> 'balance');
+        exception
+            when sqlstate 'P0003' then
+                v_results := v_results || jsonb_build_object(
+                    'transaction_id', v_item -> 'transaction_id', 'status', 'duplicate');
+            when sqlstate 'P0002' then
+                v_results := v_results || jsonb_build_object(
+                    'transaction_id', v_item -> 'transaction_id', 'status', 'user_not_found');
+            when others then
+                v_results := v_results || jsonb_build_object(
+                    'transaction_id', v_item -> 'transaction_id', 'status', 'error', 'message', sqlerrm);
+        end;
+    end loop;
+
+    return v_results;
+end;
+$$;
@@ -0,0 +1,16 @@
+-- sql/010_unique_receipt_numbers.sql
+-- One transaction per M-Pesa receipt number. Manual submissions
+-- (app/routes/manual_payment.py) insert directly and treat a 23505 as
+-- "already submitted", so two concurrent submissions of the same code
+-- can't both succeed even across processes. STK callbacks
+-- (sql/013_apply_stk_payment.sql) take a receipt over from a submission
+-- that was not credited.
+--
+-- Existing duplicates must be resolved first; list them with:
+--   select mpesa_receipt_number, count(*) from transactions
+--   where mpesa_receipt_number is not null
+--   group by 1 having count(*) > 1;
+
+create unique index if not exists transactions_mpesa_receipt_number_key
+    on transactions (mpesa_receipt_number)
+    where mpesa_receipt_number is not null;
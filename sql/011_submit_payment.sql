@@ -0,0 +1,52 @@
+-- sql/011_submit_payment.sql
+-- Group payment submission in one round trip (app/utils/group_payments.py):
+-- resolves user -> member -> group and inserts the unverified payment,
+-- returning it together with the group's balance and target.
+
+create or replace function submit_payment(
+    p_user_id bigint,
+    p_amount numeric,
+    p_mpesa_code text default null
+)
+returns json
+language plpgsql
+as $$
+declare
+    v_member_id bigint;
+    v_member member%rowtype;
+    v_group "group"%rowtype;
+    v_payment payment%rowtype;
+begin
+    select member_id into v_member_id from "user" where id = p_user_id;
+    if not found then
+        raise exception 'User not found' using errcode = 'P0002';
+    end if;
+    if v_member_id is null then
+        raise exception 'You''re not in a group' using errcode = 'P0001';
+    end if;
+
+    select * into v_member from member where id = v_member_id;
+    if not found then
+        raise exception 'Member not found' using errcode = 'P0002';
+    end if;
+
+    select * into v_group from "group" where id = v_member.group_id;
+    if not found then
+        raise exception 'Group not found' using errcode = 'P0002';
+    end if;
+
+    insert into payment (member_id, group_id, amount, mpesa_code, verified, member_name, group_name)
+    values (v_member.id, v_group.id, p_amount, nullif(btrim(p_mpesa_code), ''), false, v_member.name, v_group.name)
+    returning * into v_payment;
+
+    return json_build_object(
+        'payment', row_to_json(v_payment),
+        'group', json_build_object(
+            'id', v_group.id,
+            'name', v_group.name,
+            'current_balance', coalesce(v_group.current_balance, 0),
+            'target_amount', coalesce(v_group.target_amount, 0)
+        )
+    );
+end;
+$$;
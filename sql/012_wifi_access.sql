@@ -0,0 +1,38 @@
+-- sql/012_wifi_access.sql
+-- Everything the WiFi access gates need in one round trip
+-- (app/utils/wifi_access.py): the user, their member row's group and, for
+-- pending groups only, how many members have joined. Returns null when the
+-- user does not exist.
+
+create or replace function wifi_access(p_user_id bigint)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'user', json_build_object(
+            'id', u.id,
+            'username', u.username,
+            'wallet_balance', coalesce(u.wallet_balance, 0),
+            'member_id', u.member_id
+        ),
+        'group', case when g.id is null then null else json_build_object(
+            'id', g.id,
+            'name', g.name,
+            'status', g.status,
+            'week_end', g.week_end,
+            'current_balance', coalesce(g.current_balance, 0),
+            'target_amount', coalesce(g.target_amount, 0),
+            'max_members', g.max_members
+        ) end,
+        'member_count', case when g.status = 'pending'
+            then (select count(*) from member m2 where m2.group_id = g.id)
+        end
+    )
+    from "user" u
+    left join member m on m.id = u.member_id
+    left join "group" g on g.id = m.group_id
+    where u.id = p_user_id;
+$$;
+
+create index if not exists member_group_id_idx on member (group_id);
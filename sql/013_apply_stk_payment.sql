@@ -0,0 +1,98 @@
+-- sql/013_apply_stk_payment.sql
+-- Successful STK payment in one transaction (app/utils/mpesa_callbacks.py):
+-- lock the pending transaction, credit the wallet through wallet_post
+-- (keyed on the CheckoutRequestID, so a retried callback or an STK query
+-- result for the same push is a no-op) and mark it success. Either both
+-- happen or neither does, so a failed credit leaves the callback to be
+-- retried instead of a 'success' row with no money behind it.
+--
+-- The receipt is unique across transactions (sql/010). If a manual
+-- submission already holds it, the push wins: a pending or rejected
+-- submission gives the receipt up and is closed as failed; one that was
+-- already credited means this money is already in a wallet, so the push
+-- is closed as failed instead of credited twice (conflict_user_id says
+-- whose wallet, so the payer is only told "already credited" if it was
+-- theirs).
+
+create or replace function apply_stk_payment(
+    p_checkout_request_id text,
+    p_amount numeric default null,
+    p_receipt text default null,
+    p_result_desc text default null
+)
+returns json
+language plpgsql
+as $$
+declare
+    v_tx transactions%rowtype;
+    v_other transactions%rowtype;
+    v_amount numeric;
+    v_post json;
+begin
+    select * into v_tx
+    from transactions
+    where checkout_request_id = p_checkout_request_id
+    order by id
+    limit 1
+    for update;
+
+    if not found then
+        return json_build_object('found', false);
+    end if;
+
+    if v_tx.status = 'success' then
+        -- Settled earlier (e.g. by an STK query); just keep the receipt
+        update transactions
+        set mpesa_receipt_number = p_receipt
+        where id = v_tx.id and mpesa_receipt_number is null and p_receipt is not null
+          and not exists (select 1 from transactions where mpesa_receipt_number = p_receipt);
+
+        return json_build_object('found', true, 'applied', false, 'user_id', v_tx.user_id, 'amount', v_tx.amount);
+    end if;
+
+    if p_receipt is not null then
+        select * into v_other
+        from transactions
+        where mpesa_receipt_number = p_receipt and id <> v_tx.id
+        for update;
+
+        if found and v_other.status = 'success' then
+            update transactions
+            set status = 'failed',
+                result_desc = format('Receipt %s already credited (transaction %s)', p_receipt, v_other.id),
+                updated_at = now()
+            where id = v_tx.id;
+
+            return json_build_object('found', true, 'applied', false, 'conflict', v_other.id,
+                                     'conflict_user_id', v_other.user_id,
+                                     'user_id', v_tx.user_id, 'amount', v_tx.amount);
+        elsif found then
+            update transactions
+            set status = 'failed',
+                mpesa_receipt_number = null,
+                result_desc = format('Receipt %s credited by STK push %s', p_receipt, p_checkout_request_id),
+                updated_at = now()
+            where id = v_other.id;
+        end if;
+    end if;
+
+    v_amount := coalesce(p_amount, v_tx.amount);
+    v_post := wallet_post(v_tx.user_id, v_amount, 'mpesa_topup', p_checkout_request_id, 'approved');
+
+    update transactions
+    set status = 'success',
+        mpesa_receipt_number = coalesce(p_receipt, mpesa_receipt_number),
+        result_desc = p_result_desc,
+        updated_at = now()
+    where id = v_tx.id;
+
+    return json_build_object(
+        'found', true,
+        'applied', true,
+        'user_id', v_tx.user_id,
+        'amount', v_amount,
+        'balance', v_post -> 'balance',
+        'duplicate', (v_post ->> 'duplicate')::boolean
+    );
+end;
+$$;
@@ -0,0 +1,15 @@
+-- sql/014_unique_payment_codes.sql
+-- One live group payment per M-Pesa code (app/utils/group_payments.py).
+-- submit_payment and its fallback both insert directly and report a 23505
+-- as "already submitted", so the same code can't be submitted twice, even
+-- concurrently. A rejected payment frees its code for a corrected
+-- resubmission.
+--
+-- Existing duplicates must be resolved first; list them with:
+--   select upper(btrim(mpesa_code)), count(*) from payment
+--   where mpesa_code is not null and rejected is not true
+--   group by 1 having count(*) > 1;
+
+create unique index if not exists payment_mpesa_code_key
+    on payment (upper(btrim(mpesa_code)))
+    where mpesa_code is not null and rejected is not true;
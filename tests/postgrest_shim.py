@@ -0,0 +1,318 @@
+# tests/postgrest_shim.py - POSTGREST STAND-IN BACKED BY A REAL POSTGRES DATABASE
+#
+# Translates the subset of the PostgREST HTTP API that the app uses into SQL
+# so supabase-py can run against a local database in tests. RPC calls run
+# the real functions from sql/; table reads support column lists, embedded
+# resources (rel(...) / rel!inner(...)), the usual filter operators,
+# or=/and= groups, order, limit/offset and count=exact/planned/estimated.
+
+import json
+import re
+import threading
+
+import httpx
+import psycopg
+
+_OPS = {
+    'eq': '=',
+    'neq': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'like': 'like',
+    'ilike': 'ilike'
+}
+_RESERVED = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns'}
+
+
+def _split(expr):
+    """Split on top-level commas (ignoring those inside parentheses)"""
+    parts, depth, current = [], 0, ''
+    for ch in expr:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        current += ch
+    if current:
+        parts.append(current)
+    return [p.strip() for p in parts]
+
+
+def _arg(value):
+    """JSON value as an untyped literal, so Postgres resolves the type as PostgREST does"""
+    if value is None:
+        return None
+    if isinstance(value, (bool, dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class PostgrestShim:
+    """httpx transport handler answering PostgREST requests from Postgres"""
+
+    def __init__(self, dsn):
+        self.conn = psycopg.connect(dsn, autocommit=True)
+        self.conn.execute("set timezone to 'UTC'")
+        self.lock = threading.Lock()
+        self.hidden_functions = set()  # Report these RPCs as not installed
+        self.requests = []  # (method, path, params) for assertions
+        self._columns = {}
+
+    # ============ SCHEMA HELPERS ============
+
+    def columns(self, table):
+        if table not in self._columns:
+            rows = self.conn.execute(
+                "select column_name from information_schema.columns "
+                "where table_schema = 'public' and table_name = %s",
+                [table]
+            ).fetchall()
+            self._columns[table] = {r[0] for r in rows}
+        return self._columns[table]
+
+    def _join(self, base, base_alias, rel, rel_alias):
+        """(join condition, to_many) for an embedded resource"""
+        if f"{rel}_id" in self.columns(base):
+            return f"{rel_alias}.id = {base_alias}.{_ident(rel + '_id')}", False
+        if f"{base}_id" in self.columns(rel):
+            return f"{rel_alias}.{_ident(base + '_id')} = {base_alias}.id", True
+        raise ValueError(f"No relationship between {base} and {rel}")
+
+    # ============ FILTERS ============
+
+    def _condition(self, alias, column, expr, args):
+        negate = expr.startswith('not.')
+        if negate:
+            expr = expr[4:]
+        op, _, value = expr.partition('.')
+        col = f"{alias}.{_ident(column)}"
+
+        if op == 'is':
+            sql = f"{col} is {'null' if value == 'null' else value}"
+        elif op == 'in':
+            values = [v.strip('"') for v in _split(value.strip('()'))]
+            sql = f"{col} in ({', '.join(['%s'] * len(values))})" if values else 'false'
+            args.extend(values)
+        elif op in _OPS:
+            if op in ('like', 'ilike'):
+                value = value.replace('*', '%')
+            sql = f"{col} {_OPS[op]} %s"
+            args.append(value.strip('"'))
+        else:
+            raise ValueError(f"Unsupported operator {op}")
+        return f"not ({sql})" if negate else sql
+
+    def _logic(self, alias, expr, joiner, args):
+        """or=(a.eq.1,and(b.gt.2,c.is.null)) style groups"""
+        parts = []
+        for part in _split(expr.strip()[1:-1]):
+            if part.startswith(('or(', 'and(')):
+                name, _, inner = part.partition('(')
+                parts.append(self._logic(alias, '(' + inner, name, args))
+            else:
+                column, _, rest = part.partition('.')
+                parts.append(self._condition(alias, column, rest, args))
+        return '(' + f" {joiner} ".join(parts) + ')'
+
+    # ============ READS ============
+
+    def _select_list(self, table, alias, select, filters, depth=0):
+        """SQL select expressions plus EXISTS clauses for !inner embeds"""
+        exprs, inner = [], []
+        for item in _split(select or '*'):
+            match = re.match(r'^(\w+)(!inner)?\((.*)\)$', item, re.S)
+            if not match:
+                exprs.append(f"{alias}.*" if item == '*' else f"{alias}.{_ident(item)}")
+                continue
+
+            rel, is_inner, sub_select = match.groups()
+            rel_alias = f"e{depth}_{rel}"
+            condition, to_many = self._join(table, alias, rel, rel_alias)
+            sub_exprs, _ = self._select_list(rel, rel_alias, sub_select, {}, depth + 1)
+
+            args = []
+            where = [condition] + [
+                self._condition(rel_alias, column, expr, args)
+                for column, expr in filters.get(rel, [])
+            ]
+            body = f"select {', '.join(sub_exprs)} from {_ident(rel)} {rel_alias} where {' and '.join(where)}"
+            if to_many:
+                exprs.append((f"(select coalesce(json_agg(x), '[]'::json) from ({body}) x) as {_ident(rel)}", args))
+            else:
+                exprs.append((f"(select row_to_json(x) from ({body}) x) as {_ident(rel)}", args))
+            if is_inner:
+                inner.append((f"exists (select 1 from {_ident(rel)} {rel_alias} where {' and '.join(where)})", list(args)))
+        return exprs, inner
+
+    def _read(self, table, params, prefer, head):
+        select = '*'
+        order = limit = offset = None
+        filters = {}  # embedded rel -> [(column, expr)]
+        where, where_args = [], []
+
+        for key, value in params:
+            if key == 'select':
+                select = value
+            elif key == 'order':
+                order = value
+            elif key == 'limit':
+                limit = int(value)
+            elif key == 'offset':
+                offset = int(value)
+            elif key in ('or', 'and'):
+                where.append(self._logic('t0', value, key, where_args))
+            elif key in _RESERVED:
+                continue
+            elif '.' in key:
+                rel, _, column = key.partition('.')
+                filters.setdefault(rel, []).append((column, value))
+            else:
+                where.append(self._condition('t0', key, value, where_args))
+
+        exprs, inner = self._select_list(table, 't0', select, filters)
+        select_sql, select_args = [], []
+        for expr in exprs:
+            if isinstance(expr, tuple):
+                select_sql.append(expr[0])
+                select_args.extend(expr[1])
+            else:
+                select_sql.append(expr)
+        for clause, args in inner:
+            where.append(clause)
+            where_args.extend(args)
+
+        from_sql = f"from {_ident(table)} t0" + (f" where {' and '.join(where)}" if where else '')
+
+        order_sql = ''
+        if order:
+            terms = []
+            for term in order.split(','):
+                column, *modifiers = term.split('.')
+                terms.append(' '.join([f"t0.{_ident(column)}"] + [
+                    {'asc': 'asc', 'desc': 'desc', 'nullsfirst': 'nulls first', 'nullslast': 'nulls last'}[m]
+                    for m in modifiers
+                ]))
+            order_sql = ' order by ' + ', '.join(terms)
+
+        page_sql = (f" limit {limit}" if limit is not None else '') + (f" offset {offset}" if offset else '')
+        sql = f"select {', '.join(select_sql)} {from_sql}{order_sql}{page_sql}"
+        rows = self.conn.execute(
+            f"select coalesce(json_agg(r), '[]'::json) from ({sql}) r",
+            select_args + where_args
+        ).fetchone()[0]
+
+        start = offset or 0
+        total = '*'
+        if 'count=exact' in prefer:
+            total = self.conn.execute(f"select count(*) {from_sql}", where_args).fetchone()[0]
+        elif 'count=planned' in prefer or 'count=estimated' in prefer:
+            # Like PostgREST: the planner's row estimate, not a count
+            plan = self.conn.execute(f"explain (format json) select 1 {from_sql}", where_args).fetchone()[0]
+            total = int(plan[0]['Plan']['Plan Rows'])
+        content_range = f"{start}-{start + len(rows) - 1}/{total}" if rows else f"*/{total}"
+
+        headers = {'content-range': content_range}
+        if head:
+            return httpx.Response(200, headers=headers)
+        return httpx.Response(200, json=rows, headers=headers)
+
+    # ============ WRITES ============
+
+    def _filters_sql(self, params, args):
+        where = []
+        for key, value in params:
+            if key in _RESERVED:
+                continue
+            if key in ('or', 'and'):
+                where.append(self._logic('t0', value, key, args))
+            else:
+                where.append(self._condition('t0', key, value, args))
+        return f" where {' and '.join(where)}" if where else ''
+
+    def _write(self, method, table, params, body, prefer):
+        args = []
+        if method == 'POST':
+            rows = body if isinstance(body, list) else [body]
+            columns = sorted({k for row in rows for k in row})
+            values = []
+            for row in rows:
+                values.append('(' + ', '.join(['%s'] * len(columns)) + ')')
+                args.extend(_arg(row.get(c)) for c in columns)
+            sql = f"insert into {_ident(table)} as t0 ({', '.join(map(_ident, columns))}) values {', '.join(values)}"
+        elif method == 'PATCH':
+            sets = []
+            for column, value in body.items():
+                sets.append(f"{_ident(column)} = %s")
+                args.append(_arg(value))
+            sql = f"update {_ident(table)} t0 set {', '.join(sets)}" + self._filters_sql(params, args)
+        else:
+            sql = f"delete from {_ident(table)} t0" + self._filters_sql(params, args)
+
+        rows = self.conn.execute(
+            f"with w as ({sql} returning t0.*) select coalesce(json_agg(w), '[]'::json) from w",
+            args
+        ).fetchone()[0]
+        if 'return=minimal' in prefer:
+            return httpx.Response(201 if method == 'POST' else 204)
+        return httpx.Response(201 if method == 'POST' else 200, json=rows)
+
+    # ============ RPC ============
+
+    def _rpc(self, fn, body):
+        found = self.conn.execute(
+            "select proretset from pg_proc where proname = %s", [fn]
+        ).fetchone()
+        if found is None or fn in self.hidden_functions:
+            return httpx.Response(404, json={
+                "code": "PGRST202",
+                "message": f"Could not find the function public.{fn} in the schema cache",
+                "details": None,
+                "hint": None
+            })
+
+        named = ', '.join(f"{_ident(k)} => %s" for k in body)
+        args = [_arg(v) for v in body.values()]
+        if found[0]:
+            sql = f"select coalesce(json_agg(t), '[]'::json) from {_ident(fn)}({named}) t"
+        else:
+            sql = f"select to_json({_ident(fn)}({named}))"
+        return httpx.Response(200, json=self.conn.execute(sql, args).fetchone()[0])
+
+    # ============ ENTRY POINT ============
+
+    def __call__(self, request):
+        path = request.url.path.split('/rest/v1', 1)[-1]
+        params = list(request.url.params.multi_items())
+        prefer = request.headers.get('prefer', '')
+        self.requests.append((request.method, path, params))
+
+        with self.lock:
+            try:
+                if path.startswith('/rpc/'):
+                    return self._rpc(path[5:], json.loads(request.content or b'{}'))
+                table = path.strip('/')
+                if request.method in ('GET', 'HEAD'):
+                    return self._read(table, params, prefer, request.method == 'HEAD')
+                body = json.loads(request.content) if request.content else {}
+                return self._write(request.method, table, params, body, prefer)
+            except psycopg.Error as e:
+                diag = e.diag
+                return httpx.Response(409 if e.sqlstate == '23505' else 400, json={
+                    "code": e.sqlstate,
+                    "message": diag.message_primary,
+                    "details": diag.message_detail,
+                    "hint": diag.message_hint
+                })
+
+    def close(self):
+        self.conn.close()
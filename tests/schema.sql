@@ -0,0 +1,85 @@
+-- tests/schema.sql
+-- Minimal copy of the Supabase tables the app and sql/ functions touch,
+-- so the migrations in sql/ can be applied to a local test database.
+
+create table if not exists "user" (
+    id bigserial primary key,
+    username text unique,
+    email text,
+    phone text,
+    default_mpesa_phone text,
+    password_hash text,
+    role text default 'user',
+    wallet_balance numeric(12, 2) default 0,
+    wallet_status text,
+    member_id bigint,
+    created_at timestamptz default now()
+);
+
+create table if not exists "group" (
+    id bigserial primary key,
+    name text,
+    status text default 'pending',
+    current_balance numeric(12, 2) default 0,
+    target_amount numeric(12, 2) default 0,
+    max_members integer default 3,
+    password_revealed boolean default false,
+    week_end timestamptz,
+    created_at timestamptz default now()
+);
+
+create table if not exists member (
+    id bigserial primary key,
+    group_id bigint references "group" (id) on delete cascade,
+    user_id bigint,
+    name text,
+    amount_contributed numeric(12, 2) default 0,
+    created_at timestamptz default now()
+);
+
+create table if not exists payment (
+    id bigserial primary key,
+    member_id bigint,
+    group_id bigint,
+    amount numeric(12, 2),
+    mpesa_code text,
+    verified boolean default false,
+    rejected boolean default false,
+    member_name text,
+    group_name text,
+    created_at timestamptz default now()
+);
+
+create table if not exists transactions (
+    id bigserial primary key,
+    user_id bigint,
+    phone text,
+    default_mpesa_phone text,
+    amount numeric(12, 2),
+    status text default 'pending',
+    checkout_request_id text,
+    merchant_request_id text,
+    mpesa_receipt_number text,
+    result_code integer,
+    result_desc text,
+    created_at timestamptz default now(),
+    updated_at timestamptz
+);
+
+create table if not exists contacts (
+    id bigserial primary key,
+    user_id bigint,
+    contact_user_id bigint,
+    custom_name text,
+    saved_at timestamptz default now()
+);
+
+create table if not exists call_history (
+    id bigserial primary key,
+    caller_id bigint,
+    callee_id bigint,
+    call_status text,
+    call_duration integer,
+    started_at timestamptz default now(),
+    ended_at timestamptz
+);
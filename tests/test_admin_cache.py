@@ -0,0 +1,135 @@
+# tests/test_admin_cache.py - ADMIN READ CACHE: FRESH, STALE-WHILE-REVALIDATE, SINGLE FLIGHT, INVALIDATION
+
+import threading
+import time
+
+import pytest
+
+from app.routes.admin import admin_bp
+from app.routes.admin_tools import admin_tools_bp
+from app.routes.payments import payments_bp
+from app.utils import cache, group_payments
+from app.utils.cache import TTLCache
+
+
+class _Loader:
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        time.sleep(self.delay)
+        return self.calls
+
+
+def test_fresh_value_is_not_reloaded():
+    store = TTLCache(ttl=60, stale_ttl=60)
+    loader = _Loader()
+
+    assert store.get_or_load('k', loader) == 1
+    assert store.get_or_load('k', loader) == 1
+    assert loader.calls == 1
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    store = TTLCache(ttl=0, stale_ttl=60)
+    loader = _Loader()
+    store.get_or_load('k', loader)
+
+    loader.release.clear()
+    assert store.get_or_load('k', loader) == 1  # Stale, returned at once
+    assert store.get_or_load('k', loader) == 1  # Refresh already running: no second one
+    loader.release.set()
+
+    deadline = time.monotonic() + 5
+    while store._inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert loader.calls == 2
+    assert store._entries['k'][0] == 2
+
+
+def test_expired_value_is_loaded_by_the_caller():
+    store = TTLCache(ttl=0, stale_ttl=0)
+    loader = _Loader()
+
+    assert store.get_or_load('k', loader) == 1
+    assert store.get_or_load('k', loader) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    store = TTLCache(ttl=60, stale_ttl=60)
+    loader = _Loader(delay=0.05)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_load('k', loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert results == [1] * 8
+
+
+def test_value_invalidated_while_loading_is_not_stored():
+    store = TTLCache(ttl=60, stale_ttl=60)
+    loader = _Loader()
+    loader.release.clear()
+
+    thread = threading.Thread(target=store.get_or_load, args=('k', loader))
+    thread.start()
+    while not loader.calls:
+        time.sleep(0.01)
+    store.invalidate('k')
+    loader.release.set()
+    thread.join()
+
+    assert 'k' not in store._entries
+    assert store.get_or_load('k', loader) == 2
+
+
+def test_loader_error_is_raised_and_not_cached():
+    store = TTLCache(ttl=60, stale_ttl=60)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError('database unavailable')
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            store.get_or_load('k', failing)
+    assert len(calls) == 2
+
+
+# ============ ENDPOINTS ============
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(cache, 'admin_cache', TTLCache(ttl=60, stale_ttl=60))
+    monkeypatch.setattr('app.routes.admin_tools.admin_cache', cache.admin_cache)
+    monkeypatch.setattr(group_payments, '_rpc_available', True)
+    conn = postgrest.conn
+    conn.execute("insert into \"group\" (id, name, target_amount) values (5, 'G5', 400)")
+    conn.execute("insert into member (id, group_id, user_id, name) values (10, 5, 1, 'Alice')")
+    conn.execute("insert into \"user\" (id, username, member_id) values (1, 'u1', 10)")
+    return postgrest
+
+
+def test_system_stats_cached_until_a_payment_is_submitted(db, make_client):
+    client = make_client(admin_bp, admin_tools_bp, payments_bp, is_admin=True, user_id=1)
+
+    assert client.get('/admin/tools/api/system-stats').get_json()['database']['payments'] == 0
+    db.requests.clear()
+    assert client.get('/admin/tools/api/system-stats').get_json()['database']['payments'] == 0
+    assert db.requests == []
+
+    assert client.post('/api/add-payment', json={'amount': 100, 'mpesa_code': 'QAB1234XYZ'}).status_code == 200
+
+    stats = client.get('/admin/tools/api/system-stats').get_json()
+    assert stats['database']['payments'] == 1
+    assert stats['database']['pending_payments'] == 1
@@ -0,0 +1,69 @@
+# tests/test_admin_users.py - KEYSET CURSORS FOR GET /admin/api/users
+
+import base64
+import json
+
+import pytest
+
+from app.routes.admin import admin_bp, decode_user_cursor, encode_user_cursor
+
+
+def _cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def test_cursor_round_trip():
+    row = {'created_at': '2026-01-01T10:00:00.123456+00:00', 'id': 7}
+    assert decode_user_cursor(encode_user_cursor(row, 'created_at'), 'created_at') == \
+        ['2026-01-01T10:00:00.123456+00:00', 7]
+    assert decode_user_cursor(encode_user_cursor(row, 'id'), 'id') == [7]
+
+
+@pytest.mark.parametrize('key, sort', [
+    (['2026-01-01T10:00:00+00:00",id.gt.0', 1], 'created_at'),  # filter injection
+    (['2026-01-01T10:00:00+00:00', 'x'], 'created_at'),
+    (['2026-01-01T10:00:00+00:00', True], 'created_at'),
+    (['2026-01-01T10:00:00+00:00', 1.5], 'created_at'),
+    ([None, 1], 'created_at'),
+    (['7'], 'id'),
+    ([1, 2], 'id'),
+    ({'id': 1}, 'id')
+])
+def test_malformed_cursor_rejected(key, sort):
+    with pytest.raises(ValueError):
+        decode_user_cursor(_cursor(key), sort)
+
+
+def test_not_base64_rejected():
+    with pytest.raises(ValueError):
+        decode_user_cursor('%%%', 'created_at')
+
+
+def test_bad_cursor_is_400(postgrest, make_client):
+    client = make_client(admin_bp, is_admin=True)
+    for cursor in (_cursor(['bogus', 1]), _cursor(['2026-01-01T10:00:00', 'x']), 'not-a-cursor'):
+        response = client.get('/admin/api/users', query_string={'cursor': cursor})
+        assert response.status_code == 400
+
+
+def test_pages_cover_every_user_once(postgrest, make_client):
+    # Several users share a created_at, so the (created_at, id) tie-break matters
+    for i in range(23):
+        postgrest.conn.execute(
+            'insert into "user" (username, created_at) values (%s, %s)',
+            [f'u{i}', f'2026-01-0{1 + i % 3}T10:00:00.5+00:00']
+        )
+
+    client = make_client(admin_bp, is_admin=True)
+    seen, cursor = [], None
+    while True:
+        response = client.get('/admin/api/users', query_string={'limit': 5, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        body = response.get_json()
+        seen.extend(u['id'] for u in body['users'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+
+    assert sorted(seen) == list(range(1, 24))
+    assert len(seen) == len(set(seen))
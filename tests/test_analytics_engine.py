@@ -0,0 +1,95 @@
+# tests/test_analytics_engine.py - NUMPY ENGINE: TIMESTAMPS, LOADING, SNAPSHOT SWAPS
+
+import threading
+
+import numpy as np
+import pytest
+
+from app.utils import analytics_engine
+from app.utils.analytics_engine import AnalyticsEngine, to_datetime64
+
+
+def test_to_datetime64_converts_offsets_to_utc():
+    ts = to_datetime64([
+        '2026-01-01T01:30:00+03:00',
+        '2026-01-01T01:30:00Z',
+        '2026-01-01T01:30:00.123456+00:00',
+        '2026-01-01T01:30:00',
+        None
+    ])
+    assert ts[:4].tolist() == [
+        np.datetime64('2025-12-31T22:30:00'),
+        np.datetime64('2026-01-01T01:30:00'),
+        np.datetime64('2026-01-01T01:30:00'),
+        np.datetime64('2026-01-01T01:30:00')
+    ]
+    assert np.isnat(ts[4])
+
+
+def test_revenue_buckets_by_utc_day():
+    engine = AnalyticsEngine.from_rows(
+        payments=[
+            {'amount': 100, 'created_at': '2026-01-01T01:30:00+03:00', 'verified': True},
+            {'amount': 50, 'created_at': '2026-01-01T10:00:00+00:00', 'verified': True},
+            {'amount': 999, 'created_at': '2026-01-01T10:00:00+00:00', 'verified': False}
+        ],
+        groups=[], users=[], topups=[]
+    )
+    assert engine.revenue('day') == {'2025-12-31': 100.0, '2026-01-01': 50.0}
+
+
+def test_load_uses_keyset_pages(postgrest, monkeypatch):
+    monkeypatch.setattr(analytics_engine, 'PAGE_SIZE', 10)
+    for i in range(25):
+        postgrest.conn.execute(
+            'insert into payment (amount, verified, created_at) values (%s, true, %s)',
+            [i + 1, '2026-01-02T12:00:00+00:00']
+        )
+
+    engine = AnalyticsEngine.load()
+
+    assert len(engine.payments['ts']) == 25
+    assert engine.payments['amount'].sum() == sum(range(1, 26))
+    pages = [params for method, path, params in postgrest.requests if path == '/payment']
+    assert [dict(p).get('id') for p in pages] == ['gt.0', 'gt.10', 'gt.20']
+    assert not any(k == 'offset' for p in pages for k, _ in p)
+
+
+def test_reload_serves_previous_snapshot(monkeypatch):
+    release = threading.Event()
+    old, new = object(), object()
+
+    def slow_load():
+        release.wait(5)
+        return new
+
+    monkeypatch.setattr(AnalyticsEngine, 'load', staticmethod(slow_load))
+    monkeypatch.setattr(analytics_engine, '_engine', old)
+    monkeypatch.setattr(analytics_engine, '_engine_loaded_at', 1.0)
+    monkeypatch.setattr(analytics_engine, '_loading', None)
+
+    # Stale snapshot: returned at once while the reload runs
+    assert analytics_engine.get_engine() is old
+    assert analytics_engine.engine_status()['refreshing']
+    done = analytics_engine._loading
+
+    # A second caller does not start another load
+    assert analytics_engine.get_engine(refresh=True) is old
+    assert analytics_engine._loading is done
+
+    release.set()
+    done.wait(5)
+    assert analytics_engine.get_engine() is new
+    assert not analytics_engine.engine_status()['refreshing']
+
+
+def test_first_load_failure_raises(monkeypatch):
+    def broken_load():
+        raise ConnectionError('down')
+
+    monkeypatch.setattr(AnalyticsEngine, 'load', staticmethod(broken_load))
+    monkeypatch.setattr(analytics_engine, '_engine', None)
+    monkeypatch.setattr(analytics_engine, '_loading', None)
+
+    with pytest.raises(RuntimeError):
+        analytics_engine.get_engine()
@@ -0,0 +1,226 @@
+# tests/test_analytics_parity.py - DATABASE AGGREGATES VS THE ORIGINAL PYTHON LOOPS
+#
+# AnalyticsService used to select * from user, group, payment and member and
+# aggregate in Python. The reference_* functions below are those loops,
+# verbatim apart from reading rows from the seeded database. Each metric is
+# checked with the sql/ functions installed (RPC path) and with them hidden
+# (narrow-query fallback).
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils import analytics_service
+from app.utils.analytics_service import AnalyticsService
+
+
+# ============ SEED DATA ============
+
+def _seed(conn, seed=7):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+
+    group_ids = []
+    for i in range(25):
+        created = now - timedelta(days=rng.randint(0, 45), hours=rng.randint(0, 23), minutes=rng.randint(0, 59))
+        row = conn.execute(
+            'insert into "group" (name, status, current_balance, target_amount, created_at) '
+            'values (%s, %s, %s, %s, %s) returning id',
+            [f'G{i}', rng.choice(['pending', 'active', 'expired', None]), rng.randint(0, 400), 350, created]
+        ).fetchone()
+        group_ids.append(row[0])
+
+    member_ids = []
+    for group_id in group_ids:
+        # Sizes 0-5, so groups outside the 1-4 distribution exist too
+        for _ in range(rng.randint(0, 5)):
+            member_ids.append(conn.execute(
+                'insert into member (group_id, name) values (%s, %s) returning id',
+                [group_id, f'M{len(member_ids)}']
+            ).fetchone()[0])
+
+    for i in range(80):
+        conn.execute(
+            'insert into "user" (username, member_id, wallet_balance) values (%s, %s, %s)',
+            [f'u{i}', rng.choice(member_ids + [None] * 20), rng.randint(0, 500)]
+        )
+
+    for _ in range(300):
+        # Spread over 60 days, including times just either side of midnight UTC
+        created = (now - timedelta(days=rng.randint(0, 60))).replace(
+            hour=rng.choice([0, 0, 12, 23, 23]), minute=rng.randint(0, 59), second=rng.randint(0, 59)
+        )
+        conn.execute(
+            'insert into payment (group_id, amount, verified, rejected, created_at) values (%s, %s, %s, %s, %s)',
+            [rng.choice(group_ids), round(rng.uniform(1, 500), 2),
+             rng.choice([True, False, None]), rng.choice([True, False, None]), created]
+        )
+
+
+def _rows(conn, table):
+    """Rows as PostgREST returns them (JSON types, ISO timestamps)"""
+    return conn.execute(f'select coalesce(json_agg(t), \'[]\') from "{table}" t').fetchone()[0]
+
+
+def _groups_with_members(conn):
+    members = _rows(conn, 'member')
+    groups = _rows(conn, 'group')
+    for group in groups:
+        group['member'] = [m for m in members if m['group_id'] == group['id']]
+    return groups
+
+
+# ============ REFERENCE (ORIGINAL) IMPLEMENTATIONS ============
+
+def reference_dashboard_stats(conn):
+    users = _rows(conn, 'user')
+    groups = _rows(conn, 'group')
+    payments = _rows(conn, 'payment')
+
+    active_groups = [g for g in groups if g.get('status') == 'active']
+    expired_groups = [g for g in groups if g.get('status') == 'expired']
+    verified_payments = [p for p in payments if p.get('verified')]
+    pending_payments = [p for p in payments if not p.get('verified') and not p.get('rejected')]
+
+    return {
+        "total_users": len(users),
+        "total_groups": len(groups),
+        "active_groups": len(active_groups),
+        "expired_groups": len(expired_groups),
+        "total_revenue": sum(float(p.get('amount', 0)) for p in verified_payments),
+        "pending_payments": len(pending_payments)
+    }
+
+
+def reference_revenue_trend(conn, days=30):
+    # The original compared an aware created_at with a naive utcnow() (a
+    # TypeError, so it always returned {}); both sides are naive UTC here
+    start_date = datetime.utcnow() - timedelta(days=days)
+    payments = [p for p in _rows(conn, 'payment') if p.get('verified')]
+
+    revenue_by_date = {}
+    for payment in payments:
+        created_at = datetime.fromisoformat(payment['created_at'].replace('Z', '+00:00'))
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if created_at >= start_date:
+            date_key = created_at.strftime('%Y-%m-%d')
+            revenue_by_date[date_key] = revenue_by_date.get(date_key, 0) + float(payment.get('amount', 0))
+    return revenue_by_date
+
+
+def reference_group_formation_rate(conn):
+    groups_by_date = {}
+    for group in _rows(conn, 'group'):
+        created_at = datetime.fromisoformat(group['created_at'].replace('Z', '+00:00'))
+        date_key = created_at.strftime('%Y-%m-%d')
+        groups_by_date[date_key] = groups_by_date.get(date_key, 0) + 1
+    return groups_by_date
+
+
+def reference_user_retention(conn):
+    users = _rows(conn, 'user')
+    total_users = len(users)
+    active_users = len([u for u in users if u.get('member_id')])
+    return {
+        "total": total_users,
+        "active": active_users,
+        "retention_rate": (active_users / total_users * 100) if total_users > 0 else 0
+    }
+
+
+def reference_popular_group_sizes(conn):
+    size_distribution = {1: 0, 2: 0, 3: 0, 4: 0}
+    for group in _groups_with_members(conn):
+        size = len(group.get('member', []))
+        if size in size_distribution:
+            size_distribution[size] += 1
+    return size_distribution
+
+
+def reference_churn_analysis(conn):
+    groups = [g for g in _groups_with_members(conn) if g.get('status') == 'expired']
+    return {
+        "expired_groups": len(groups),
+        "churned_users": sum(len(g.get('member', [])) for g in groups)
+    }
+
+
+# ============ FIXTURES ============
+
+ANALYTICS_FUNCTIONS = {
+    'analytics_dashboard_stats',
+    'analytics_revenue_by_day',
+    'analytics_groups_by_day',
+    'analytics_group_sizes',
+    'analytics_wallet_topups'
+}
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def service(request, postgrest, monkeypatch):
+    _seed(postgrest.conn)
+    if request.param == 'fallback':
+        postgrest.hidden_functions.update(ANALYTICS_FUNCTIONS)
+    monkeypatch.setattr(analytics_service, '_missing_rpcs', set())
+    return AnalyticsService()
+
+
+# ============ PARITY ============
+
+def test_dashboard_stats(service, postgrest):
+    stats = service._dashboard_stats_from_db()
+    expected = reference_dashboard_stats(postgrest.conn)
+
+    assert {k: stats[k] for k in expected if k != 'total_revenue'} == \
+        {k: v for k, v in expected.items() if k != 'total_revenue'}
+    assert stats['total_revenue'] == pytest.approx(expected['total_revenue'])
+
+
+def test_revenue_trend(service, postgrest):
+    trend = service._revenue_trend_from_db(30)
+    expected = reference_revenue_trend(postgrest.conn, 30)
+
+    assert trend.keys() == expected.keys()
+    for day, revenue in expected.items():
+        assert trend[day] == pytest.approx(revenue)
+
+
+def test_group_formation_rate(service, postgrest):
+    assert service.get_group_formation_rate() == reference_group_formation_rate(postgrest.conn)
+
+
+def test_user_retention(service, postgrest):
+    assert service.get_user_retention() == reference_user_retention(postgrest.conn)
+
+
+def test_popular_group_sizes(service, postgrest):
+    assert service.get_popular_group_sizes() == reference_popular_group_sizes(postgrest.conn)
+
+
+def test_churn_analysis(service, postgrest):
+    assert service.get_churn_analysis() == reference_churn_analysis(postgrest.conn)
+
+
+def test_no_full_table_reads(service, postgrest):
+    """Only aggregates, count-only HEADs or narrow column lists leave the database"""
+    service._dashboard_stats_from_db()
+    service.get_user_retention()
+    service.get_popular_group_sizes()
+    service.get_churn_analysis()
+
+    for method, path, params in postgrest.requests:
+        if path.startswith('/rpc/'):
+            continue
+        select = dict(params).get('select', '*')
+        assert select != '*' and '(*)' not in select, (method, path, params)
+
+
+def test_empty_database(postgrest, monkeypatch):
+    monkeypatch.setattr(analytics_service, '_missing_rpcs', set())
+    service = AnalyticsService()
+
+    assert service.get_user_retention() == {"total": 0, "active": 0, "retention_rate": 0}
+    assert service.get_popular_group_sizes() == {1: 0, 2: 0, 3: 0, 4: 0}
+    assert service.get_churn_analysis() == {"expired_groups": 0, "churned_users": 0}
+    assert service._revenue_trend_from_db(30) == {}
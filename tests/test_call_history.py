@@ -0,0 +1,103 @@
+# tests/test_call_history.py - /api/call-history: (started_at, id) KEYSET PAGES
+
+import base64
+import json
+
+import pytest
+
+from app.routes import call_routes
+from app.routes.call_routes import call_bp
+
+
+@pytest.fixture
+def db(postgrest):
+    conn = postgrest.conn
+    for user_id in (1, 2, 3):
+        conn.execute('insert into "user" (id, username) values (%s, %s)', [user_id, f'user{user_id}'])
+    return conn
+
+
+def _add_calls(conn, started_at, count, caller_id=1, callee_id=2):
+    for _ in range(count):
+        conn.execute(
+            "insert into call_history (caller_id, callee_id, call_status, started_at) values (%s, %s, 'ended', %s)",
+            [caller_id, callee_id, started_at]
+        )
+
+
+def _all_pages(client, limit):
+    ids, before = [], None
+    while True:
+        url = f'/api/call-history?limit={limit}' + (f'&before={before}' if before else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_json()
+        ids += [call['id'] for call in body['calls']]
+        before = body['next_before']
+        if not before:
+            return ids
+
+
+def test_pages_newest_first_with_both_directions(db, make_client):
+    _add_calls(db, '2026-10-01T10:00:00+00:00', 1)
+    _add_calls(db, '2026-10-01T11:00:00+00:00', 1, caller_id=2, callee_id=1)
+    _add_calls(db, '2026-10-01T12:00:00+00:00', 1, caller_id=2, callee_id=3)  # Not user 1's call
+    client = make_client(call_bp, user_id=1)
+
+    calls = client.get('/api/call-history').get_json()['calls']
+
+    assert [(c['id'], c['direction'], c['other_username']) for c in calls] == [
+        (2, 'incoming', 'user2'), (1, 'outgoing', 'user2')
+    ]
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 5])
+def test_calls_sharing_a_timestamp_are_not_skipped(db, make_client, limit):
+    _add_calls(db, '2026-10-01T12:00:00+00:00', 2)
+    _add_calls(db, '2026-10-01T11:00:00+00:00', 4)  # A tie straddles every page boundary
+    _add_calls(db, '2026-10-01T10:00:00+00:00', 1)
+
+    ids = _all_pages(make_client(call_bp, user_id=1), limit)
+
+    assert ids == [2, 1, 6, 5, 4, 3, 7]
+
+
+def test_exact_page_has_no_next(db, make_client):
+    _add_calls(db, '2026-10-01T11:00:00+00:00', 5)
+
+    body = make_client(call_bp, user_id=1).get('/api/call-history').get_json()
+
+    assert len(body['calls']) == 5
+    assert body['next_before'] is None
+
+
+def test_limit_is_capped(db, make_client):
+    _add_calls(db, '2026-10-01T11:00:00+00:00', call_routes.CALL_HISTORY_MAX_PAGE_SIZE + 5)
+    client = make_client(call_bp, user_id=1)
+
+    capped = client.get('/api/call-history?limit=1000').get_json()
+    floored = client.get('/api/call-history?limit=0').get_json()
+
+    assert len(capped['calls']) == call_routes.CALL_HISTORY_MAX_PAGE_SIZE
+    assert capped['next_before']
+    assert len(floored['calls']) == 1
+    assert client.get('/api/call-history?limit=ten').status_code == 400
+
+
+@pytest.mark.parametrize('before', [
+    '2026-10-01T11:00:00',                                                  # Old plain timestamp
+    'not-base64!',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),                         # Not a list
+    base64.urlsafe_b64encode(json.dumps(['2026-10-01T11:00:00', 'x']).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(['2026-10-01T11:00:00', True]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(['1),id.gt.(0', 5]).encode()).decode(),  # Filter injection
+])
+def test_invalid_before_is_rejected(db, make_client, before):
+    response = make_client(call_bp, user_id=1).get('/api/call-history', query_string={'before': before})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+
+def test_requires_login(make_client):
+    assert make_client(call_bp).get('/api/call-history').status_code == 401
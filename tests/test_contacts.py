@@ -0,0 +1,64 @@
+# tests/test_contacts.py - /api/contacts: RPC AND BATCHED FALLBACK RETURN THE SAME LIST
+
+import pytest
+
+from app.routes import call_routes
+from app.routes.call_routes import call_bp
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(call_routes, '_contacts_rpc_available', True)
+    monkeypatch.setattr(call_routes, 'active_users', {3: 'sid-3'})
+    conn = postgrest.conn
+    for user_id in (1, 2, 3, 4, 9):
+        conn.execute('insert into "user" (id, username) values (%s, %s)', [user_id, f'user{user_id}'])
+    for contact_user_id, custom_name, hours_ago in ((2, None, 5), (3, 'Mum', 1), (4, 'Work', 3), (5, 'Gone', 2)):
+        conn.execute(
+            "insert into contacts (user_id, contact_user_id, custom_name, saved_at) "
+            "values (1, %s, %s, now() - make_interval(hours => %s))",
+            [contact_user_id, custom_name, hours_ago]
+        )
+    # Another user's contact list is never included
+    conn.execute("insert into contacts (user_id, contact_user_id) values (9, 2)")
+    return postgrest
+
+
+def _contacts(client):
+    response = client.get('/api/contacts')
+    assert response.status_code == 200
+    return response.get_json()['contacts']
+
+
+@pytest.mark.parametrize('path', ['rpc', 'fallback'])
+def test_newest_first_without_deleted_users(db, make_client, path):
+    if path == 'fallback':
+        db.hidden_functions.add('get_user_contacts')
+
+    contacts = _contacts(make_client(call_bp, user_id=1))
+
+    # User 5 no longer exists, so that contact is dropped
+    assert [c['user_id'] for c in contacts] == [3, 4, 2]
+    assert contacts[0] == {'id': 2, 'user_id': 3, 'username': 'user3', 'custom_name': 'Mum', 'online': True}
+    assert contacts[2]['custom_name'] is None
+
+
+def test_rpc_and_fallback_payloads_match(db, make_client):
+    client = make_client(call_bp, user_id=1)
+
+    from_rpc = _contacts(client)
+    db.hidden_functions.add('get_user_contacts')
+    from_fallback = _contacts(client)
+
+    assert from_fallback == from_rpc
+    assert call_routes._contacts_rpc_available is False
+    assert any(path.endswith('/rpc/get_user_contacts') for _, path, _ in db.requests)
+    assert any(path.endswith('/user') for _, path, _ in db.requests)
+
+
+def test_no_contacts(db, make_client):
+    assert _contacts(make_client(call_bp, user_id=4)) == []
+
+
+def test_requires_login(db, make_client):
+    assert make_client(call_bp).get('/api/contacts').status_code == 401
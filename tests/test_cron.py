@@ -0,0 +1,69 @@
+# tests/test_cron.py - CRON JOBS: POST ONLY, CRON SECRET OR ADMIN, NO INTERNALS IN RESPONSES
+
+import pytest
+
+from app.routes.cron import cron_bp
+from app.utils import mpesa_callbacks
+
+SECRET = 'cron-test-secret'
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setenv('CRON_SECRET', SECRET)
+    return SECRET
+
+
+def test_analytics_requires_secret_or_admin(postgrest, make_client, secret):
+    client = make_client(cron_bp)
+
+    assert client.post('/cron/reconcile-analytics').status_code == 401
+    assert client.post('/cron/reconcile-analytics', headers={'X-Cron-Secret': 'wrong'}).status_code == 401
+    assert client.post('/cron/reconcile-analytics', headers={'X-Cron-Secret': secret}).status_code == 200
+    assert make_client(cron_bp, is_admin=True).post('/cron/reconcile-analytics').status_code == 200
+
+
+def test_no_secret_configured_admits_admins_only(postgrest, make_client, monkeypatch):
+    monkeypatch.delenv('CRON_SECRET', raising=False)
+
+    assert make_client(cron_bp).post('/cron/reconcile-analytics', headers={'X-Cron-Secret': ''}).status_code == 401
+    assert make_client(cron_bp, is_admin=True).post('/cron/reconcile-analytics').status_code == 200
+
+
+def test_analytics_returns_status_and_duration_only(postgrest, make_client, secret):
+    postgrest.conn.execute('insert into "user" (id, username) values (1, %s)', ['u1'])
+
+    response = make_client(cron_bp).post('/cron/reconcile-analytics', headers={'X-Cron-Secret': secret})
+
+    body = response.get_json()
+    assert set(body) == {'success', 'duration_ms'}
+    assert body['success'] is True
+
+
+def test_analytics_rejects_get(make_client, secret):
+    response = make_client(cron_bp).get('/cron/reconcile-analytics', headers={'X-Cron-Secret': secret})
+
+    assert response.status_code == 405
+
+
+def test_stk_reconcile_requires_secret_and_post(postgrest, make_client, secret):
+    client = make_client(cron_bp)
+
+    assert client.post('/cron/reconcile-stk').status_code == 401
+    assert client.get('/cron/reconcile-stk', headers={'X-Cron-Secret': secret}).status_code == 405
+
+    response = client.post('/cron/reconcile-stk', headers={'X-Cron-Secret': secret})
+    assert response.status_code == 200
+    assert response.get_json()['checked'] == 0
+
+
+def test_callback_sweep_requires_secret_and_post(postgrest, make_client, secret, monkeypatch):
+    monkeypatch.setattr(mpesa_callbacks, 'start_workers', lambda: None)
+    client = make_client(cron_bp)
+
+    assert client.post('/cron/mpesa-callbacks').status_code == 401
+    assert client.get('/cron/mpesa-callbacks', headers={'X-Cron-Secret': secret}).status_code == 405
+
+    response = client.post('/cron/mpesa-callbacks', headers={'X-Cron-Secret': secret})
+    assert response.status_code == 200
+    assert response.get_json()['requeued'] == 0
@@ -0,0 +1,76 @@
+# tests/test_daraja.py - WHICH CONNECTION ERRORS AN STK PUSH IS RETRIED ON
+
+import socket
+import threading
+
+import pytest
+import requests
+
+from app.utils import daraja
+from app.utils.daraja import DarajaClient
+
+
+def _client(monkeypatch, port):
+    monkeypatch.setenv('DARAJA_BASE_URL', f'http://127.0.0.1:{port}')
+    monkeypatch.setattr(daraja, 'RETRY_BACKOFF', 0)
+    client = DarajaClient()
+    monkeypatch.setattr(client, 'get_token', lambda: 'token')
+    return client
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def hang_up_server():
+    """Accepts each connection, reads the request, then closes without replying"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(conn)
+            conn.recv(65536)
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield server.getsockname()[1], accepted
+    server.close()
+
+
+def test_push_retried_when_connection_refused(monkeypatch):
+    client = _client(monkeypatch, _closed_port())
+    calls = []
+    request = client.session.request
+    monkeypatch.setattr(client.session, 'request', lambda *a, **kw: calls.append(1) or request(*a, **kw))
+
+    with pytest.raises(requests.ConnectionError):
+        client.stk_push('254700000001', 100, 'https://example.com/cb')
+    assert len(calls) == daraja.RETRIES + 1
+
+
+def test_push_not_resent_after_request_went_out(monkeypatch, hang_up_server):
+    port, accepted = hang_up_server
+    client = _client(monkeypatch, port)
+
+    with pytest.raises(requests.ConnectionError):
+        client.stk_push('254700000001', 100, 'https://example.com/cb')
+    assert len(accepted) == 1
+
+
+def test_query_retried_after_request_went_out(monkeypatch, hang_up_server):
+    port, accepted = hang_up_server
+    client = _client(monkeypatch, port)
+
+    with pytest.raises(requests.ConnectionError):
+        client.stk_query('ws_CO_1')
+    assert len(accepted) == daraja.RETRIES + 1
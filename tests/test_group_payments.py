@@ -0,0 +1,88 @@
+# tests/test_group_payments.py - GROUP PAYMENT SUBMISSION: RPC AND FALLBACK
+
+import pytest
+
+from app.routes.payments import payments_bp
+from app.utils import group_payments
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def db(request, postgrest, monkeypatch):
+    if request.param == 'fallback':
+        postgrest.hidden_functions.add('submit_payment')
+    monkeypatch.setattr(group_payments, '_rpc_available', True)
+    conn = postgrest.conn
+    conn.execute("insert into \"group\" (id, name, current_balance, target_amount) values (5, 'G5', 100, 400)")
+    conn.execute("insert into member (id, group_id, user_id, name) values (10, 5, 1, 'Alice')")
+    conn.execute("insert into \"user\" (id, username, wallet_balance, member_id) values (1, 'u1', 50, 10)")
+    conn.execute("insert into \"user\" (id, username, wallet_balance) values (2, 'u2', 500)")
+    return conn
+
+
+def _payments(conn):
+    return conn.execute('select member_id, group_id, amount, mpesa_code, verified from payment order by id').fetchall()
+
+
+def test_records_unverified_payment_with_progress(db):
+    submitted = group_payments.submit_payment(1, 200, ' QAB1234XYZ ')
+
+    assert submitted['payment']['mpesa_code'] == 'QAB1234XYZ'
+    assert submitted['payment']['member_name'] == 'Alice'
+    assert submitted['group'] == {'id': 5, 'name': 'G5', 'current_balance': 100, 'target_amount': 400}
+    assert submitted['progress']['percentage'] == 25
+    assert [(m, g, float(a), c, v) for m, g, a, c, v in _payments(db)] == [(10, 5, 200.0, 'QAB1234XYZ', False)]
+
+
+def test_submission_moves_no_money(db):
+    # The wallet is not debited and the group balance only moves once an admin verifies
+    group_payments.submit_payment(1, 200, 'QAB1234XYZ')
+
+    assert float(db.execute('select wallet_balance from "user" where id = 1').fetchone()[0]) == 50
+    assert float(db.execute('select current_balance from "group" where id = 5').fetchone()[0]) == 100
+
+
+def test_not_in_a_group(db):
+    with pytest.raises(ValueError):
+        group_payments.submit_payment(2, 200)
+    with pytest.raises(LookupError):
+        group_payments.submit_payment(404, 200)
+    assert _payments(db) == []
+
+
+def test_duplicate_code_is_refused(db):
+    group_payments.submit_payment(1, 200, 'QAB1234XYZ')
+
+    with pytest.raises(ValueError, match='already been submitted'):
+        group_payments.submit_payment(1, 200, 'qab1234xyz ')
+    assert len(_payments(db)) == 1
+
+    # Payments without a code never collide
+    group_payments.submit_payment(1, 50)
+    group_payments.submit_payment(1, 50, '  ')
+    assert len(_payments(db)) == 3
+
+
+def test_rejected_payment_frees_its_code(db):
+    group_payments.submit_payment(1, 200, 'QAB1234XYZ')
+    db.execute('update payment set rejected = true')
+
+    group_payments.submit_payment(1, 150, 'QAB1234XYZ')
+
+    assert len(_payments(db)) == 2
+
+
+def test_route_reports_duplicate_and_invalid_amounts(db, make_client):
+    client = make_client(payments_bp, user_id=1)
+
+    first = client.post('/api/add-payment', json={'amount': 200, 'mpesa_code': 'QAB1234XYZ'})
+    duplicate = client.post('/api/add-payment', json={'amount': 200, 'mpesa_code': 'QAB1234XYZ'})
+    too_much = client.post('/api/add-payment', json={'amount': 501, 'mpesa_code': 'QAB9999XYZ'})
+    negative = client.post('/api/add-payment', json={'amount': -5, 'mpesa_code': 'QAB8888XYZ'})
+
+    assert first.status_code == 200
+    assert first.get_json()['progress']['percentage'] == 25
+    assert duplicate.status_code == 400
+    assert 'already been submitted' in duplicate.get_json()['message']
+    assert too_much.status_code == 400
+    assert negative.status_code == 400
+    assert len(_payments(db)) == 1
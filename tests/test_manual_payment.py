@@ -0,0 +1,127 @@
+# tests/test_manual_payment.py - MANUAL SUBMISSIONS: ONE PER M-PESA CODE, CLAIMS RELEASED ONLY ON FAILURE
+
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from app.routes.manual_payment import manual_payment_bp
+from app.utils.receipt_index import receipt_index
+
+CODE = 'RCP1234567'
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(receipt_index, '_codes', set())
+    monkeypatch.setattr(receipt_index, '_loaded', True)
+    postgrest.conn.execute('insert into "user" (id, username) values (1, %s), (2, %s)', ['u1', 'u2'])
+    return postgrest
+
+
+@contextmanager
+def _inserts_failing(conn):
+    conn.execute("""
+        create function refuse_insert() returns trigger language plpgsql as $$
+        begin raise exception 'database unavailable'; end $$;
+        create trigger refuse_insert before insert on transactions
+        for each row execute function refuse_insert();
+    """)
+    try:
+        yield
+    finally:
+        conn.execute('drop trigger refuse_insert on transactions; drop function refuse_insert();')
+
+
+def _submit(client, code=CODE):
+    return client.post('/api/manual-payment/submit', json={'phone': '254700000001', 'amount': 100, 'mpesa_code': code})
+
+
+def _rows(conn):
+    return conn.execute('select user_id, mpesa_receipt_number, status from transactions').fetchall()
+
+
+def test_submission_is_stored_and_indexed(db, make_client):
+    response = _submit(make_client(manual_payment_bp, user_id=1), code=' rcp1234567 ')
+
+    assert response.status_code == 200
+    assert _rows(db.conn) == [(1, CODE, 'pending')]
+    assert receipt_index.contains(CODE)
+
+
+def test_indexed_code_is_refused_without_a_query(db, make_client):
+    receipt_index.add(CODE)
+
+    response = _submit(make_client(manual_payment_bp, user_id=1))
+
+    assert response.status_code == 400
+    assert db.requests == []
+
+
+def test_concurrent_claims_admit_one(db):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim():
+        barrier.wait()
+        results.append(receipt_index.claim(CODE))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_concurrent_submissions_store_one(db, make_client):
+    clients = [make_client(manual_payment_bp, user_id=1 + i % 2) for i in range(6)]
+    barrier = threading.Barrier(len(clients))
+    statuses = []
+
+    def submit(client):
+        barrier.wait()
+        statuses.append(_submit(client).status_code)
+
+    threads = [threading.Thread(target=submit, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] + [400] * 5
+    assert len(_rows(db.conn)) == 1
+
+
+def test_code_stored_by_another_process_is_refused_and_stays_claimed(db, make_client):
+    # Inserted elsewhere after this process loaded its index: the unique index refuses it (23505)
+    db.conn.execute("insert into transactions (user_id, status, mpesa_receipt_number) values (2, 'pending', %s)", [CODE])
+
+    response = _submit(make_client(manual_payment_bp, user_id=1))
+
+    assert response.status_code == 400
+    assert ('POST', '/transactions') in [(m, p) for m, p, _ in db.requests]
+    assert receipt_index.contains(CODE)
+    assert len(_rows(db.conn)) == 1
+
+
+def test_unloaded_index_checks_the_table(db, make_client, monkeypatch):
+    monkeypatch.setattr(receipt_index, '_loaded', False)
+    db.conn.execute("insert into transactions (user_id, status, mpesa_receipt_number) values (2, 'pending', %s)", [CODE])
+    client = make_client(manual_payment_bp, user_id=1)
+
+    assert _submit(client).status_code == 400
+    assert receipt_index.contains(CODE)
+    assert _submit(client, code='RCP7654321').status_code == 200
+
+
+def test_failed_insert_releases_the_claim(db, make_client):
+    client = make_client(manual_payment_bp, user_id=1)
+
+    with _inserts_failing(db.conn):
+        assert _submit(client).status_code == 500
+    assert not receipt_index.contains(CODE)
+
+    assert _submit(client).status_code == 200
+    assert _rows(db.conn) == [(1, CODE, 'pending')]
@@ -0,0 +1,185 @@
+# tests/test_mpesa_callbacks.py - STK CALLBACKS: CREDIT BEFORE SUCCESS, RETRIES, SWEEPS
+
+import queue
+
+import pytest
+
+from app.utils import mpesa_callbacks, wallet_ledger
+from app.utils.receipt_index import receipt_index
+
+
+def _callback(checkout_request_id='ws_CO_1', receipt='RCP0000001', amount=100):
+    return {
+        "checkout_request_id": checkout_request_id,
+        "result_code": 0,
+        "result_desc": "The service request is processed successfully.",
+        "amount": amount,
+        "mpesa_receipt_number": receipt,
+        "phone": "254700000001"
+    }
+
+
+def _add_user(conn, user_id=1, balance=0):
+    conn.execute(
+        'insert into "user" (id, username, wallet_balance) values (%s, %s, %s)',
+        [user_id, f'u{user_id}', balance]
+    )
+
+
+def _add_tx(conn, user_id=1, checkout_request_id='ws_CO_1', amount=100, status='pending', receipt=None):
+    return conn.execute(
+        'insert into transactions (user_id, amount, status, checkout_request_id, mpesa_receipt_number) '
+        'values (%s, %s, %s, %s, %s) returning id',
+        [user_id, amount, status, checkout_request_id, receipt]
+    ).fetchone()[0]
+
+
+def _balance(conn, user_id=1):
+    return float(conn.execute('select wallet_balance from "user" where id = %s', [user_id]).fetchone()[0])
+
+
+def _tx(conn, checkout_request_id='ws_CO_1'):
+    return conn.execute(
+        'select status, mpesa_receipt_number from transactions where checkout_request_id = %s',
+        [checkout_request_id]
+    ).fetchone()
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def db(request, postgrest, monkeypatch):
+    if request.param == 'fallback':
+        postgrest.hidden_functions.add('apply_stk_payment')
+    monkeypatch.setattr(mpesa_callbacks, '_rpc_available', True)
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', True)
+    monkeypatch.setattr(receipt_index, '_codes', set())
+    return postgrest.conn
+
+
+def test_credits_and_marks_success(db):
+    _add_user(db)
+    _add_tx(db)
+
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert _tx(db) == ('success', 'RCP0000001')
+    assert db.execute("select reference from wallet_ledger").fetchall() == [('ws_CO_1',)]
+
+
+def test_failed_credit_leaves_transaction_pending_for_retry(db):
+    # Transaction for a user that doesn't exist yet: the credit fails
+    _add_tx(db, user_id=7)
+
+    with pytest.raises(Exception):
+        mpesa_callbacks.apply_callback(_callback(receipt='RCPFAIL001'))
+    assert _tx(db) == ('pending', None)
+    assert not receipt_index.contains('RCPFAIL001')
+
+    _add_user(db, user_id=7)
+    mpesa_callbacks.apply_callback(_callback(receipt='RCPFAIL001'))
+
+    assert _balance(db, 7) == 100
+    assert _tx(db)[0] == 'success'
+
+
+def test_retried_callback_credits_once(db):
+    _add_user(db)
+    _add_tx(db)
+
+    mpesa_callbacks.apply_callback(_callback())
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert db.execute('select count(*) from wallet_ledger').fetchone()[0] == 1
+
+
+def test_query_result_then_callback_credits_once(db):
+    _add_user(db)
+    _add_tx(db)
+
+    # stk_reconciler settles it first (no receipt or amount), then the callback lands
+    mpesa_callbacks.apply_callback(_callback(receipt=None, amount=None))
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert _tx(db)[0] == 'success'
+
+
+def test_credit_posted_before_a_failed_status_update(db):
+    _add_user(db)
+    _add_tx(db)
+    # A previous attempt credited the wallet but died before marking success
+    wallet_ledger.credit(1, 100, 'mpesa_topup', reference='ws_CO_1', wallet_status='approved')
+
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert _tx(db)[0] == 'success'
+
+
+def test_transaction_not_recorded_yet(db):
+    _add_user(db)
+
+    with pytest.raises(RuntimeError):
+        mpesa_callbacks.apply_callback(_callback())
+    assert _balance(db) == 0
+
+
+def test_push_takes_receipt_from_pending_submission(db):
+    _add_user(db)
+    _add_tx(db)
+    manual_id = _add_tx(db, checkout_request_id=None, receipt='RCP0000001')
+
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert _tx(db) == ('success', 'RCP0000001')
+    assert db.execute(
+        'select status, mpesa_receipt_number from transactions where id = %s', [manual_id]
+    ).fetchone() == ('failed', None)
+    assert receipt_index.contains('RCP0000001')
+
+
+def test_push_for_already_credited_receipt_is_not_credited(db):
+    _add_user(db, balance=100)  # Manual submission approved earlier
+    _add_tx(db)
+    _add_tx(db, checkout_request_id=None, status='success', receipt='RCP0000001')
+
+    mpesa_callbacks.apply_callback(_callback())
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert _balance(db) == 100
+    assert _tx(db) == ('failed', None)
+    assert db.execute('select count(*) from wallet_ledger').fetchone()[0] == 0
+
+
+@pytest.mark.parametrize('owner, success', [(1, True), (2, False)])
+def test_conflict_reported_as_success_only_to_the_owner(db, monkeypatch, owner, success):
+    notified = []
+    monkeypatch.setattr(mpesa_callbacks.stk_jobs, 'notify_result', lambda *args: notified.append(args))
+    _add_user(db)
+    _add_user(db, user_id=2)
+    _add_tx(db)
+    _add_tx(db, user_id=owner, checkout_request_id=None, status='success', receipt='RCP0000001')
+
+    mpesa_callbacks.apply_callback(_callback())
+
+    assert [(cid, user_id, ok) for cid, user_id, ok, _ in notified] == [('ws_CO_1', 1, success)]
+    assert _balance(db) == 0 and _balance(db, 2) == 0
+    assert _tx(db) == ('failed', None)
+
+
+def test_sweep_skips_callbacks_already_queued(postgrest, monkeypatch):
+    monkeypatch.setattr(mpesa_callbacks, '_queue', queue.Queue())
+    monkeypatch.setattr(mpesa_callbacks, '_queued_ids', set())
+    monkeypatch.setattr(mpesa_callbacks, '_inbox_available', True)
+    monkeypatch.setattr(mpesa_callbacks, 'start_workers', lambda: None)
+    postgrest.conn.execute(
+        "insert into mpesa_callback (checkout_request_id, result_code, payload, status, attempts) "
+        "values ('ws_CO_1', 0, %s, 'failed', 1)",
+        ['{"Body": {"stkCallback": {"CheckoutRequestID": "ws_CO_1", "ResultCode": 1, "ResultDesc": "x"}}}']
+    )
+
+    assert mpesa_callbacks.sweep() == 1
+    assert mpesa_callbacks.sweep() == 0
+    assert mpesa_callbacks._queue.qsize() == 1
@@ -0,0 +1,118 @@
+# tests/test_payment_review.py - BULK APPROVAL: ADMIN ONLY, ONE BAD ITEM NEVER FAILS THE BATCH
+
+import pytest
+
+from app.routes.admin import admin_bp
+from app.routes.admin_wallet import admin_wallet_bp
+from app.utils import payment_review, wallet_ledger
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def db(request, postgrest, monkeypatch):
+    if request.param == 'fallback':
+        postgrest.hidden_functions.add('confirm_manual_payments')
+    monkeypatch.setattr(payment_review, '_rpc_available', True)
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', True)
+    conn = postgrest.conn
+    for user_id, code in ((1, 'RCPA000001'), (2, 'RCPB000002')):
+        conn.execute('insert into "user" (id, username) values (%s, %s)', [user_id, f'u{user_id}'])
+        conn.execute(
+            "insert into transactions (user_id, amount, status, mpesa_receipt_number) values (%s, 100, 'pending', %s)",
+            [user_id, code]
+        )
+    return conn
+
+
+def _review(client, items):
+    return client.post('/admin/dashboard/bulk-review', json={'action': 'confirm', 'items': items})
+
+
+def test_requires_admin(db, make_client):
+    client = make_client(admin_bp, admin_wallet_bp, user_id=1)
+
+    response = _review(client, [{'user_id': 1, 'verified_amount': 100, 'mpesa_code': 'RCPA000001'}])
+
+    assert response.status_code == 302
+    assert db.execute("select count(*) from transactions where status = 'pending'").fetchone()[0] == 2
+
+
+def test_invalid_user_id_is_reported_per_item(db, make_client):
+    client = make_client(admin_bp, admin_wallet_bp, is_admin=True)
+
+    response = _review(client, [
+        {'user_id': 'abc', 'verified_amount': 100, 'mpesa_code': 'RCPX000009'},
+        {'user_id': True, 'verified_amount': 100, 'mpesa_code': 'RCPX000009'},
+        {'user_id': 1, 'verified_amount': 'nan', 'mpesa_code': 'RCPA000001'},
+        {'user_id': '2', 'verified_amount': 100, 'mpesa_code': 'RCPB000002'}
+    ])
+
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['invalid', 'invalid', 'invalid', 'confirmed']
+    assert results[3]['new_balance'] == 100
+
+
+def test_database_error_on_one_item_keeps_the_others(db):
+    results = payment_review.confirm_payments([
+        {'user_id': 1, 'verified_amount': 1e12, 'mpesa_code': 'RCPA000001'},  # Overflows numeric(12, 2)
+        {'user_id': 2, 'verified_amount': 100, 'mpesa_code': 'RCPB000002'}
+    ])
+
+    assert [r['status'] for r in results] == ['error', 'confirmed']
+    assert results[0]['message']
+    assert db.execute(
+        'select status from transactions order by user_id'
+    ).fetchall() == [('pending',), ('success',)]
+
+
+def _confirm(client, user_id, code, amount=100):
+    return client.post('/admin/dashboard/confirm-payment',
+                       json={'user_id': user_id, 'verified_amount': amount, 'mpesa_code': code})
+
+
+def _status(conn, code):
+    return conn.execute('select status from transactions where mpesa_receipt_number = %s', [code]).fetchone()[0]
+
+
+def _balance(conn, user_id):
+    return float(conn.execute('select wallet_balance from "user" where id = %s', [user_id]).fetchone()[0])
+
+
+def test_single_confirm_credits_and_marks_success(db, make_client):
+    response = _confirm(make_client(admin_wallet_bp, is_admin=True), 1, 'RCPA000001')
+
+    assert response.status_code == 200
+    assert response.get_json()['new_balance'] == 100
+    assert _status(db, 'RCPA000001') == 'success'
+    assert _confirm(make_client(admin_wallet_bp, is_admin=True), 1, 'RCPA000001').status_code == 404
+
+
+def test_single_confirm_leaves_nothing_half_done(db, make_client):
+    db.execute("insert into transactions (user_id, amount, status, mpesa_receipt_number) values (7, 100, 'pending', 'RCPG000007')")
+
+    response = _confirm(make_client(admin_wallet_bp, is_admin=True), 7, 'RCPG000007')
+
+    assert response.status_code == 404
+    assert _status(db, 'RCPG000007') == 'pending'
+    assert db.execute('select count(*) from wallet_ledger').fetchone()[0] == 0
+
+
+def test_single_confirm_settles_a_credit_posted_before_a_failed_update(db, make_client):
+    # An earlier approval credited the wallet, then died before marking the row
+    wallet_ledger.credit(1, 100, 'mpesa_topup', reference='RCPA000001', wallet_status='approved')
+
+    response = _confirm(make_client(admin_wallet_bp, is_admin=True), 1, 'RCPA000001')
+
+    assert response.status_code == 200
+    assert response.get_json()['new_balance'] == 100
+    assert _status(db, 'RCPA000001') == 'success'
+    assert _balance(db, 1) == 100
+
+
+def test_single_confirm_refuses_a_receipt_credited_to_someone_else(db, make_client):
+    wallet_ledger.credit(2, 100, 'mpesa_topup', reference='RCPA000001', wallet_status='approved')
+
+    response = _confirm(make_client(admin_wallet_bp, is_admin=True), 1, 'RCPA000001')
+
+    assert response.status_code == 409
+    assert _status(db, 'RCPA000001') == 'pending'
+    assert _balance(db, 1) == 0
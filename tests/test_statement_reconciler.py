@@ -0,0 +1,93 @@
+# tests/test_statement_reconciler.py - STATEMENT APPROVAL: ADMIN ONLY, NO PHONE MEANS REVIEW
+
+import io
+
+import httpx
+import pytest
+
+from app.routes.admin import admin_bp
+from app.routes.admin_wallet import admin_wallet_bp
+from app.utils import payment_review, statement_reconciler, wallet_ledger
+from app.utils.supabase_gateway import get_supabase
+
+STATEMENT = b"""Receipt No.,Completion Time,Details,Transaction Status,Paid In,Other Party Info
+RCPA000001,2026-01-05 10:00:00,Pay Bill,Completed,100.00,254712345678 - JANE
+RCPB000002,2026-01-05 10:05:00,Pay Bill,Completed,100.00,
+RCPC000003,2026-01-05 10:10:00,Pay Bill,Completed,100.00,254799999999 - JOHN
+"""
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(payment_review, '_rpc_available', True)
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', True)
+    conn = postgrest.conn
+    for user_id, code, phone in ((1, 'RCPA000001', '0712345678'),
+                                 (2, 'RCPB000002', '0722222222'),
+                                 (3, 'RCPC000003', None)):
+        conn.execute('insert into "user" (id, username) values (%s, %s)', [user_id, f'u{user_id}'])
+        conn.execute(
+            "insert into transactions (user_id, amount, status, mpesa_receipt_number, default_mpesa_phone) "
+            "values (%s, 100, 'pending', %s, %s)",
+            [user_id, code, phone]
+        )
+    return conn
+
+
+def _upload(client, apply):
+    return client.post('/admin/dashboard/reconcile-statement', data={
+        'statement': (io.BytesIO(STATEMENT), 'statement.csv'),
+        'apply': 'true' if apply else ''
+    })
+
+
+def test_requires_admin(db, make_client):
+    client = make_client(admin_bp, admin_wallet_bp, user_id=1)
+
+    assert _upload(client, apply=True).status_code == 302
+    assert db.execute("select count(*) from transactions where status = 'pending'").fetchone()[0] == 3
+
+
+def test_preview_matches_rows_without_phone(db, make_client):
+    client = make_client(admin_bp, admin_wallet_bp, is_admin=True)
+
+    report = _upload(client, apply=False).get_json()
+
+    assert sorted(m['mpesa_code'] for m in report['matched']) == ['RCPA000001', 'RCPB000002', 'RCPC000003']
+    assert 'results' not in report
+
+
+def test_apply_sends_missing_phones_to_review(db, make_client):
+    client = make_client(admin_bp, admin_wallet_bp, is_admin=True)
+
+    report = _upload(client, apply=True).get_json()
+
+    assert [m['mpesa_code'] for m in report['matched']] == ['RCPA000001']
+    assert sorted(m['mpesa_code'] for m in report['mismatched']) == ['RCPB000002', 'RCPC000003']
+    assert [r['status'] for r in report['results']] == ['confirmed']
+    assert db.execute(
+        'select mpesa_receipt_number, status from transactions order by id'
+    ).fetchall() == [('RCPA000001', 'success'), ('RCPB000002', 'pending'), ('RCPC000003', 'pending')]
+
+
+def test_pending_rows_approved_while_paging_skip_nothing(db, monkeypatch):
+    monkeypatch.setattr(statement_reconciler, 'PAGE_SIZE', 1)
+    session = get_supabase().postgrest.session
+    shim = session._transport.handler
+    pages = []
+
+    def approve_first_after_one_page(request):
+        response = shim(request)
+        if request.method == 'GET' and request.url.path.endswith('/transactions'):
+            pages.append(request.url.params.get('id'))
+            if len(pages) == 1:
+                # An admin approves the first row while the statement is being read
+                db.execute("update transactions set status = 'success' where id = 1")
+        return response
+
+    monkeypatch.setattr(session, '_transport', httpx.MockTransport(approve_first_after_one_page))
+
+    pending = statement_reconciler._pending_manual()
+
+    assert sorted(pending) == ['RCPA000001', 'RCPB000002', 'RCPC000003']
+    assert pages == ['gt.0', 'gt.1', 'gt.2', 'gt.3']
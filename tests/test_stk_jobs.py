@@ -0,0 +1,96 @@
+# tests/test_stk_jobs.py - AN ACCEPTED PUSH IS NEVER REPORTED WITHOUT ITS TRANSACTION
+
+from contextlib import contextmanager
+
+import pytest
+
+from app.utils import mpesa_callbacks, stk_jobs
+
+
+class _Accepted:
+    ok = True
+
+    def json(self):
+        return {
+            "ResponseCode": "0",
+            "CheckoutRequestID": "ws_CO_1",
+            "MerchantRequestID": "mr_1",
+            "CustomerMessage": "Success. Request accepted for processing"
+        }
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(stk_jobs, '_jobs', {})
+    monkeypatch.setattr(stk_jobs, '_checkout_jobs', {})
+    monkeypatch.setattr(stk_jobs, '_unsaved', {})
+    monkeypatch.setattr(stk_jobs, 'SAVE_BACKOFF', 0)
+    monkeypatch.setattr(stk_jobs, 'start_workers', lambda: None)
+    monkeypatch.setattr(stk_jobs.daraja, 'stk_push', lambda *args: _Accepted())
+    postgrest.conn.execute('insert into "user" (id, username) values (1, %s)', ['u1'])
+    return postgrest.conn
+
+
+@contextmanager
+def _inserts_failing(conn):
+    conn.execute("""
+        create function refuse_insert() returns trigger language plpgsql as $$
+        begin raise exception 'database unavailable'; end $$;
+        create trigger refuse_insert before insert on transactions
+        for each row execute function refuse_insert();
+    """)
+    try:
+        yield
+    finally:
+        conn.execute('drop trigger refuse_insert on transactions; drop function refuse_insert();')
+
+
+def _push():
+    job = stk_jobs.submit(1, '254700000001', 100, 'https://example.com/cb')
+    stk_jobs._run(job['job_id'])
+    return job['job_id']
+
+
+def _transactions(conn):
+    return conn.execute('select status, checkout_request_id from transactions').fetchall()
+
+
+def test_accepted_once_saved(db):
+    job_id = _push()
+
+    assert stk_jobs.get_job(job_id)['status'] == stk_jobs.ACCEPTED
+    assert _transactions(db) == [('pending', 'ws_CO_1')]
+
+
+def test_unsaved_push_is_held_and_saved_by_the_sweep(db):
+    with _inserts_failing(db):
+        job_id = _push()
+
+    job = stk_jobs.get_job(job_id)
+    assert job['status'] == stk_jobs.SUBMITTED
+    assert job['checkout_request_id'] == 'ws_CO_1'
+    assert _transactions(db) == []
+
+    mpesa_callbacks.sweep()
+
+    assert _transactions(db) == [('pending', 'ws_CO_1')]
+    assert stk_jobs.get_job(job_id)['status'] == stk_jobs.ACCEPTED
+    assert stk_jobs._unsaved == {}
+
+
+def test_callback_records_held_push(db):
+    with _inserts_failing(db):
+        job_id = _push()
+
+    mpesa_callbacks.apply_callback({
+        "checkout_request_id": "ws_CO_1",
+        "result_code": 0,
+        "result_desc": "ok",
+        "amount": 100,
+        "mpesa_receipt_number": "RCP0000001",
+        "phone": "254700000001"
+    })
+
+    assert _transactions(db) == [('success', 'ws_CO_1')]
+    assert stk_jobs.get_job(job_id)['status'] == stk_jobs.SUCCESS
+    assert stk_jobs._unsaved == {}
@@ -0,0 +1,134 @@
+# tests/test_stk_reconciler.py - PENDING PUSHES SETTLED FROM STK QUERY RESULTS
+
+import pytest
+
+from app.utils import mpesa_callbacks, stk_reconciler, wallet_ledger
+from app.utils.receipt_index import receipt_index
+
+PROCESSING = {"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"}
+UNKNOWN = {"errorCode": "400.002.02", "errorMessage": "Bad Request - Invalid CheckoutRequestID"}
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(stk_reconciler, 'MIN_AGE', 60)
+    monkeypatch.setattr(stk_reconciler, 'GIVE_UP_AFTER', 3600)
+    monkeypatch.setattr(mpesa_callbacks, '_rpc_available', True)
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', True)
+    monkeypatch.setattr(receipt_index, '_codes', set())
+    postgrest.conn.execute('insert into "user" (id, username) values (1, %s)', ['u1'])
+    return postgrest.conn
+
+
+@pytest.fixture
+def query(monkeypatch):
+    """Stub STK query: checkout id -> response body (or an exception to raise)"""
+    results = {}
+
+    def stk_query(checkout_request_id):
+        result = results[checkout_request_id]
+        if isinstance(result, Exception):
+            raise result
+        return _Response(result)
+
+    monkeypatch.setattr(stk_reconciler.daraja, 'stk_query', stk_query)
+    return results
+
+
+def _add_tx(conn, checkout_request_id, age_seconds=300):
+    conn.execute(
+        "insert into transactions (user_id, amount, status, checkout_request_id, created_at) "
+        "values (1, 100, 'pending', %s, now() - make_interval(secs => %s))",
+        [checkout_request_id, age_seconds]
+    )
+
+
+def _status(conn, checkout_request_id):
+    return conn.execute(
+        'select status from transactions where checkout_request_id = %s', [checkout_request_id]
+    ).fetchone()[0]
+
+
+def _counts(result):
+    return {k: result[k] for k in (stk_reconciler.RESOLVED, stk_reconciler.STILL_PENDING,
+                                   stk_reconciler.EXPIRED, stk_reconciler.ERROR)}
+
+
+def test_resolved_push_is_applied(db, query):
+    _add_tx(db, 'ws_CO_paid')
+    _add_tx(db, 'ws_CO_cancelled')
+    query['ws_CO_paid'] = {"ResultCode": "0", "ResultDesc": "The service request is processed successfully."}
+    query['ws_CO_cancelled'] = {"ResultCode": "1032", "ResultDesc": "Request cancelled by user"}
+
+    result = stk_reconciler.reconcile()
+
+    assert _counts(result) == {'resolved': 2, 'pending': 0, 'expired': 0, 'error': 0}
+    assert result['checked'] == 2
+    assert _status(db, 'ws_CO_paid') == 'success'
+    assert _status(db, 'ws_CO_cancelled') == 'failed'
+    assert float(db.execute('select wallet_balance from "user" where id = 1').fetchone()[0]) == 100
+
+
+def test_push_still_processing_is_left_pending(db, query):
+    _add_tx(db, 'ws_CO_1', age_seconds=7200)  # Past GIVE_UP_AFTER, but Daraja still has it
+    query['ws_CO_1'] = PROCESSING
+
+    result = stk_reconciler.reconcile()
+
+    assert _counts(result) == {'resolved': 0, 'pending': 1, 'expired': 0, 'error': 0}
+    assert _status(db, 'ws_CO_1') == 'pending'
+
+
+def test_unknown_push_expires_only_after_give_up(db, query):
+    _add_tx(db, 'ws_CO_old', age_seconds=7200)
+    _add_tx(db, 'ws_CO_recent', age_seconds=300)
+    query['ws_CO_old'] = UNKNOWN
+    query['ws_CO_recent'] = UNKNOWN
+
+    result = stk_reconciler.reconcile()
+
+    assert _counts(result) == {'resolved': 0, 'pending': 1, 'expired': 1, 'error': 0}
+    assert _status(db, 'ws_CO_old') == 'failed'
+    assert _status(db, 'ws_CO_recent') == 'pending'
+
+
+def test_too_recent_push_is_not_queried(db, query):
+    _add_tx(db, 'ws_CO_1', age_seconds=10)
+
+    assert stk_reconciler.reconcile()['checked'] == 0
+    assert _status(db, 'ws_CO_1') == 'pending'
+
+
+def test_failures_are_counted_and_do_not_stop_the_run(db, query, monkeypatch):
+    _add_tx(db, 'ws_CO_paid')
+    _add_tx(db, 'ws_CO_old', age_seconds=7200)
+    _add_tx(db, 'ws_CO_down')
+    _add_tx(db, 'ws_CO_ok')
+    query['ws_CO_paid'] = {"ResultCode": "0", "ResultDesc": "ok"}
+    query['ws_CO_old'] = UNKNOWN
+    query['ws_CO_down'] = ConnectionError('Daraja unreachable')
+    query['ws_CO_ok'] = {"ResultCode": "1032", "ResultDesc": "Request cancelled by user"}
+
+    apply_callback = mpesa_callbacks.apply_callback
+
+    def flaky_apply(callback):
+        if callback['checkout_request_id'] in ('ws_CO_paid', 'ws_CO_old'):
+            raise RuntimeError('database unavailable')
+        return apply_callback(callback)
+
+    monkeypatch.setattr(mpesa_callbacks, 'apply_callback', flaky_apply)
+
+    result = stk_reconciler.reconcile()
+
+    assert _counts(result) == {'resolved': 1, 'pending': 0, 'expired': 0, 'error': 3}
+    assert _status(db, 'ws_CO_paid') == 'pending'
+    assert _status(db, 'ws_CO_old') == 'pending'
+    assert _status(db, 'ws_CO_ok') == 'failed'
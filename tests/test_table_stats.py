@@ -0,0 +1,95 @@
+# tests/test_table_stats.py - COUNT-ONLY TABLE STATISTICS: HEAD REQUESTS, ESTIMATES, CACHED LISTING
+
+import pytest
+
+from app.routes.admin import admin_bp
+from app.routes.admin_tools import admin_tools_bp
+from app.utils import cache, table_stats
+from app.utils.cache import TTLCache
+
+
+@pytest.fixture
+def db(postgrest, monkeypatch):
+    monkeypatch.setattr(cache, 'admin_cache', TTLCache(ttl=60, stale_ttl=60))
+    monkeypatch.setattr('app.routes.admin_tools.admin_cache', cache.admin_cache)
+    conn = postgrest.conn
+    conn.execute("insert into \"group\" (id, name, target_amount) values (5, 'G5', 400)")
+    for user_id in range(1, 4):
+        conn.execute('insert into "user" (id, username) values (%s, %s)', [user_id, f'u{user_id}'])
+    conn.execute("insert into payment (group_id, amount, verified) values (5, 100, true), (5, 50, false)")
+    return postgrest
+
+
+def _counted_tables(requests):
+    return [path.strip('/') for _, path, _ in requests]
+
+
+def test_small_table_gets_an_exact_count(db):
+    result = table_stats.count_rows('user')
+
+    assert result['rows'] == 3
+    assert result['exact'] is True
+    # Planner estimate first, then count(*) because it is below EXACT_BELOW
+    assert _counted_tables(db.requests) == ['user', 'user']
+
+
+def test_large_estimate_is_kept(db, monkeypatch):
+    monkeypatch.setattr(table_stats, 'EXACT_BELOW', 0)
+
+    result = table_stats.count_rows('user')
+
+    assert result['exact'] is False
+    assert isinstance(result['rows'], int)
+    assert _counted_tables(db.requests) == ['user']
+
+
+def test_exact_skips_the_estimate(db, monkeypatch):
+    monkeypatch.setattr(table_stats, 'EXACT_BELOW', 0)
+
+    result = table_stats.count_rows('user', exact=True)
+
+    assert result['rows'] == 3
+    assert result['exact'] is True
+    assert _counted_tables(db.requests) == ['user']
+
+
+def test_filtered_count(db):
+    result = table_stats.count_rows('payment', lambda q: q.eq('verified', False))
+
+    assert result['rows'] == 1
+    assert all(dict(params)['verified'].lower() == 'eq.false' for _, _, params in db.requests)
+
+
+def test_missing_table_reports_an_error(db):
+    result = table_stats.count_rows('no_such_table')
+
+    assert result['rows'] == 'Error'
+    assert result['error']
+
+
+def test_table_stats_only_sends_head_requests(db):
+    stats = table_stats.table_stats()
+
+    rows = {table['name']: table['rows'] for table in stats['tables']}
+    assert [table['name'] for table in stats['tables']] == list(table_stats.TABLES)
+    assert rows['user'] == 3
+    assert rows['group'] == 1
+    assert rows['payment'] == 2
+    assert rows['wifi_credential'] == 'Error'  # Not part of the test schema
+    assert {method for method, _, _ in db.requests} == {'HEAD'}
+
+
+def test_list_tables_is_cached_unless_exact(db, make_client):
+    client = make_client(admin_bp, admin_tools_bp, is_admin=True)
+
+    first = client.get('/admin/tools/api/list-tables').get_json()
+    db.requests.clear()
+    assert client.get('/admin/tools/api/list-tables').get_json() == first
+    assert db.requests == []
+
+    db.conn.execute("insert into \"user\" (id, username) values (4, 'u4')")
+    exact = client.get('/admin/tools/api/list-tables?exact=true').get_json()
+
+    assert {t['name']: t['rows'] for t in exact['tables']}['user'] == 4
+    assert all(t['exact'] for t in exact['tables'] if t['rows'] != 'Error')
+    assert db.requests
@@ -0,0 +1,94 @@
+# tests/test_wallet_ledger.py - IDEMPOTENT CREDITS, WITH AND WITHOUT wallet_post
+
+import threading
+
+import pytest
+
+from app.utils import wallet_ledger
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def ledger(request, postgrest, monkeypatch):
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', True)
+    monkeypatch.setattr(wallet_ledger, '_ledger_available', True)
+    monkeypatch.setattr(wallet_ledger, '_cache', {})
+    if request.param == 'fallback':
+        postgrest.hidden_functions.add('wallet_post')
+    postgrest.conn.execute('insert into "user" (username, wallet_balance) values (%s, 100)', ['alice'])
+    return postgrest
+
+
+def _balance(conn, user_id=1):
+    return float(conn.execute('select wallet_balance from "user" where id = %s', [user_id]).fetchone()[0])
+
+
+def _entries(conn, reference):
+    return conn.execute(
+        'select amount, balance_after from wallet_ledger where reference = %s', [reference]
+    ).fetchall()
+
+
+def test_reference_credited_once(ledger):
+    first = wallet_ledger.credit(1, 50, 'mpesa_topup', reference='RCPT1')
+    second = wallet_ledger.credit(1, 50, 'mpesa_topup', reference='RCPT1')
+
+    assert not first['duplicate'] and second['duplicate']
+    assert first['balance'] == second['balance'] == 150
+    assert _balance(ledger.conn) == 150
+    assert [(float(a), float(b)) for a, b in _entries(ledger.conn, 'RCPT1')] == [(50, 150)]
+
+
+def test_concurrent_posts_of_one_reference_credit_once(ledger):
+    results, errors = [], []
+    start = threading.Barrier(8)
+
+    def post():
+        start.wait()
+        try:
+            results.append(wallet_ledger.credit(1, 40, 'mpesa_topup', reference='RCPT2'))
+        except RuntimeError as e:
+            errors.append(e)  # "still pending": the winner has not finished yet
+
+    threads = [threading.Thread(target=post) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert _balance(ledger.conn) == 140
+    assert sum(not r['duplicate'] for r in results) == 1
+    assert len(_entries(ledger.conn, 'RCPT2')) == 1
+
+
+def test_failed_post_releases_reference(ledger):
+    with pytest.raises(LookupError):
+        wallet_ledger.credit(99, 50, 'mpesa_topup', reference='RCPT3')
+    assert _entries(ledger.conn, 'RCPT3') == []
+
+    with pytest.raises(ValueError):
+        wallet_ledger.debit(1, 500, 'group_payment', reference='PAY1')
+    assert _entries(ledger.conn, 'PAY1') == []
+    assert _balance(ledger.conn) == 100
+
+
+def test_unreferenced_posts_all_apply(ledger):
+    wallet_ledger.credit(1, 10, 'manual_topup')
+    wallet_ledger.credit(1, 10, 'manual_topup')
+    assert _balance(ledger.conn) == 120
+
+
+def test_uncertain_update_keeps_claim(postgrest, monkeypatch):
+    monkeypatch.setattr(wallet_ledger, '_rpc_available', False)
+    monkeypatch.setattr(wallet_ledger, '_ledger_available', True)
+    postgrest.conn.execute('insert into "user" (username, wallet_balance) values (%s, 100)', ['bob'])
+
+    def lost_response(*args):
+        raise wallet_ledger.UncertainPost("timed out")
+
+    monkeypatch.setattr(wallet_ledger, '_apply_balance', lost_response)
+    with pytest.raises(wallet_ledger.UncertainPost):
+        wallet_ledger.credit(1, 50, 'mpesa_topup', reference='RCPT4')
+
+    # The claim stays pending, so a retry refuses instead of maybe crediting twice
+    with pytest.raises(RuntimeError, match='still pending'):
+        wallet_ledger.credit(1, 50, 'mpesa_topup', reference='RCPT4')
@@ -0,0 +1,180 @@
+# tests/test_wifi_access_parity.py - WIFI GATES VS THE ORIGINAL ROUTE CODE
+#
+# routes/wifi.py used to run eight gates with a query per step.
+# reference_check_access below is that code, verbatim apart from taking the
+# client and clock as arguments. Every seeded user is checked with the
+# wifi_access function installed (RPC path) and hidden (narrow-query fallback).
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils import wifi_access
+from app.utils.supabase_gateway import get_supabase
+
+
+# ============ REFERENCE (ORIGINAL ROUTE CODE) ============
+
+def reference_check_access(supabase, user_id, now):
+    # ============ GATE 1: CHECK LOGIN ============
+    if not user_id:
+        # Return index.html with a flag to open auth modal via JS
+        return {"open_auth_modal": True}, None, None
+
+    # ============ GATE 2: GET USER DATA ============
+    user_result = supabase.table('user').select('*').eq('id', user_id).execute()
+    if not user_result.data:
+        return {"open_auth_modal": True}, None, None
+
+    user = user_result.data[0]
+
+    # ============ GATE 3: CHECK WALLET BALANCE ============
+    wallet_balance = float(user.get('wallet_balance', 0))
+    if wallet_balance < 100:
+        return {"error_message": f"Wallet balance too low (KSh {wallet_balance:.0f}). Add at least KSh 100.",
+                "error_action": "wallet"}, user, None
+
+    # ============ GATE 4: CHECK GROUP MEMBERSHIP ============
+    if not user.get('member_id'):
+        return {"error_message": "You're not in a group. Join a group first.",
+                "error_action": "group"}, user, None
+
+    # ============ GATE 5: VERIFY GROUP & STATUS ============
+    member_result = supabase.table('member').select('*, group(*)').eq('id', user['member_id']).execute()
+
+    if not member_result.data or not member_result.data[0].get('group'):
+        return {"error_message": "Group not found. Join a valid group.",
+                "error_action": "group"}, user, None
+
+    member = member_result.data[0]
+    group = member['group']
+
+    # ============ GATE 6: CHECK GROUP STATUS ============
+    group_status = group.get('status', 'pending')
+
+    if group_status == 'pending':
+        max_members = group.get('max_members', 3)
+        # Count actual members in the group
+        all_members = supabase.table('member').select('id').eq('group_id', group['id']).execute()
+        current_members = len(all_members.data) if all_members.data else 0
+        remaining = max_members - current_members
+        return {"error_message": f"Group not active yet. Waiting for {remaining} more member(s) to join.",
+                "error_action": "group"}, user, group
+
+    # ============ GATE 7: CHECK GROUP EXPIRATION ============
+    week_end = group.get('week_end')
+
+    if not week_end:
+        return {"error_message": "Group has not started yet. Wait for all members to join.",
+                "error_action": "group"}, user, group
+
+    # Make both datetimes timezone-naive for comparison
+    week_end_dt = datetime.fromisoformat(week_end.replace('Z', '+00:00')).replace(tzinfo=None)
+
+    if group_status == 'expired' or now > week_end_dt:
+        return {"error_message": "Your group access expired. Leave and join a new group.",
+                "error_action": "group"}, user, group
+
+    # ============ GATE 8: VERIFY PAYMENT COMPLETE ============
+    current_balance = float(group.get('current_balance', 0))
+    target_amount = float(group.get('target_amount', 0))
+
+    if current_balance < target_amount:
+        remaining = target_amount - current_balance
+        return {"error_message": f"Group payment incomplete. KSh {remaining:.0f} remaining.",
+                "error_action": "payment"}, user, group
+
+    return None, user, group
+
+
+# ============ SEED DATA ============
+
+# user id -> (wallet, group: (status, balance, target, week_end offset in days or None, password_revealed) or
+#            'no_member' / 'missing_member', extra members in the group)
+USERS = {
+    1: (50, ('active', 300, 300, 3, True), 0),          # low wallet
+    2: (500, 'no_member', 0),                            # no group
+    3: (500, ('active', 300, 300, 3, True), 2),          # allowed, password revealed
+    4: (500, ('active', 300, 300, 3, False), 2),         # allowed, password not revealed
+    5: (500, ('active', 250, 300, 3, True), 2),          # underfunded
+    6: (500, ('expired', 300, 300, 3, True), 2),         # expired by status
+    7: (500, ('active', 300, 300, -1, True), 2),         # past week_end
+    8: (500, ('expired', 100, 300, -2, False), 2),       # expired and underfunded
+    9: (500, ('pending', 0, 300, None, False), 1),       # waiting for members
+    10: (500, ('active', 300, 300, None, False), 2),     # active but never started
+    11: (500, 'missing_member', 0),                      # member row gone
+    12: (100, ('active', 400, 300, 1, True), 0),         # exactly the minimum wallet, overfunded
+}
+
+
+def _seed(conn, now):
+    for user_id, (wallet, group, extra_members) in USERS.items():
+        member_id = None
+        if group == 'missing_member':
+            member_id = 999
+        elif group != 'no_member':
+            status, balance, target, offset, revealed = group
+            week_end = now + timedelta(days=offset) if offset is not None else None
+            group_id = conn.execute(
+                'insert into "group" (name, status, current_balance, target_amount, week_end, password_revealed) '
+                'values (%s, %s, %s, %s, %s, %s) returning id',
+                [f'G{user_id}', status, balance, target, week_end, revealed]
+            ).fetchone()[0]
+            member_id = conn.execute(
+                'insert into member (group_id, user_id) values (%s, %s) returning id', [group_id, user_id]
+            ).fetchone()[0]
+            for _ in range(extra_members):
+                conn.execute('insert into member (group_id) values (%s)', [group_id])
+        conn.execute(
+            'insert into "user" (id, username, wallet_balance, member_id) values (%s, %s, %s, %s)',
+            [user_id, f'u{user_id}', wallet, member_id]
+        )
+
+
+@pytest.fixture(params=['rpc', 'fallback'])
+def db(request, postgrest, monkeypatch):
+    if request.param == 'fallback':
+        postgrest.hidden_functions.add('wifi_access')
+    monkeypatch.setattr(wifi_access, '_rpc_available', True)
+    now = datetime.utcnow()
+    _seed(postgrest.conn, now)
+    return now
+
+
+@pytest.mark.parametrize('user_id', sorted(USERS) + [404, None])
+def test_decision_matches_reference(db, user_id):
+    now = db
+    expected, _, expected_group = reference_check_access(get_supabase(), user_id, now)
+
+    if user_id:
+        decision = wifi_access.evaluate(wifi_access.fetch_access_row(user_id), now=now)
+    else:
+        decision = wifi_access.check_access(user_id)
+
+    assert (None if decision.allowed else decision.template_context()) == expected
+    assert (decision.group or {}).get('id') == (expected_group or {}).get('id')
+
+
+def test_rpc_and_fallback_agree(postgrest, monkeypatch):
+    now = datetime.utcnow()
+    _seed(postgrest.conn, now)
+    monkeypatch.setattr(wifi_access, '_rpc_available', True)
+
+    from_rpc = {uid: wifi_access.evaluate(wifi_access.fetch_access_row(uid), now=now).to_dict() for uid in USERS}
+    postgrest.hidden_functions.add('wifi_access')
+    from_fallback = {uid: wifi_access.evaluate(wifi_access.fetch_access_row(uid), now=now).to_dict() for uid in USERS}
+
+    assert wifi_access._rpc_available is False
+    assert from_fallback == from_rpc
+    assert [uid for uid, d in from_rpc.items() if d['allowed']] == [3, 4, 12]
+    assert from_rpc[5]['remaining_amount'] == 50
+    assert from_rpc[9]['remaining_members'] == 1
+
+
+def test_rpc_is_one_round_trip(postgrest, monkeypatch):
+    _seed(postgrest.conn, datetime.utcnow())
+    monkeypatch.setattr(wifi_access, '_rpc_available', True)
+
+    wifi_access.check_access(9)
+
+    assert len(postgrest.requests) == 1
@@ -0,0 +1,166 @@
+# tests/test_wifi_entitlement.py - SIGNED WIFI PASSES: WHEN ONE IS REFUSED, AND THE DATABASE FALLBACK
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from app.routes.wifi import wifi_bp
+from app.utils import wifi_access, wifi_entitlement
+from app.utils.wifi_access import AccessDecision
+
+NOW = 1_800_000_000.0
+WEEK_END = datetime.utcfromtimestamp(NOW) + timedelta(days=3)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(wifi_entitlement, '_revoked_users', {})
+    monkeypatch.setattr(wifi_entitlement, '_revoked_groups', {})
+    app = Flask(__name__)
+    app.secret_key = 'test-secret'
+    with app.app_context():
+        yield app
+
+
+def _decision(user_id=1, group_id=5, week_end=WEEK_END):
+    return AccessDecision(user={'id': user_id, 'username': f'u{user_id}'}, group={'id': group_id}, week_end=week_end)
+
+
+def test_genuine_pass_is_accepted(app):
+    token, expires_at = wifi_entitlement.issue(_decision(), now=NOW)
+
+    assert expires_at == NOW + wifi_entitlement.WIFI_ENTITLEMENT_TTL
+    assert wifi_entitlement.verify(token, 1, now=NOW + 60)['g'] == 5
+
+
+def test_tampered_signature_is_refused(app):
+    token, _ = wifi_entitlement.issue(_decision(), now=NOW)
+    payload, signature = token.rsplit('.', 1)
+    forged = payload + '.' + ('A' if signature[0] != 'A' else 'B') + signature[1:]
+
+    assert wifi_entitlement.verify(forged, 1, now=NOW) is None
+    assert wifi_entitlement.verify('not-a-pass', 1, now=NOW) is None
+
+
+def test_pass_signed_with_another_key_is_refused(app):
+    token, _ = wifi_entitlement.issue(_decision(), now=NOW)
+    app.secret_key = 'rotated-secret'
+
+    assert wifi_entitlement.verify(token, 1, now=NOW) is None
+
+
+def test_expired_pass_is_refused(app):
+    token, expires_at = wifi_entitlement.issue(_decision(), now=NOW)
+
+    assert wifi_entitlement.verify(token, 1, now=expires_at - 1)
+    assert wifi_entitlement.verify(token, 1, now=expires_at) is None
+
+
+def test_pass_never_outlives_week_end(app):
+    week_end = datetime.utcfromtimestamp(NOW) + timedelta(minutes=10)
+    token, expires_at = wifi_entitlement.issue(_decision(week_end=week_end), now=NOW)
+
+    assert expires_at == NOW + 600
+    assert wifi_entitlement.verify(token, 1, now=NOW + 599)
+    assert wifi_entitlement.verify(token, 1, now=NOW + 601) is None
+
+
+def test_pass_presented_by_another_user_is_refused(app):
+    token, _ = wifi_entitlement.issue(_decision(user_id=1), now=NOW)
+
+    assert wifi_entitlement.verify(token, 2, now=NOW) is None
+    assert wifi_entitlement.verify(token, None, now=NOW) is None
+
+
+def test_revoked_user_pass_is_refused(app):
+    token, _ = wifi_entitlement.issue(_decision(user_id=1), now=time.time() - 5)
+    other, _ = wifi_entitlement.issue(_decision(user_id=2), now=time.time() - 5)
+
+    wifi_entitlement.revoke_user(1)
+
+    assert wifi_entitlement.verify(token, 1) is None
+    assert wifi_entitlement.verify(other, 2)
+    # A pass issued after the revoke is good again
+    fresh, _ = wifi_entitlement.issue(_decision(user_id=1), now=time.time() + 1)
+    assert wifi_entitlement.verify(fresh, 1, now=time.time() + 2)
+
+
+def test_revoked_group_pass_is_refused(app):
+    token, _ = wifi_entitlement.issue(_decision(group_id=5), now=time.time() - 5)
+    other, _ = wifi_entitlement.issue(_decision(user_id=2, group_id=6), now=time.time() - 5)
+
+    wifi_entitlement.revoke_group(5)
+
+    assert wifi_entitlement.verify(token, 1) is None
+    assert wifi_entitlement.verify(other, 2)
+
+
+# ============ ROUTE FALLBACK ============
+
+@pytest.fixture
+def db(postgrest, monkeypatch, app):
+    monkeypatch.setenv('SSID_NAME', 'MyFi-Guest')
+    monkeypatch.setenv('SSID_PASSWORD', 'correct-horse-battery')
+    monkeypatch.setattr(wifi_access, '_rpc_available', True)
+    conn = postgrest.conn
+    conn.execute(
+        "insert into \"group\" (id, name, status, current_balance, target_amount, week_end) "
+        "values (5, 'G5', 'active', 300, 300, now() + interval '3 days')"
+    )
+    conn.execute("insert into member (id, group_id, user_id) values (10, 5, 1)")
+    conn.execute("insert into \"user\" (id, username, wallet_balance, member_id) values (1, 'u1', 500, 10)")
+    conn.execute("insert into \"user\" (id, username, wallet_balance) values (2, 'u2', 500)")
+    return postgrest
+
+
+def _load_qr(client):
+    return client.get('/wifi/qr.svg')
+
+
+def test_route_without_pass_checks_the_database_and_issues_one(db, make_client):
+    client = make_client(wifi_bp, user_id=1)
+
+    response = _load_qr(client)
+
+    assert response.status_code == 200
+    assert any(path.endswith('/rpc/wifi_access') for _, path, _ in db.requests)
+    assert wifi_entitlement.COOKIE_NAME in response.headers.get('Set-Cookie', '')
+
+    # The pass now skips the database
+    db.requests.clear()
+    assert _load_qr(client).status_code == 200
+    assert db.requests == []
+
+
+def test_route_with_invalid_pass_falls_back_to_the_database(db, make_client):
+    client = make_client(wifi_bp, user_id=2)
+    client.set_cookie(wifi_entitlement.COOKIE_NAME, 'forged.pass')
+
+    response = _load_qr(client)
+
+    assert response.status_code == 403
+    assert response.get_json()['action'] == 'group'
+    assert any(path.endswith('/rpc/wifi_access') for _, path, _ in db.requests)
+
+
+def test_route_refuses_another_users_pass(db, make_client):
+    owner = make_client(wifi_bp, user_id=1)
+    token = _load_qr(owner).headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+
+    client = make_client(wifi_bp, user_id=2)
+    client.set_cookie(wifi_entitlement.COOKIE_NAME, token)
+
+    assert _load_qr(client).status_code == 403
+
+
+def test_route_rechecks_after_group_revoked(db, make_client):
+    client = make_client(wifi_bp, user_id=1)
+    assert _load_qr(client).status_code == 200
+
+    db.conn.execute("update \"group\" set status = 'expired' where id = 5")
+    time.sleep(0.01)
+    wifi_entitlement.revoke_group(5)
+
+    assert _load_qr(client).status_code == 403
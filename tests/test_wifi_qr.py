@@ -0,0 +1,210 @@
+# tests/test_wifi_qr.py - COMPACT PNG MODULES MATCH THE QR MATRIX, RENDER CACHE, QR ROUTE
+
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image, ImageColor, ImageDraw
+
+from app.routes.wifi import wifi_bp
+from app.utils import wifi_access, wifi_entitlement, wifi_qr
+
+DATA = 'WIFI:T:WPA;S:MyFi-Guest;P:correct-horse-battery;;'
+
+
+@pytest.fixture
+def logo(tmp_path, monkeypatch):
+    path = tmp_path / 'logo.png'
+    image = Image.new('RGBA', (120, 120), (0, 0, 0, 0))
+    ImageDraw.Draw(image).ellipse((0, 0, 119, 119), fill=(230, 30, 30, 255))
+    image.save(path)
+    monkeypatch.setattr(wifi_qr, 'LOGO_PATH', str(path))
+    monkeypatch.setattr(wifi_qr, '_logo', None)
+    return path
+
+
+def _module_errors(png, style):
+    """Modules (outside the logo disc) whose centre pixel has the wrong colour"""
+    image = Image.open(io.BytesIO(png)).convert('RGB')
+    matrix = wifi_qr._matrix(DATA, style['border'])
+    box = style['box_size']
+    pixels = len(matrix) * box
+    assert image.size == (pixels, pixels)
+
+    fill = ImageColor.getrgb(style['fill'])
+    centre = pixels / 2
+    logo_radius = int(pixels * 0.2) / 2 + box if style['logo'] else 0
+
+    errors = []
+    for y, row in enumerate(matrix):
+        for x, module in enumerate(row):
+            cx, cy = x * box + box // 2, y * box + box // 2
+            if (cx - centre) ** 2 + (cy - centre) ** 2 <= logo_radius ** 2:
+                continue
+            pixel = image.getpixel((cx, cy))
+            to_fill = sum((a - b) ** 2 for a, b in zip(pixel, fill))
+            to_white = sum((a - 255) ** 2 for a in pixel)
+            if (to_fill < to_white) != module:
+                errors.append((x, y))
+    return errors
+
+
+@pytest.mark.parametrize('with_logo', [False, True])
+def test_compact_png_matches_matrix(with_logo, logo):
+    style = {**wifi_qr.DEFAULT_STYLE, 'logo': with_logo}
+    png = wifi_qr._render_png_compact(DATA, style)
+
+    assert _module_errors(png, style) == []
+
+    # A real QR is roughly half light modules, not a solid square
+    image = Image.open(io.BytesIO(png)).convert('RGB')
+    white = image.convert('L').point(lambda v: 255 if v > 230 else 0).histogram()[255]  # Quantizing may shift white
+    assert 0.3 < white / (image.width * image.height) < 0.85
+
+
+def test_logo_is_drawn(logo):
+    style = {**wifi_qr.DEFAULT_STYLE, 'logo': True}
+    image = Image.open(io.BytesIO(wifi_qr._render_png_compact(DATA, style))).convert('RGB')
+
+    r, g, b = image.getpixel((image.width // 2, image.height // 2))
+    assert r > 200 and g < 80 and b < 80
+
+
+# ============ RENDER CACHE ============
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    """Fresh cache with the SVG renderer wrapped to count (and slow down) renders"""
+    monkeypatch.setenv('SSID_NAME', 'MyFi-Guest')
+    monkeypatch.setenv('SSID_PASSWORD', 'correct-horse-battery')
+    monkeypatch.setattr(wifi_qr, '_cache', {})
+    monkeypatch.setattr(wifi_qr, '_render_locks', {})
+    monkeypatch.setattr(wifi_qr, 'QR_CACHE_DIR', None)
+    monkeypatch.setattr(wifi_qr, 'LOGO_PATH', str(tmp_path / 'no_logo.png'))
+
+    calls = []
+    render_svg = wifi_qr._render_svg
+
+    def counting(data, style):
+        calls.append(data)
+        time.sleep(0.02)
+        return render_svg(data, style)
+
+    monkeypatch.setitem(wifi_qr.MODES, 'svg', {'path': counting})
+    return calls
+
+
+def test_same_credentials_render_once(renders):
+    first = wifi_qr.get_qr(fmt='svg')
+    second = wifi_qr.get_qr(fmt='svg')
+
+    assert second is first
+    assert len(renders) == 1
+    assert first['mimetype'] == 'image/svg+xml'
+    assert first['etag'].startswith(first['version'])
+
+
+def test_rotated_credentials_render_afresh_and_drop_stale_entries(renders, monkeypatch):
+    before = wifi_qr.get_qr(fmt='svg')
+    monkeypatch.setenv('SSID_PASSWORD', 'rotated-password')
+
+    after = wifi_qr.get_qr(fmt='svg')
+
+    assert len(renders) == 2
+    assert 'P:rotated-password;' in renders[-1]
+    assert after['version'] != before['version']
+    assert after['etag'] != before['etag']
+    assert [key[0] for key in wifi_qr._cache] == [after['version']]
+
+
+def test_concurrent_first_requests_render_once(renders):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(wifi_qr.get_qr(fmt='svg'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(renders) == 1
+    assert len({id(result) for result in results}) == 1
+
+
+def test_disk_cache_survives_a_cleared_memory_cache(renders, tmp_path, monkeypatch):
+    monkeypatch.setattr(wifi_qr, 'QR_CACHE_DIR', str(tmp_path / 'qr'))
+    first = wifi_qr.get_qr(fmt='svg')
+
+    wifi_qr.clear()
+    second = wifi_qr.get_qr(fmt='svg')
+
+    assert len(renders) == 1
+    assert second['data'] == first['data']
+    assert len(list((tmp_path / 'qr').glob('wifi_qr_*.svg'))) == 1
+
+
+def test_oldest_variant_is_evicted(renders, monkeypatch):
+    monkeypatch.setattr(wifi_qr, 'MAX_ENTRIES', 2)
+
+    for box_size in (4, 5, 6):
+        wifi_qr.get_qr({'box_size': box_size}, fmt='svg')
+
+    assert len(wifi_qr._cache) == 2
+    assert sorted(dict(key[3])['box_size'] for key in wifi_qr._cache) == [5, 6]
+    wifi_qr.get_qr({'box_size': 4}, fmt='svg')
+    assert len(renders) == 4
+
+
+# ============ ROUTE ============
+
+@pytest.fixture
+def db(postgrest, renders, monkeypatch):
+    monkeypatch.setattr(wifi_access, '_rpc_available', True)
+    monkeypatch.setattr(wifi_entitlement, '_revoked_users', {})
+    monkeypatch.setattr(wifi_entitlement, '_revoked_groups', {})
+    conn = postgrest.conn
+    conn.execute(
+        "insert into \"group\" (id, name, status, current_balance, target_amount, week_end) "
+        "values (5, 'G5', 'active', 300, 300, now() + interval '3 days')"
+    )
+    conn.execute("insert into member (id, group_id, user_id) values (10, 5, 1)")
+    conn.execute("insert into \"user\" (id, username, wallet_balance, member_id) values (1, 'u1', 500, 10)")
+    return postgrest
+
+
+def test_route_sets_etag_and_revalidation_headers(db, make_client):
+    client = make_client(wifi_bp, user_id=1)
+
+    response = client.get('/wifi/qr.svg')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.get_etag()[0] == wifi_qr.get_qr(fmt='svg')['etag']
+    assert response.data.startswith(b'<svg')
+
+
+def test_route_answers_matching_etag_with_304(db, make_client):
+    client = make_client(wifi_bp, user_id=1)
+    etag = client.get('/wifi/qr.svg').get_etag()[0]
+
+    response = client.get('/wifi/qr.svg', headers={'If-None-Match': f'"{etag}"'})
+
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_route_etag_changes_when_credentials_rotate(db, make_client, monkeypatch):
+    client = make_client(wifi_bp, user_id=1)
+    etag = client.get('/wifi/qr.svg').get_etag()[0]
+    monkeypatch.setenv('SSID_PASSWORD', 'rotated-password')
+
+    response = client.get('/wifi/qr.svg', headers={'If-None-Match': f'"{etag}"'})
+
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_route_unknown_format_and_anonymous_user(db, renders, make_client):
+    assert make_client(wifi_bp, user_id=1).get('/wifi/qr.gif').status_code == 404
+    assert make_client(wifi_bp).get('/wifi/qr.svg').status_code == 401
+    assert renders == []